@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# batch_upload.py
+
+# Batched uploading of new rows to the database. Rather than saving each
+# State, Qns and Trans object, and inserting each row of the prm_<name>
+# tables, with its own statement, the rows are collected and written
+# batch_size at a time: model objects with bulk_create (one multi-row
+# INSERT per table) and prm rows with executemany. Because bulk_create
+# doesn't set the ids of the objects it saves, States and Transs are
+# given their ids before they are added (see get_next_id), so that the
+# rows which refer to them can be created (and batched) straight away.
+# For the fastest loading of all, a BulkFileWriter takes the same rows
+# but writes them to a tab-separated file per table, with every id
+# assigned, and writes an SQL script which loads the files with MySQL's
+# LOAD DATA LOCAL INFILE (and expires the old transitions), all in one
+# transaction.
+
+import os
+import sys
+import datetime
+from pyHAWKS_config import SETTINGS_PATH
+# Django needs to know where to find the HITRAN project's settings.py:
+sys.path.append(SETTINGS_PATH)
+os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+from django.db import connection
+from django.db.models import Max
+
+# the default number of rows written at a time
+BATCH_SIZE = 1000
+# the default number of transitions uploaded in each transaction
+COMMIT_SIZE = 100000
+
+# the columns of the prm_<name> tables, in the order of the prm rows
+prm_columns = ('trans_id', 'val', 'err', 'ierr', 'source_id')
+
+# the name of the SQL script written by BulkFileWriter, the extension of
+# its tab-separated files and the name of the file of ids to expire
+BULK_SCRIPT_NAME = 'load.sql'
+BULK_EXT = '.tsv'
+BULK_EXPIRE_NAME = 'expire_id'
+
+def get_next_id(model):
+    """
+    Return the id at which new objects of the Django model (e.g. State)
+    can be added to the database: one more than the largest id in its
+    table, or 1 if the table is empty. NB this assumes that nothing else
+    is adding rows to the table while we are.
+
+    """
+
+    max_id = model.objects.aggregate(Max('id'))['id__max']
+    if max_id is None:
+        return 1
+    return max_id + 1
+
+def get_prm_insert(prm_name):
+    """ Return the INSERT statement for a row of the prm_<prm_name> table. """
+    return 'INSERT INTO prm_%s (%s) VALUES (%s)' % (prm_name.lower(),
+                ', '.join(prm_columns), ', '.join(['%s'] * len(prm_columns)))
+
+class BatchUploader(object):
+    """
+    An uploader of new rows to the database in batches: model objects
+    are added with add and prm rows (tuples of the values of prm_columns)
+    with add_prm; once batch_size rows are waiting, they are all written.
+    Tables are written in the order in which their first rows were added,
+    so a row must be added after any row it refers to (e.g. a State before
+    its Qns). Nothing is written if dry_run is True, but the rows are
+    counted all the same.
+
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        # the waiting rows, as a list of (table, rows) pairs, where table
+        # is a model class or a prm name
+        self.tables = []
+        self.rows = {}
+        self.nrows = 0
+        # the number of rows written (or, for a dry run, not written) to
+        # each table, keyed by table name
+        self.counts = {}
+
+    def _add(self, table, row):
+        if table not in self.rows:
+            self.tables.append(table)
+            self.rows[table] = []
+        self.rows[table].append(row)
+        self.nrows += 1
+        if self.nrows >= self.batch_size:
+            self.flush()
+
+    def add(self, obj):
+        """ Add the model object obj, whose id must be set if needed. """
+        self._add(obj.__class__, obj)
+
+    def add_prm(self, prm_name, row):
+        """ Add row, a tuple of the values of prm_columns, to prm_name. """
+        self._add(prm_name, row)
+
+    def flush(self):
+        """ Write all the waiting rows. """
+        if not self.nrows:
+            return
+        cursor = None
+        for table in self.tables:
+            rows = self.rows[table]
+            if not rows:
+                continue
+            if isinstance(table, basestring):
+                table_name = 'prm_%s' % table.lower()
+                if not self.dry_run:
+                    if cursor is None:
+                        cursor = connection.cursor()
+                    cursor.executemany(get_prm_insert(table), rows)
+            else:
+                table_name = table._meta.db_table
+                if not self.dry_run:
+                    table.objects.bulk_create(rows)
+            self.counts[table_name] = self.counts.get(table_name, 0)\
+                                        + len(rows)
+            self.rows[table] = []
+        self.nrows = 0
+
+    def close(self):
+        """ Write any waiting rows. """
+        self.flush()
+
+def to_bulk_field(value):
+    """
+    Return value as a field of a tab-separated file to be read by LOAD
+    DATA INFILE: None is written as \\N and any backslash, tab or newline
+    is escaped.
+
+    """
+
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t')\
+                .replace('\n', '\\n').replace('\r', '\\r')
+
+def get_load_statement(filename, table_name, columns):
+    """
+    Return the LOAD DATA LOCAL INFILE statement loading the columns of the
+    table table_name from the tab-separated file filename.
+
+    """
+
+    return 'LOAD DATA LOCAL INFILE \'%s\' INTO TABLE %s CHARACTER SET utf8'\
+           ' FIELDS TERMINATED BY \'\\t\' LINES TERMINATED BY \'\\n\' (%s);'\
+                % (filename.replace('\\', '\\\\').replace("'", "\\'"),
+                   table_name, ', '.join(columns))
+
+class BulkFileWriter(object):
+    """
+    A writer of the new rows to the database, and the ids of the old
+    transitions to expire, as files to be loaded in bulk: it takes rows
+    with add and add_prm, like BatchUploader, but writes each table's rows
+    to <bulk_dir>/<table name>.tsv, and, when closed, writes the SQL script
+    <bulk_dir>/load.sql, to be run with e.g.
+        mysql --local-infile=1 <database> < load.sql
+    Model objects without an id are given the next one (see get_next_id):
+    like the ids assigned by the caller, these are only right if nothing
+    else is added to the database before the script is run.
+
+    """
+
+    def __init__(self, bulk_dir):
+        self.bulk_dir = bulk_dir
+        if not os.path.isdir(bulk_dir):
+            os.makedirs(bulk_dir)
+        # the tables in the order of their first rows, the names of their
+        # columns and their open files, keyed by table name
+        self.table_names = []
+        self.columns = {}
+        self.files = {}
+        # the next id to assign to the objects of each model without one
+        self.next_ids = {}
+        # the number of rows written to each table, keyed by table name
+        self.counts = {}
+        self.expire_date = None
+
+    def get_filename(self, name):
+        """ Return the full path of the bulk file for the table name. """
+        return os.path.join(self.bulk_dir, '%s%s' % (name, BULK_EXT))
+
+    def _write(self, table_name, columns, values):
+        if table_name not in self.files:
+            self.table_names.append(table_name)
+            self.columns[table_name] = columns
+            self.files[table_name] = open(self.get_filename(table_name), 'w')
+            self.counts[table_name] = 0
+        print >>self.files[table_name], '\t'.join(to_bulk_field(value)
+                                                  for value in values)
+        self.counts[table_name] += 1
+
+    def add(self, obj):
+        """ Write the model object obj, giving it an id if it has none. """
+        model = obj.__class__
+        if obj.pk is None:
+            if model not in self.next_ids:
+                self.next_ids[model] = get_next_id(model)
+            obj.pk = self.next_ids[model]
+            self.next_ids[model] += 1
+        fields = model._meta.local_fields
+        self._write(model._meta.db_table,
+                    [field.column for field in fields],
+                    [field.get_db_prep_save(getattr(obj, field.attname),
+                                            connection=connection)
+                     for field in fields])
+
+    def add_prm(self, prm_name, row):
+        """ Write row, a tuple of the values of prm_columns, to prm_name. """
+        self._write('prm_%s' % prm_name.lower(), prm_columns, row)
+
+    def expire(self, ids, expire_date):
+        """
+        Write the ids of the transitions to be expired (their valid_to set
+        to the date expire_date) by the script; return how many there are.
+
+        """
+
+        self.expire_date = expire_date
+        fo = open(self.get_filename(BULK_EXPIRE_NAME), 'w')
+        nids = 0
+        for expire_id in ids:
+            print >>fo, expire_id
+            nids += 1
+        fo.close()
+        return nids
+
+    def flush(self):
+        """ Flush the files written so far. """
+        for fo in self.files.values():
+            fo.flush()
+
+    def close(self):
+        """ Close the files and write the SQL script to load them. """
+        for fo in self.files.values():
+            fo.close()
+        fo = open(os.path.join(self.bulk_dir, BULK_SCRIPT_NAME), 'w')
+        print >>fo, '-- load the files in %s' % self.bulk_dir
+        print >>fo, '-- (run with mysql --local-infile=1)'
+        print >>fo, 'START TRANSACTION;'
+        if self.expire_date is not None:
+            print >>fo, 'CREATE TEMPORARY TABLE %s (id INT PRIMARY KEY);'\
+                            % BULK_EXPIRE_NAME
+            print >>fo, get_load_statement(
+                            self.get_filename(BULK_EXPIRE_NAME),
+                            BULK_EXPIRE_NAME, ['id'])
+            print >>fo, 'UPDATE hitranlbl_trans JOIN %s USING (id) SET'\
+                        ' valid_to=\'%s\';' % (BULK_EXPIRE_NAME,
+                                                self.expire_date.isoformat())
+            print >>fo, 'DROP TEMPORARY TABLE %s;' % BULK_EXPIRE_NAME
+        for table_name in self.table_names:
+            print >>fo, get_load_statement(self.get_filename(table_name),
+                            table_name, self.columns[table_name])
+        print >>fo, 'COMMIT;'
+        fo.close()
@@ -23,6 +23,8 @@ import time
 from hitran_cases import *
 from hitran_transition import HITRANTransition
 from hitran_param import HITRANParam
+from hitran_compact import CompactHITRANTransition, CompactState
+from field_codec import read_trans
 import hitran_meta
 import xn_utils
 from fmt_xn import *
@@ -63,9 +65,12 @@ for line in open(states_file, 'r'):
         g = None
     s_qns = line[22:].strip()
     CaseClass = hitran_meta.get_case_class(molec_id, local_iso_id, s_qns[15])
-    states.append(CaseClass(molec_id=molec_id, local_iso_id=local_iso_id,
+    # the states and transitions are all held in memory, so keep them in
+    # their compact form
+    states.append(CompactState.from_state(CaseClass(molec_id=molec_id,
+                            local_iso_id=local_iso_id,
                             global_iso_id=global_iso_id, E=E, g=g,
-                            s_qns=s_qns))
+                            s_qns=s_qns)))
 print '%d states read in.' % (len(states))
 
 def get_state(stateID):
@@ -104,18 +109,15 @@ for line in open(trans_file, 'r'):
     for prm_name in trans_prms:
         setattr(this_trans, prm_name, HITRANParam(None))
         #eval('this_trans.%s=HITRANParam(None)' % prm_name)
-    fields = line.split(',')
-    for i, output_field in enumerate(trans_fields):
-        this_trans.set_param(output_field.name, fields[i], output_field.fmt)
+    read_trans(this_trans, line.split(','))
     #print this_trans.stateIDp, this_trans.stateIDpp
     this_trans.statep = get_state(this_trans.stateIDp)
     this_trans.statepp = get_state(this_trans.stateIDpp)
+    # NB the OH (A-X) system has its own case module, registered under
+    # the upper state's electronic state label
     this_trans.case_module = hitran_meta.get_case_module(this_trans.molec_id,
-                        this_trans.local_iso_id)
-
-    # OH (A-X) system is a special case:
-    if this_trans.statep.global_iso_id == 48 and s_qns[15]=='A':
-        this_trans.case_module = hcase_OHAX
+                        this_trans.local_iso_id,
+                        this_trans.statep.get('ElecStateLabel', 'X'))
 
     if not this_trans.validate_as_par():
         this_trans.old_par_line = this_trans.par_line
@@ -128,7 +130,7 @@ for line in open(trans_file, 'r'):
             print this_trans.par_line,'\nfailed to validate! I produced:'
             print this_trans.get_par_str()
             sys.exit(1)
-    trans.append(this_trans)
+    trans.append(CompactHITRANTransition.from_transition(this_trans))
 co.close()
 print '%d transitions read in.' % (len(trans))
 
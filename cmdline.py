@@ -11,6 +11,23 @@ from pyHAWKS_config import SETTINGS_PATH, DATA_DIR
 sys.path.append(SETTINGS_PATH)
 os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
 from hitranmeta.models import Molecule, Iso, RefsMap
+from trans_binary import BINARY_EXT
+from compressed_io import COMPRESSION_EXTS, get_compression,\
+                          split_compression
+from batch_upload import BATCH_SIZE, COMMIT_SIZE
+
+# the output files which can be compressed, by the name they are given in
+# the --compress option, and the attributes of args holding their names
+output_files = {'states': 'states_file', 'trans': 'trans_file',
+                'db_trans': 'db_trans_file', 'db_trans_id': 'db_trans_file_id',
+                'db_expire_id': 'db_expire_id',
+                'trans_upload': 'trans_file_upload'}
+# the output files which are written in binary with --binary
+binary_files = ('trans', 'trans_upload')
+# the output files which are read by a later step, keyed by the option
+# (the attribute of args) for the step which writes them
+input_files = {'parse_par': ('states', 'trans'),
+               'stage_upload': ('trans_upload', 'db_expire_id')}
 
 parser = argparse.ArgumentParser(description='Update the HITRAN MySQL'
             ' database with a patch from the provided .par file in'
@@ -33,25 +50,153 @@ parser.add_argument('-u', '--upload_dry_run', dest='dry_run',
         action='store_const', const=True, default=False,
         help='dry-run: create the data structures and SQL INSERT statements'\
              ' but don\'t  actually upload the data to the database')
+parser.add_argument('-r', '--resume', dest='resume',
+        action='store_const', const=True, default=False,
+        help='with --upload, resume an interrupted upload from its'
+             ' checkpoint, rather than starting again')
+parser.add_argument('-B', '--emit_bulk', dest='emit_bulk',
+        action='store_const', const=True, default=False,
+        help='rather than uploading the data, write the new rows as'
+             ' tab-separated files, with an SQL script to load them and'
+             ' expire the old transitions in one transaction, to'
+             ' <filestem>.bulk/ in the data directory')
 parser.add_argument('-O', '--overwrite', dest='overwrite',
         action='store_const', const=True, default=False,
         help='overwrite .states and .trans files, if present')
+parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+        help='parse the .par file, and stage the upload (one isotopologue'
+             ' per process), in this many processes (the output is the same'
+             ' as for one process)')
+parser.add_argument('-b', '--binary', dest='binary',
+        action='store_const', const=True, default=False,
+        help='write and read the .trans and .trans_upload files in binary'
+             ' (as <filename>.bin, see trans_binary.py) rather than as text')
+parser.add_argument('-z', '--compress', dest='compress', action='append',
+        default=[], metavar='<file>=<gz|bz2|xz>',
+        help='compress the output file <file> (one of %s, or all) with'
+             ' gzip, bzip2 or xz; may be given more than once'
+             % ', '.join(sorted(output_files)))
+parser.add_argument('-w', '--window', dest='window',
+        action='store_const', const=True, default=False,
+        help='stage against only the currently-valid transitions within the'
+             ' wavenumber range, and of the isotopologues, of the .trans'
+             ' file (for an update to part of a molecule\'s transitions):'
+             ' those outside are left valid, and counted')
+parser.add_argument('--batch_size', dest='batch_size', type=int,
+        default=BATCH_SIZE, metavar='<n>',
+        help='upload the new rows to the database <n> at a time (default:'
+             ' %d)' % BATCH_SIZE)
+parser.add_argument('--commit_size', dest='commit_size', type=int,
+        default=COMMIT_SIZE, metavar='<n>',
+        help='commit the upload in transactions of <n> transitions,'
+             ' checkpointing after each (default: %d)' % COMMIT_SIZE)
 parser.add_argument('-v', '--verbosity', dest='verbosity', type=int, default=3,
         help='set the level of output: 0-5 (0=errors only, 5=very verbose)')
 
+def set_output_compression(args):
+    """
+    Add the compression extensions requested with --compress to the names
+    of the output files in args.
+
+    """
+
+    for s_compress in args.compress:
+        try:
+            name, compression = s_compress.split('=')
+        except ValueError:
+            compression = None
+        if compression is not None:
+            compression = '.%s' % compression
+        if compression not in COMPRESSION_EXTS\
+                or (name != 'all' and name not in output_files):
+            print '--compress must be given as <file>=<gz|bz2|xz>, with'\
+                  ' <file> one of %s, or all; I got:'\
+                  % ', '.join(sorted(output_files))
+            print s_compress
+            sys.exit(1)
+        if name == 'all':
+            names = output_files.keys()
+            if args.binary:
+                # binary files are memory-mapped, so can't be compressed
+                names = [name for name in names if name not in binary_files]
+        else:
+            names = [name]
+        for name in names:
+            if args.binary and name in binary_files:
+                print 'the binary %s file can\'t be compressed' % name
+                sys.exit(1)
+            attr = output_files[name]
+            filename = split_compression(getattr(args, attr))[0]
+            setattr(args, attr, '%s%s' % (filename, compression))
+
+def find_compressed(filename):
+    """
+    Return filename if it exists; if not, but a compressed file
+    <filename><ext> does (with ext one of COMPRESSION_EXTS), return its
+    name instead; otherwise return filename.
+
+    """
+
+    if os.path.exists(filename):
+        return filename
+    for compression in COMPRESSION_EXTS:
+        if os.path.exists('%s%s' % (filename, compression)):
+            return '%s%s' % (filename, compression)
+    return filename
+
+def set_input_compression(args):
+    """
+    Look for the files to be read by this run, but written by an earlier
+    one (e.g. the .trans file, when staging without parsing), under their
+    compressed names if they don't exist as they are, so that they are
+    read whether or not the earlier run compressed them.
+
+    """
+
+    for step, names in input_files.items():
+        if getattr(args, step):
+            # the files are written by this run
+            continue
+        for name in names:
+            if args.binary and name in binary_files:
+                # binary files are never compressed
+                continue
+            attr = output_files[name]
+            filename = getattr(args, attr)
+            if get_compression(filename) is None:
+                setattr(args, attr, find_compressed(filename))
+
 def process_args(args):
     """ Process some of the command line arguments """
 
     xn_utils.verbosity = args.verbosity
-    # check the par_file name is well-formed and exists
-    filestem, ext = os.path.splitext(args.par_file)
+    if args.emit_bulk and (args.upload or args.dry_run):
+        print '--emit_bulk can\'t be used with --upload or --upload_dry_run'
+        sys.exit(1)
+    if args.resume and (not args.upload or args.dry_run):
+        print '--resume can only be used with --upload'
+        sys.exit(1)
+    for name in ('batch_size', 'commit_size'):
+        if getattr(args, name) < 1:
+            print '--%s must be at least 1; I got %d'\
+                    % (name, getattr(args, name))
+            sys.exit(1)
+    # check the par_file name is well-formed and exists: it may be
+    # compressed, as <filestem>.par.gz, etc.
+    par_file, compression = split_compression(args.par_file)
+    filestem, ext = os.path.splitext(par_file)
     if ext not in ('', '.par'):
-        print 'par_file must end in .par or be given without extension; I got:'
+        print 'par_file must end in .par (optionally followed by one of %s)'\
+              ' or be given without extension; I got:'\
+              % ', '.join(COMPRESSION_EXTS)
         print args.par_file
         sys.exit(1)
-    args.par_file = '%s.par' % filestem
+    args.par_file = '%s.par%s' % (filestem, compression)
+    if not compression:
+        # look for a compressed .par file
+        args.par_file = find_compressed(args.par_file)
     if not os.path.exists(args.par_file):
-        print 'par_file not found:', par_file
+        print 'par_file not found:', args.par_file
         sys.exit(1)
     args.filestem = os.path.basename(filestem)
 
@@ -78,8 +223,17 @@ def process_args(args):
                                     % (args.filestem, args.s_mod_date))
     args.trans_file_upload = os.path.join(DATA_DIR, '%s.%s.trans_upload'
                                     % (args.filestem, args.s_mod_date))
-    args.diff_file = os.path.join(DATA_DIR, '%s.%s.diff'
+    # the checkpoint of an upload, from which it can be resumed
+    args.upload_checkpoint_file = os.path.join(DATA_DIR,
+                '%s.%s.upload_checkpoint' % (args.filestem, args.s_mod_date))
+    # the directory of files written by --emit_bulk
+    args.bulk_dir = os.path.join(DATA_DIR, '%s.%s.bulk'
                                     % (args.filestem, args.s_mod_date))
+    if args.binary:
+        args.trans_file += BINARY_EXT
+        args.trans_file_upload += BINARY_EXT
+    set_output_compression(args)
+    set_input_compression(args)
 
     # get the Molecule and Iso objects from the molecID, taken from
     # the par_file filename
@@ -90,6 +244,13 @@ def process_args(args):
         print 'the filename should start with "<molecID>_"'
         sys.exit(1)
     molecule = Molecule.objects.filter(pk=molecID).get()
+    # the index of this molecule's states, kept between runs as
+    # $DATA_DIR/<molecID>.state_index.digests.npy, .ids.npy and .json
+    args.state_index_file = os.path.join(DATA_DIR, '%d.state_index' % molecID)
+    # the snapshot of this molecule's currently valid transitions, kept
+    # between runs as $DATA_DIR/<molecID>.db_trans_snapshot, .id and .json
+    args.db_snapshot_file = os.path.join(DATA_DIR, '%d.db_trans_snapshot'
+                                                        % molecID)
     molec_name = molecule.ordinary_formula
     isos = Iso.objects.filter(molecule=molecule).order_by('isoID')
 
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# compressed_io.py
+
+# Transparent reading and writing of compressed files: a file whose name
+# ends in .gz, .bz2 or .xz is decompressed as it is read, or compressed as
+# it is written, in a stream, so that the .par file and the intermediate
+# files need never be held uncompressed on disk. The xz format needs the
+# lzma module (in Python 2, from the backports.lzma package); the others
+# are handled by the standard library.
+
+import os
+import gzip
+import bz2
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# the file extensions of the supported compression formats
+COMPRESSION_EXTS = ('.gz', '.bz2', '.xz')
+
+# the compression level used for gzip files: that of the gzip command
+# line tool, which compresses much faster than the gzip module's default
+# of 9 for little loss
+GZIP_LEVEL = 6
+
+def get_compression(filename):
+    """
+    Return the compression extension of filename (e.g. '.gz'), or None if
+    it is not the name of a compressed file.
+
+    """
+
+    ext = os.path.splitext(filename)[1]
+    if ext in COMPRESSION_EXTS:
+        return ext
+    return None
+
+def split_compression(filename):
+    """
+    Split filename into its name without any compression extension and
+    the compression extension ('' if there isn't one), e.g.
+    '12_hit12.par.gz' -> ('12_hit12.par', '.gz').
+
+    """
+
+    compression = get_compression(filename)
+    if compression is None:
+        return filename, ''
+    return filename[:-len(compression)], compression
+
+def open_file(filename, mode='r'):
+    """
+    Open the file filename with mode ('r' or 'w', 'a' for uncompressed
+    files), decompressing or compressing it in a stream if its name ends
+    in a compression extension, and return the file object.
+
+    """
+
+    compression = get_compression(filename)
+    if compression is None:
+        return open(filename, mode)
+    mode = '%sb' % mode.replace('b', '')
+    if compression == '.gz':
+        return gzip.open(filename, mode, GZIP_LEVEL)
+    if compression == '.bz2':
+        return bz2.BZ2File(filename, mode)
+    if lzma is None:
+        raise IOError('the lzma module (backports.lzma, for Python 2) is'
+                      ' needed to read and write .xz files: %s' % filename)
+    return lzma.LZMAFile(filename, mode)
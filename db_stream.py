@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# db_stream.py
+
+# Streaming iteration over large tables of the database, such as
+# hitranlbl_trans, without holding all of their rows in memory at once.
+# Django caches every object of a queryset iterated over, and a separate
+# .count() to report progress costs another scan of the table, so instead:
+#   iter_queryset walks a Trans queryset by keyset pagination on (nu, id),
+#     fetching chunk_size objects at a time with a query for those after
+#     the last one of the previous chunk; other queries (e.g. UPDATEs) can
+#     be made between chunks;
+#   iter_rows streams the rows of a raw SQL query from a server-side cursor
+#     (on MySQL), chunk_size rows at a time.
+# Both call progress(n), if given, with the number of objects or rows
+# generated so far after each chunk is fetched.
+
+import os
+import sys
+from pyHAWKS_config import SETTINGS_PATH
+# Django needs to know where to find the HITRAN project's settings.py:
+sys.path.append(SETTINGS_PATH)
+os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+from django.db import connection
+from django.db.models import Q
+
+# the default number of objects or rows fetched at a time
+CHUNK_SIZE = 10000
+
+def iter_queryset(queryset, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Generate the objects of queryset, which must have nu and id fields
+    (e.g. a Trans queryset), in order of (nu, id), fetching chunk_size of
+    them at a time. Any ordering of queryset is replaced.
+
+    """
+
+    n = 0
+    last = None
+    while True:
+        chunk_queryset = queryset
+        if last is not None:
+            last_nu, last_id = last
+            chunk_queryset = queryset.filter(Q(nu__gt=last_nu)
+                                             | Q(nu=last_nu, id__gt=last_id))
+        chunk = list(chunk_queryset.order_by('nu', 'id')[:chunk_size])
+        if not chunk:
+            break
+        n += len(chunk)
+        if progress is not None:
+            progress(n)
+        for obj in chunk:
+            yield obj
+        if len(chunk) < chunk_size:
+            break
+        last = chunk[-1].nu, chunk[-1].id
+
+def get_streaming_cursor():
+    """
+    Return a cursor which streams the rows of a query from the database
+    server as they are fetched, rather than holding them all in memory: a
+    server-side cursor if the database is MySQL, and an ordinary cursor
+    otherwise. NB no other query can be made on the connection until the
+    rows of a MySQL server-side cursor have all been fetched.
+
+    """
+
+    cursor = connection.cursor()
+    if connection.vendor != 'mysql':
+        return cursor
+    from MySQLdb.cursors import SSCursor
+    return connection.connection.cursor(SSCursor)
+
+def iter_rows(query, params=None, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Generate the rows of the SQL query, with parameters params, as tuples,
+    fetching chunk_size of them at a time from a streaming cursor (see
+    get_streaming_cursor).
+
+    """
+
+    cursor = get_streaming_cursor()
+    try:
+        cursor.execute(query, params)
+        n = 0
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            n += len(rows)
+            if progress is not None:
+                progress(n)
+            for row in rows:
+                yield row
+    finally:
+        cursor.close()
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# field_codec.py
+
+# Readers and writers for the comma-separated fields of the .trans and
+# .states files, compiled from the lists of OutputFields in fmt_xn.
+# Each OutputField names an attribute (e.g. 'Elower') or an attribute of an
+# attribute (e.g. 'nu.val') of the object being written or read, or a
+# method to call (e.g. 'serialize_qns()'); rather than resolving these
+# names with exec and eval for every field of every line, the attribute
+# paths, formats and converters are fixed in the source of a reader and a
+# writer function for each list of fields, which is compiled once, when
+# this module is imported. The same goes for the functions converting
+# between objects, lines of text and the fixed-width binary records of the
+# binary .trans files (see trans_binary.py). trans_fingerprint gives the
+# content fingerprint of a transition, by which stage_upload compares the
+# .trans file with the transitions in the database.
+
+import re
+import hashlib
+from fmt_xn import trans_fields, state_fields
+
+def get_converter(fmt):
+    """
+    Return the function which converts a field formatted as fmt back into
+    a value: int for integer formats, float for floating-point formats, and
+    None for strings, which are taken as they are.
+
+    """
+
+    if fmt[-1] in 'di':
+        return int
+    if fmt[-1] in 'eEfFgG':
+        return float
+    return None
+
+def make_field_codec(fields):
+    """
+    Generate a reader and a writer for lines of the comma-separated fields
+    described by the list of OutputFields, fields. Returns the tuple
+    (read, write):
+
+    read(obj, s_vals) sets the attributes of obj from the list of strings
+    s_vals (a line split on its commas), converting each according to the
+    format of its field, as HITRANTransition.set_param would: a numerical
+    field which can't be converted (e.g. because it is blank) sets its
+    attribute to None. Parameter objects (e.g. obj.nu for 'nu.val') must
+    already exist. Fields naming methods are skipped.
+
+    write(obj, sep=',') returns the line of fields for obj, separated by
+    sep: each field is formatted with its fmt, unless its value is None or
+    the attribute doesn't exist, in which case its default is used.
+
+    """
+
+    read_lines = ['def read(obj, s_vals):']
+    write_lines = ['def write(obj, sep=%r):' % ',']
+    defaults, fmts = [], []
+    for i, field in enumerate(fields):
+        defaults.append(field.default)
+        fmts.append(field.fmt)
+        path = 'obj.%s' % field.name
+
+        write_lines.extend(['    try:',
+                            '        x = %s' % path,
+                            '    except AttributeError:',
+                            '        x = None',
+                            '    s%d = defaults[%d] if x is None'
+                            ' else fmts[%d] %% x' % (i, i, i)])
+
+        if field.name.endswith(')'):
+            # a method: there is nothing to set
+            continue
+        converter = get_converter(field.fmt)
+        if converter is None:
+            read_lines.append('    %s = s_vals[%d]' % (path, i))
+        else:
+            read_lines.extend(['    try:',
+                               '        %s = %s(s_vals[%d])'
+                                        % (path, converter.__name__, i),
+                               '    except ValueError:',
+                               '        %s = None' % path])
+    read_lines.append('    return obj')
+    write_lines.append('    return sep.join((%s))'
+                % ''.join(['s%d, ' % i for i in range(len(fields))]))
+
+    namespace = {'defaults': tuple(defaults), 'fmts': tuple(fmts)}
+    exec '\n'.join(read_lines + write_lines) in namespace
+    return namespace['read'], namespace['write']
+
+def trans_fingerprint(line):
+    """
+    Return the content fingerprint of a transition, the first 16 hex digits
+    of the MD5 digest of line, its line of the .trans file (without the
+    EOL): since every field is written at the precision of its format, two
+    transitions with the same fingerprint have the same parameters, to
+    that precision, whatever the floating-point noise in their values.
+
+    """
+
+    return hashlib.md5(line).hexdigest()[:16]
+
+def get_column_type(fmt):
+    """
+    Return the NumPy type code of the column holding a field formatted as
+    fmt in a binary record, and the value in it which stands for None:
+    integers are held as 32-bit integers, with room for any ID (including
+    source_ids) or statistical weight in the database, unless the field's
+    width calls for 64 bits (the width of an integer format is only its
+    minimum width, so it doesn't limit the values to fit in a smaller
+    type); their minimum value stands for None. Floats are held as doubles
+    (with NaN standing for None) and strings as fixed-width strings,
+    formatted as they are in the text file (so None never occurs).
+
+    """
+
+    width = re.match('%-?(\d*)', fmt).group(1)
+    converter = get_converter(fmt)
+    if converter is int:
+        if width and 10**int(width) <= 2**31:
+            return '<i4', -2**31
+        return '<i8', -2**63
+    if converter is float:
+        return '<f8', float('nan')
+    if not width:
+        raise ValueError('no fixed width for string format %s' % fmt)
+    return 'S%s' % width, None
+
+def make_record_codec(fields):
+    """
+    Generate the functions for converting between objects, lines of text
+    and binary records of the comma-separated fields described by the list
+    of OutputFields, fields; a binary record is handled as a tuple of the
+    values of its columns, one for each field (see get_column_type).
+    Returns the tuple (dtype, to_record, from_record, text_to_record,
+    record_to_text):
+
+    dtype is the list of (column name, type code) pairs of the record, for
+    making a NumPy structured dtype; the column for field 'nu.val' is named
+    'nu_val';
+
+    to_record(obj) returns the record of the fields of obj, as write would
+    see them (see make_field_codec), with floats rounded to the precision
+    of their formats, so that the record is exactly the one text_to_record
+    would return for the line written;
+
+    from_record(obj, rec) sets the attributes of obj from the record rec,
+    as read would from the corresponding line of text;
+
+    text_to_record(s_vals) returns the record for the list of strings
+    s_vals (a line of text split on its commas);
+
+    record_to_text(rec, sep=',') returns the line of text for the record
+    rec, exactly as write would for the object it came from.
+
+    """
+
+    to_lines = ['def to_record(obj):']
+    from_lines = ['def from_record(obj, rec):']
+    from_text_lines = ['def text_to_record(s_vals):']
+    to_text_lines = ['def record_to_text(rec, sep=%r):' % ',']
+    dtype, defaults, fmts = [], [], []
+    for i, field in enumerate(fields):
+        if field.name.endswith(')'):
+            raise ValueError('a method field (%s) can\'t be held in a binary'
+                             ' record' % field.name)
+        type_code, null = get_column_type(field.fmt)
+        dtype.append((field.name.replace('.', '_'), type_code))
+        defaults.append(field.default)
+        fmts.append(field.fmt)
+        path = 'obj.%s' % field.name
+
+        to_lines.extend(['    try:',
+                         '        x = %s' % path,
+                         '    except AttributeError:',
+                         '        x = None'])
+        if null is None:
+            # a string, held as its formatted field
+            to_lines.append('    v%d = defaults[%d] if x is None'
+                            ' else fmts[%d] %% x' % (i, i, i))
+            from_lines.append('    %s = rec[%d]' % (path, i))
+            from_text_lines.append('    v%d = s_vals[%d]' % (i, i))
+            to_text_lines.append('    s%d = rec[%d]' % (i, i))
+            continue
+
+        if null != null:
+            is_null = 'x != x'
+        else:
+            is_null = 'x == %d' % null
+        converter = get_converter(field.fmt)
+        if converter is float:
+            # rounded to the precision of the text field, so that the
+            # record holds the same value as one read from the text
+            to_lines.append('    v%d = nan if x is None else float(fmts[%d]'
+                            ' %% x)' % (i, i))
+        else:
+            to_lines.append('    v%d = %r if x is None else x' % (i, null))
+        from_lines.extend(['    x = rec[%d]' % i,
+                           '    %s = None if %s else x' % (path, is_null)])
+        from_text_lines.extend(['    try:',
+                                '        v%d = %s(s_vals[%d])'
+                                    % (i, converter.__name__, i),
+                                '    except ValueError:',
+                                '        v%d = %r' % (i, null)])
+        to_text_lines.extend(['    x = rec[%d]' % i,
+                              '    s%d = defaults[%d] if %s else fmts[%d] %% x'
+                                    % (i, i, is_null, i)])
+    values = ''.join(['v%d, ' % i for i in range(len(fields))])
+    to_lines.append('    return (%s)' % values)
+    from_lines.append('    return obj')
+    from_text_lines.append('    return (%s)' % values)
+    to_text_lines.append('    return sep.join((%s))'
+                % ''.join(['s%d, ' % i for i in range(len(fields))]))
+
+    # NB repr(float('nan')) is 'nan', the name under which it is provided
+    namespace = {'defaults': tuple(defaults), 'fmts': tuple(fmts),
+                 'nan': float('nan')}
+    exec '\n'.join(to_lines + from_lines + from_text_lines
+                   + to_text_lines) in namespace
+    return (dtype, namespace['to_record'], namespace['from_record'],
+            namespace['text_to_record'], namespace['record_to_text'])
+
+# read_trans and write_trans read and write a whole line of the .trans
+# file; write_trans_prms writes the fields after the two state IDs
+read_trans, write_trans = make_field_codec(trans_fields)
+read_trans_prms, write_trans_prms = make_field_codec(trans_fields[2:])
+read_state, write_state = make_field_codec(state_fields)
+
+# the binary records of the .trans file, and of the fields after the two
+# state IDs
+trans_dtype, to_trans_record, from_trans_record, text_to_trans_record,\
+        trans_record_to_text = make_record_codec(trans_fields)
+trans_prms_dtype, to_trans_prms_record = \
+        make_record_codec(trans_fields[2:])[:2]
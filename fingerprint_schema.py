@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# fingerprint_schema.py
+
+# Staging and uploading compare transitions by the fingerprint of their
+# .trans lines (see field_codec.trans_fingerprint), which is stored in the
+# fingerprint column of hitranlbl_trans. That column, and the field of the
+# hitranlbl.models.Trans model which maps it, are additions to the HITRAN
+# project's schema: run this module as a script to add the column (and an
+# index on it) to the database, if it isn't there already. The model needs
+# the field
+#     fingerprint = models.CharField(max_length=16, null=True,
+#                                    db_index=True)
+# added to the Trans class in hitranlbl/models.py by hand. Transitions
+# uploaded before the column was added have NULL fingerprints, and are
+# compared by their values instead (see stage_upload.fetch_db_trans).
+
+import os
+import sys
+from pyHAWKS_config import SETTINGS_PATH
+# Django needs to know where to find the HITRAN project's settings.py:
+sys.path.append(SETTINGS_PATH)
+os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+from django.db import connection
+from hitranlbl.models import Trans
+
+# the statements adding the fingerprint column and its index
+add_fingerprint_sql = (
+    'ALTER TABLE hitranlbl_trans ADD COLUMN fingerprint CHAR(16) NULL',
+    'CREATE INDEX hitranlbl_trans_fingerprint'
+    ' ON hitranlbl_trans (fingerprint)')
+
+def has_fingerprint_column():
+    """ Return True if hitranlbl_trans has the fingerprint column. """
+    cursor = connection.cursor()
+    columns = [column[0] for column in connection.introspection\
+                        .get_table_description(cursor, 'hitranlbl_trans')]
+    return 'fingerprint' in columns
+
+def has_fingerprint_field():
+    """ Return True if the Trans model has the fingerprint field. """
+    return 'fingerprint' in [field.name for field in Trans._meta.fields]
+
+def check_fingerprint():
+    """
+    Check that the database and the Trans model have transition
+    fingerprints, which staging and uploading need: exit with a message
+    saying how to add them if not.
+
+    """
+
+    if not has_fingerprint_column():
+        print 'the hitranlbl_trans table has no fingerprint column: add it'\
+              ' by running fingerprint_schema.py'
+        sys.exit(1)
+    if not has_fingerprint_field():
+        print 'the Trans model in hitranlbl/models.py has no fingerprint'\
+              ' field: see fingerprint_schema.py for the field to add'
+        sys.exit(1)
+
+if __name__ == '__main__':
+    if has_fingerprint_column():
+        print 'hitranlbl_trans already has the fingerprint column'
+    else:
+        cursor = connection.cursor()
+        for command in add_fingerprint_sql:
+            print command
+            cursor.execute(command)
+        print 'fingerprint column added to hitranlbl_trans'
+    if not has_fingerprint_field():
+        print 'NB the Trans model in hitranlbl/models.py still needs the'\
+              ' field:'
+        print '    fingerprint = models.CharField(max_length=16, null=True,'
+        print '                                   db_index=True)'
@@ -11,6 +11,22 @@
 
 from hcase_globals import *
 
+# the fixed-width layouts of the quantum number fields, as
+# (qn_name, start, end, fmt) tuples - see make_qn_codec
+V_layout_head = [('v1', 3, 5, '%2d'), ('v2', 5, 7, '%2d'), ('v3', 7, 9, '%2d')]
+V_layout_tail = [('v5', 11, 13, '%2d'), ('v6', 13, 15, '%2d')]
+# the vibrational quanta for H2CO and COF2, v1-v6
+decode_V, encode_V = make_qn_codec(V_layout_head + [('v4', 9, 11, '%2d')]
+                                   + V_layout_tail, name='asymcs.V')
+# H2O2 has the torsional quantum labels n and tau instead of v4
+decode_V_H2O2, encode_V_H2O2 = make_qn_codec(V_layout_head
+                    + [('n', 9, 10, '%1d'), ('tau', 10, 11, '%1d')]
+                    + V_layout_tail, name='asymcs.V_H2O2')
+decode_Q, encode_Q = make_qn_codec([('J', 0, 3, '%3d'),
+                                    ('Ka', 3, 6, '%3d'),
+                                    ('Kc', 6, 9, '%3d'),
+                                    ('F', 9, 14, '%5.1f')], name='asymcs.Q')
+
 def parse_qns(trans):
     """
     Parse the quantum numbers for the upper and lower states of HITRAN
@@ -27,41 +43,21 @@ def parse_qns(trans):
     qnsp = {'ElecStateLabel': 'X'}
     qnspp = {'ElecStateLabel': 'X'}
 
-    if trans.molec_id in (20, 25, 29):  # H2CO, H2O2, COF2
-        save_qn(qnsp, 'v1', trans.Vp[3:5])
-        save_qn(qnsp, 'v2', trans.Vp[5:7])
-        save_qn(qnsp, 'v3', trans.Vp[7:9])
-        save_qn(qnspp, 'v1', trans.Vpp[3:5])
-        save_qn(qnspp, 'v2', trans.Vpp[5:7])
-        save_qn(qnspp, 'v3', trans.Vpp[7:9])
-        if trans.molec_id == 25:    # H2O2
-            # torsional quantum labels instead of v4
-            save_qn(qnsp, 'n', trans.Vp[9])
-            save_qn(qnsp, 'tau', trans.Vp[10])
-            save_qn(qnspp, 'n', trans.Vpp[9])
-            save_qn(qnspp, 'tau', trans.Vpp[10])
-        else:
-            save_qn(qnsp, 'v4', trans.Vp[9:11])
-            save_qn(qnspp, 'v4', trans.Vpp[9:11])
-        save_qn(qnsp, 'v5', trans.Vp[11:13])
-        save_qn(qnsp, 'v6', trans.Vp[13:15])
-        save_qn(qnspp, 'v5', trans.Vpp[11:13])
-        save_qn(qnspp, 'v6', trans.Vpp[13:15])
+    if trans.molec_id == 25:    # H2O2
+        # torsional quantum labels instead of v4
+        decode_V_H2O2(trans.Vp, qnsp)
+        decode_V_H2O2(trans.Vpp, qnspp)
+    elif trans.molec_id in (20, 29):  # H2CO, COF2
+        decode_V(trans.Vp, qnsp)
+        decode_V(trans.Vpp, qnspp)
     else:
         for (mode, val) in get_normal_modes_V(trans.Vp):
              qnsp[mode] = val
         for (mode, val) in get_normal_modes_V(trans.Vpp):
              qnspp[mode] = val
-    
-    save_qn(qnsp, 'J', trans.Qp[:3])
-    save_qn(qnsp, 'Ka', trans.Qp[3:6])
-    save_qn(qnsp, 'Kc', trans.Qp[6:9])
-    save_qn(qnsp, 'F', trans.Qp[9:14])
 
-    save_qn(qnspp, 'J', trans.Qpp[:3])
-    save_qn(qnspp, 'Ka', trans.Qpp[3:6])
-    save_qn(qnspp, 'Kc', trans.Qpp[6:9])
-    save_qn(qnspp, 'F', trans.Qpp[9:14])
+    decode_Q(trans.Qp, qnsp)
+    decode_Q(trans.Qpp, qnspp)
 
     return qnsp, qnspp, 'E1'
 
@@ -75,48 +71,18 @@ def get_hitran_quanta(trans):
     ElecStateLabelp = qn_to_str(trans.statep, 'ElecStateLabel', '%1s', ' ')
     ElecStateLabelpp = qn_to_str(trans.statepp, 'ElecStateLabel', '%1s', ' ')
 
-    if trans.molec_id in (20, 25, 29):  # H2CO, H2O2, COF2
-        s_v1p = qn_to_str(trans.statep, 'v1', '%2d', '  ')
-        s_v2p = qn_to_str(trans.statep, 'v2', '%2d', '  ')
-        s_v3p = qn_to_str(trans.statep, 'v3', '%2d', '  ')
-        s_v1pp = qn_to_str(trans.statepp, 'v1', '%2d', '  ')
-        s_v2pp = qn_to_str(trans.statepp, 'v2', '%2d', '  ')
-        s_v3pp = qn_to_str(trans.statepp, 'v3', '%2d', '  ')
-        s_v5p = qn_to_str(trans.statep, 'v5', '%2d', '  ')
-        s_v6p = qn_to_str(trans.statep, 'v6', '%2d', '  ')
-        s_v5pp = qn_to_str(trans.statepp, 'v5', '%2d', '  ')
-        s_v6pp = qn_to_str(trans.statepp, 'v6', '%2d', '  ')
-        if trans.molec_id == 25:   # H2O2
-            s_np = qn_to_str(trans.statep, 'n', '%1d', ' ')
-            s_taup = qn_to_str(trans.statep, 'tau', '%1d', ' ')
-            s_npp = qn_to_str(trans.statepp, 'n', '%1d', ' ')
-            s_taupp = qn_to_str(trans.statepp, 'tau', '%1d', ' ')
-            Vp = '   %s%s%s%s%s%s%s' % (s_v1p, s_v2p, s_v3p, s_np, s_taup,
-                                        s_v5p, s_v6p)
-            Vpp = '   %s%s%s%s%s%s%s' % (s_v1pp, s_v2pp, s_v3pp, s_npp,
-                                         s_taupp, s_v5pp, s_v6pp)
-        else:
-            s_v4p = qn_to_str(trans.statep, 'v4', '%2d', '  ')
-            s_v4pp = qn_to_str(trans.statepp, 'v4', '%2d', '  ')
-            Vp = '   %s%s%s%s%s%s' % (s_v1p, s_v2p, s_v3p, s_v4p, s_v5p, s_v6p)
-            Vpp = '   %s%s%s%s%s%s' % (s_v1pp, s_v2pp, s_v3pp, s_v4pp,
-                                       s_v5pp, s_v6pp)
+    if trans.molec_id == 25:    # H2O2
+        Vp = encode_V_H2O2(trans.statep)
+        Vpp = encode_V_H2O2(trans.statepp)
+    elif trans.molec_id in (20, 29):  # H2CO, COF2
+        Vp = encode_V(trans.statep)
+        Vpp = encode_V(trans.statepp)
     else:
         Vp = set_normal_modes_V(trans.statep)
         Vpp = set_normal_modes_V(trans.statepp)
 
-    s_Jp = qn_to_str(trans.statep, 'J', '%3d', '   ')
-    s_Kap = qn_to_str(trans.statep, 'Ka', '%3d', '   ')
-    s_Kcp = qn_to_str(trans.statep, 'Kc', '%3d', '   ')
-    s_Fp = qn_to_str(trans.statep, 'F', '%5.1f', ' '*5)
-
-    s_Jpp = qn_to_str(trans.statepp, 'J', '%3d', '   ')
-    s_Kapp = qn_to_str(trans.statepp, 'Ka', '%3d', '   ')
-    s_Kcpp = qn_to_str(trans.statepp, 'Kc', '%3d', '   ')
-    s_Fpp = qn_to_str(trans.statepp, 'F', '%5.1f', ' '*5)
-
-    Qp = '%s%s%s%s ' % (s_Jp, s_Kap, s_Kcp, s_Fp)
-    Qpp = '%s%s%s%s ' % (s_Jpp, s_Kapp, s_Kcpp, s_Fpp)
+    Qp = encode_Q(trans.statep)
+    Qpp = encode_Q(trans.statepp)
 
     return Vp,Vpp,Qp,Qpp
 
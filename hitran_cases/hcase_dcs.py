@@ -11,6 +11,20 @@
 
 from hcase_globals import *
 
+# the fixed-width layouts of the quantum number fields, as
+# (qn_name, start, end, fmt) tuples - see make_qn_codec
+# the global quanta fields hold only the vibrational quantum number, which
+# is written right-justified at the end of the field but may be read from
+# anywhere in it
+decode_V = make_qn_codec([('v', 0, 15, '%15d')], name='dcs.V')[0]
+encode_V = make_qn_codec([('v', 13, 15, '%2d')])[1]
+# the only thing that could be in the Qp field is F'
+decode_Qp, encode_Qp = make_qn_codec([('F', 10, 15, '%5.1f')], name='dcs.Qp')
+# J" and F" in the Qpp field (the branch and symmetry fields are dealt with
+# separately)
+decode_Qpp = make_qn_codec([('J', 6, 9, '%3d'), ('F', 10, 15, '%5.1f')],
+                           name='dcs.Qpp')[0]
+
 def parse_qns(trans):
     """
     Parse the quantum numbers for the upper and lower states of HITRAN
@@ -30,22 +44,20 @@ def parse_qns(trans):
 
     # vibrational quantum numbers are the only thing in the global
     # quanta field and they are always (non-negative) integers
-    save_qn(qnsp, 'v', trans.Vp)
-    save_qn(qnspp, 'v', trans.Vpp)
+    decode_V(trans.Vp, qnsp)
+    decode_V(trans.Vpp, qnspp)
 
     # rotational quantum numbers are also (non-negative) integers for
-    # closed-shell diatomic species:
+    # closed-shell diatomic species; also look for hyperfine quantum
+    # numbers, Fp and Fpp, which may be integer or half-integer:
+    decode_Qpp(trans.Qpp, qnspp)
+    decode_Qp(trans.Qp, qnsp)
     br = trans.Qpp[5]   # branch designation: 'P' or 'R'
-    Jpp = save_qn(qnspp, 'J', trans.Qpp[6:9])
+    Jpp = qnspp.get('J')
     if Jpp is not None and br:
         Jp = Jpp + branch[br]
         qnsp['J'] = Jp
 
-    # look for hyperfine quantum numbers, Fp and Fpp, which may be integer
-    # or half-integer:
-    save_qn(qnspp, 'F', trans.Qpp[10:])
-    save_qn(qnsp, 'F', trans.Qp[10:])
-
     multipole = 'E1'
     # for N2, sympp holds the multipole designation for the transition
     sympp = trans.Qpp[9]
@@ -71,11 +83,11 @@ def get_hitran_quanta(trans):
 
     # 'global' quanta fields hold upper and lower state vibrational
     # quantum numbers:
-    Vpp = qn_to_str(trans.statepp, 'v', '             %2d', ' '*15) 
-    Vp = qn_to_str(trans.statep, 'v', '             %2d', ' '*15)
+    Vpp = encode_V(trans.statepp)
+    Vp = encode_V(trans.statep)
 
     # the only thing that could be in the Qp field is F'
-    Qp = qn_to_str(trans.statep, 'F', '          %5.1f', ' '*15) 
+    Qp = encode_Qp(trans.statep)
     s_Fpp = qn_to_str(trans.statepp, 'F', '%5.1f', ' '*5)
 
     Jpp = trans.statepp_get('J')
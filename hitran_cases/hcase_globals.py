@@ -103,40 +103,218 @@ def qn_to_str_ljust(qns, qn_name, field_size, s_default):
         return s_default
     return qn_val.ljust(field_size)
 
-def set_normal_modes_V(state):
-    s_v = {}
+# the default maximum number of entries in each QuantaCache
+QUANTA_CACHE_SIZE = 10000
+
+# all the QuantaCaches created, in order, so their statistics can be reported
+quanta_caches = []
+
+class QuantaCache(object):
+    """
+    A bounded memo cache of the quantum numbers parsed from (or the strings
+    written for) the quanta fields of the .par format. In a typical .par
+    file, a field such as Vp takes only a few hundred distinct values over
+    millions of lines, so each is parsed once and the (immutable) result
+    stored, keyed by the raw string, in a cache belonging to the case and
+    field (identified by name). When the cache holds maxsize entries, an
+    arbitrary one is evicted to make room for each new one. The numbers of
+    hits and misses are counted, so the saving can be reported.
+
+    """
+
+    def __init__(self, name, maxsize=QUANTA_CACHE_SIZE):
+        self.name = name
+        self.maxsize = maxsize
+        self.cache = {}
+        self.hits = self.misses = 0
+        quanta_caches.append(self)
+
+    def get(self, key, parse):
+        """
+        Return the cached value for key, calling parse(key) to get it (and
+        storing the result) if it isn't in the cache.
+
+        """
+
+        try:
+            value = self.cache[key]
+        except KeyError:
+            self.misses += 1
+            value = parse(key)
+            if len(self.cache) >= self.maxsize:
+                self.cache.popitem()
+            self.cache[key] = value
+            return value
+        self.hits += 1
+        return value
+
+def quanta_cache_stats():
+    """
+    Return a list of (name, hits, misses) tuples for all the QuantaCaches
+    which have been used since their statistics were last reset.
+
+    """
+
+    return [(cache.name, cache.hits, cache.misses) for cache in quanta_caches
+                if cache.hits or cache.misses]
+
+def reset_quanta_cache_stats():
+    """
+    Reset the hit and miss counts of all the QuantaCaches (but not their
+    contents).
+
+    """
+
+    for cache in quanta_caches:
+        cache.hits = cache.misses = 0
+
+def make_qn_codec(layout, width=15, name=None):
+    """
+    Generate a decoder and an encoder for a fixed-width field of quantum
+    numbers (such as the 15-character Vp field of the .par format) from its
+    layout: a list of (qn_name, start, end, fmt) tuples, where
+    field[start:end] holds the quantum number qn_name, formatted as fmt.
+    If fmt is None, the quantum number is a string which is left-justified
+    in its field; if fmt ends in 's' it is a string formatted by fmt;
+    otherwise it is a number. The slice offsets, formats and default
+    (blank) strings are fixed in the source of the generated functions,
+    which is compiled once, when the layout is defined. Returns the tuple
+    (decode, encode):
+
+    decode(field, qns) parses the quantum numbers from the string field
+    into the dictionary qns, exactly as save_qn (for numbers) and
+    save_qn_str (for strings) would;
+
+    encode(qns) returns the string field for the quantum numbers in qns (a
+    dictionary or State instance, which has a get() method), exactly as
+    qn_to_str (for numbers and formatted strings) and qn_to_str_ljust (for
+    left-justified strings) would, with any characters not covered by the
+    layout set to spaces.
+
+    If name is given, the decoder is memoized in a QuantaCache of that name:
+    the quantum numbers parsed from each distinct field are stored as a
+    tuple of (qn_name, value) pairs and copied into qns on later calls.
+
+    """
+
+    dec_lines = ['def decode(field, qns):']
+    enc_lines = ['def encode(qns):', '    if qns is None:',
+                 '        return %r' % (' '*width), '    get = qns.get']
+    template = []
+    pos = 0
+    for i, (qn_name, start, end, fmt) in enumerate(layout):
+        s_default = ' ' * (end - start)
+        dec_lines.append('    x = field[%d:%d].strip()' % (start, end))
+        if fmt is None or fmt.endswith('s'):
+            dec_lines.append('    if x: qns[%r] = x' % qn_name)
+        else:
+            # the fast path for the common cases of a blank field or a
+            # non-negative integer, before falling back to str_to_num
+            dec_lines.extend(['    if x:',
+                              '        if x.isdigit(): qns[%r] = int(x)'
+                                    % qn_name,
+                              '        else:',
+                              '            x = xn_utils.str_to_num(x)',
+                              '            if x is not None: qns[%r] = x'
+                                    % qn_name])
+        enc_lines.append('    x = get(%r)' % qn_name)
+        if fmt is None:
+            enc_lines.append('    s%d = %r if x is None else x.ljust(%d)'
+                                % (i, s_default, end - start))
+        else:
+            enc_lines.append('    s%d = %r if x is None else %r %% x'
+                                % (i, s_default, fmt))
+        template.append(' ' * (start - pos) + '%s')
+        pos = end
+    template.append(' ' * (width - pos))
+    dec_lines.append('    return qns')
+    enc_lines.append('    return %r %% (%s)' % (''.join(template),
+                        ''.join(['s%d, ' % i for i in range(len(layout))])))
+
+    namespace = {'xn_utils': xn_utils}
+    exec '\n'.join(dec_lines + enc_lines) in namespace
+    decode, encode = namespace['decode'], namespace['encode']
+    if name is None:
+        return decode, encode
+
+    def parse(field):
+        return tuple(decode(field, {}).items())
+    cache = QuantaCache(name)
+    def cached_decode(field, qns):
+        qns.update(cache.get(field, parse))
+        return qns
+    return cached_decode, encode
+
+# the mode numbers of the vibrational quantum numbers named so far (e.g.
+# vib_modes['v3'] = 3), with None for the names of other quantum numbers
+vib_modes = {}
+
+def vib_mode(qn_name):
+    """
+    Return the mode number of the vibrational quantum number called
+    qn_name, or None if qn_name doesn't name a vibrational quantum number.
+
+    """
+
+    try:
+        return vib_modes[qn_name]
+    except KeyError:
+        pass
+    m = re.match(vib_qn_patt, qn_name)
+    mode = None
+    if m:
+        mode = int(m.group(1))
+    vib_modes[qn_name] = mode
+    return mode
+
+def format_normal_modes_V(vibs):
+    """
+    Return the global quanta string for the vibrational state described by
+    vibs, a tuple of (mode, number of quanta) pairs in order of mode, in
+    the normal modes format, e.g. '          V1+V3'.
+
+    """
+
+    if not vibs:
+        return ' '*15
     total_vib_quanta = 0
-    nv = 0
-    for qn_name in state.keys():
-        m = re.match(vib_qn_patt, qn_name)
-        if not m:
-            continue
-        s_mode = m.group(1)
-        nv += 1
-        mode = int(s_mode)
-        val = state[qn_name]
+    s_v = []
+    for mode, val in vibs:
         total_vib_quanta += val
         if val > 1:
-            s_v[mode] = '%dV%d' % (val, mode)
+            s_v.append('%dV%d' % (val, mode))
         else:
-            s_v[mode] = 'V%d' % mode
-    if nv == 0:
-        return ' '*15
+            s_v.append('V%d' % mode)
     if total_vib_quanta == 0:
         return '         GROUND'
-    modes = s_v.keys()
-    modes.sort()
-    V = '+'.join(['%s' % s_v[mode] for mode in modes])
+    V = '+'.join(s_v)
     return '%15s' % V 
 
-def get_normal_modes_V(V):
+set_normal_modes_V_cache = QuantaCache('set_normal_modes_V')
+
+def set_normal_modes_V(state):
+    vibs = []
+    for qn_name in state.keys():
+        mode = vib_mode(qn_name)
+        if mode is not None:
+            vibs.append((mode, state[qn_name]))
+    vibs.sort()
+    return set_normal_modes_V_cache.get(tuple(vibs), format_normal_modes_V)
+
+def parse_normal_modes_V(V):
+    """
+    Parse the global quanta string V, in the normal modes format (e.g.
+    '          V1+V3') and return a tuple of (qn_name, value) pairs.
+
+    """
+
     s_V = V.strip()
     if not s_V:
         # unassigned vibrational state
-        return []
+        return ()
     if s_V == 'GROUND':
         # ground vibrational state - indicate this with vi=0 for i=1,2,3,4:
-        return [('v1', 0), ('v2', 0), ('v3', 0), ('v4', 0)]
+        return (('v1', 0), ('v2', 0), ('v3', 0), ('v4', 0))
     s_vibs = s_V.split('+')
     vqns = []
     for i, s_vib in enumerate(s_vibs):
@@ -147,4 +325,9 @@ def get_normal_modes_V(V):
             n=int(s_vib[0])
             mode  = 'v%s' % s_vib[2:]
         vqns.append((mode, n))
-    return vqns
+    return tuple(vqns)
+
+get_normal_modes_V_cache = QuantaCache('get_normal_modes_V')
+
+def get_normal_modes_V(V):
+    return get_normal_modes_V_cache.get(V, parse_normal_modes_V)
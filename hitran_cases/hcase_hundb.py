@@ -12,6 +12,17 @@
 
 from hcase_globals import *
 
+# the fixed-width layouts of the quantum number fields, as
+# (qn_name, start, end, fmt) tuples - see make_qn_codec
+decode_V = make_qn_codec([('v', 13, 15, '%2d')], name='hundb.V')[0]
+encode_V = make_qn_codec([('ElecStateLabel', 7, 8, '%1s'),
+                          ('v', 13, 15, '%2d')])[1]
+decode_Qp, encode_Qp = make_qn_codec([('F', 10, 15, '%5.1f')], name='hundb.Qp')
+# N", J" and F" in the Qpp field (the branch and multipole fields are dealt
+# with separately)
+decode_Qpp = make_qn_codec([('N', 2, 5, '%3d'), ('J', 6, 9, '%3d'),
+                            ('F', 9, 14, '%5.1f')], name='hundb.Qpp')[0]
+
 def parse_qns(trans):
     """
     Parse the quantum numbers for the upper and lower states of HITRAN
@@ -39,27 +50,25 @@ def parse_qns(trans):
     # all transitions are from the X(3Sigma_g=) ground state:
     qnspp = {'ElecStateLabel': 'X', 'S': 1, 'Lambda': 0}
 
-    save_qn(qnsp, 'v', trans.Vp[-2:])
-    save_qn(qnspp, 'v', trans.Vpp[-2:])
+    decode_V(trans.Vp, qnsp)
+    decode_V(trans.Vpp, qnspp)
 
     # rotational quantum numbers J and N are (non-negative) integers for
-    # the states of O2 in HITRAN
+    # the states of O2 in HITRAN; also look for hyperfine quantum numbers,
+    # Fp and Fpp, which may be integer or half-integer:
+    decode_Qpp(trans.Qpp, qnspp)
+    decode_Qp(trans.Qp, qnsp)
     brJ = trans.Qpp[5]  # J-branch designation: 'P' or 'R'
-    Jpp = save_qn(qnspp, 'J', trans.Qpp[6:9])
+    Jpp = qnspp.get('J')
     if Jpp is not None and brJ:
         Jp = Jpp + branch[brJ]
         qnsp['J'] = Jp
     brN = trans.Qpp[1]  # N-branch designation
-    Npp = save_qn(qnspp, 'N', trans.Qpp[2:5])
+    Npp = qnspp.get('N')
     if Npp is not None and brJ:
         Np = Npp + branch[brN]
         qnsp['N'] = Np
 
-    # look for hyperfine quantum numbers, Fp and Fpp, which may be integer
-    # or half-integer:
-    save_qn(qnspp, 'F', trans.Qpp[9:14])
-    save_qn(qnsp, 'F', trans.Qp[10:])
-
     multipole = 'E1'
     # for O2, the multipole designation, 'd', 'm' or 'q' is stored in Qpp[14]
     sympp = trans.Qpp[14]
@@ -77,13 +86,8 @@ def get_hitran_quanta(trans):
 
     """
 
-    ElecStateLabelp = qn_to_str(trans.statep, 'ElecStateLabel', '%1s', ' ')
-    ElecStateLabelpp = qn_to_str(trans.statepp, 'ElecStateLabel', '%1s', ' ')
-    s_vp = qn_to_str(trans.statep, 'v', '%2d', '  ')
-    s_vpp = qn_to_str(trans.statepp, 'v', '%2d', '  ')
-
-    Vp = '       %s     %s' % (ElecStateLabelp, s_vp)
-    Vpp = '       %s     %s' % (ElecStateLabelpp, s_vpp)
+    Vp = encode_V(trans.statep)
+    Vpp = encode_V(trans.statepp)
 
     Jpp = trans.statepp_get('J')
     brJ = ' '
@@ -102,7 +106,6 @@ def get_hitran_quanta(trans):
         if Np is not None:
             brN = branch.get(Np - Npp)
 
-    s_Fp = qn_to_str(trans.statep, 'F', '%5.1f', ' '*5) 
     s_Fpp = qn_to_str(trans.statepp, 'F', '%5.1f', ' '*5)
 
     # for O2, the Qpp[14] field holds a character identifying the transition
@@ -114,6 +117,6 @@ def get_hitran_quanta(trans):
         sympp = 'm'    # magnetic dipole
 
     Qpp = ' %s%s%s%s%s%s' % (brN, s_Npp, brJ, s_Jpp, s_Fpp, sympp)
-    Qp = '          %s' % s_Fp
+    Qp = encode_Qp(trans.statep)
     
     return Vp, Vpp, Qp, Qpp
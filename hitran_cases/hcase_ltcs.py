@@ -12,6 +12,29 @@
 
 from hcase_globals import *
 
+# the fixed-width layouts of the quantum number fields, as
+# (qn_name, start, end, fmt) tuples - see make_qn_codec
+# the vibrational quanta, v1, v2, l2, v3, and for CO2, the ranking index, r
+decode_V_CO2, encode_V_CO2 = make_qn_codec([('v1', 6, 8, '%2d'),
+                                            ('v2', 8, 10, '%2d'),
+                                            ('l2', 10, 12, '%2d'),
+                                            ('v3', 12, 14, '%2d'),
+                                            ('r', 14, 15, '%1d')],
+                                           name='ltcs.V_CO2')
+decode_V, encode_V = make_qn_codec([('v1', 7, 9, '%2d'),
+                                    ('v2', 9, 11, '%2d'),
+                                    ('l2', 11, 13, '%2d'),
+                                    ('v3', 13, 15, '%2d')], name='ltcs.V')
+# the only thing that could be in the Qp field is F'; for HCN, 14N has
+# integer spin, so F is an integer; the other nuclei giving rise to
+# hyperfine coupling have half-(odd)-integer spin, so F is half-(odd)-integer
+decode_Qp, encode_Qp = make_qn_codec([('F', 10, 15, '%5.1f')], name='ltcs.Qp')
+encode_Qp_HCN = make_qn_codec([('F', 10, 15, '%5d')])[1]
+# J" and F" in the Qpp field (the branch and parity fields are dealt with
+# separately)
+decode_Qpp = make_qn_codec([('J', 6, 9, '%3d'), ('F', 10, 15, '%5.1f')],
+                           name='ltcs.Qpp')[0]
+
 def parse_qns(trans):
     """
     Parse the quantum numbers for the upper and lower states of HITRAN
@@ -30,31 +53,18 @@ def parse_qns(trans):
 
     # vibrational quantum numbers
     if trans.molec_id == 2: # CO2
-        save_qn(qnsp, 'v1', trans.Vp[6:8])
-        save_qn(qnsp, 'v2', trans.Vp[8:10])
-        save_qn(qnsp, 'l2', trans.Vp[10:12])
-        save_qn(qnsp, 'v3', trans.Vp[12:14])
-        save_qn(qnsp, 'r', trans.Vp[14])
-
-        save_qn(qnspp, 'v1', trans.Vpp[6:8])
-        save_qn(qnspp, 'v2', trans.Vpp[8:10])
-        save_qn(qnspp, 'l2', trans.Vpp[10:12])
-        save_qn(qnspp, 'v3', trans.Vpp[12:14])
-        save_qn(qnspp, 'r', trans.Vpp[14])
+        decode_V_CO2(trans.Vp, qnsp)
+        decode_V_CO2(trans.Vpp, qnspp)
     else:   # N2O, OCS, HCN
-        save_qn(qnsp, 'v1', trans.Vp[7:9])
-        save_qn(qnsp, 'v2', trans.Vp[9:11])
-        save_qn(qnsp, 'l2', trans.Vp[11:13])
-        save_qn(qnsp, 'v3', trans.Vp[13:15])
-
-        save_qn(qnspp, 'v1', trans.Vpp[7:9])
-        save_qn(qnspp, 'v2', trans.Vpp[9:11])
-        save_qn(qnspp, 'l2', trans.Vpp[11:13])
-        save_qn(qnspp, 'v3', trans.Vpp[13:15])
+        decode_V(trans.Vp, qnsp)
+        decode_V(trans.Vpp, qnspp)
 
-    # rotational quantum number, J
+    # rotational quantum number, J, and the hyperfine quantum numbers, Fp
+    # and Fpp, which may be integer or half-integer
+    decode_Qpp(trans.Qpp, qnspp)
+    decode_Qp(trans.Qp, qnsp)
     br = trans.Qpp[5]   # branch designation: 'P' or 'R'
-    Jpp = save_qn(qnspp, 'J', trans.Qpp[6:9])
+    Jpp = qnspp.get('J')
     Jp = None
     if Jpp is not None and br:
         Jp = Jpp + branch[br]
@@ -75,11 +85,6 @@ def parse_qns(trans):
                 kronig_parityp = xn_utils.par_to_kp(parityp, Jp)
                 qnsp['kronigParity'] = kronig_parityp
 
-    # look for hyperfine quantum numbers, Fp and Fpp, which may be integer
-    # or half-integer:
-    save_qn(qnspp, 'F', trans.Qpp[10:])
-    save_qn(qnsp, 'F', trans.Qp[10:])
-
     return qnsp, qnspp, 'E1'
 
 def get_hitran_quanta(trans):
@@ -89,26 +94,13 @@ def get_hitran_quanta(trans):
 
     """
 
-    s_v1p = qn_to_str(trans.statep, 'v1', '%2d', '  ')
-    s_v2p = qn_to_str(trans.statep, 'v2', '%2d', '  ')
-    s_l2p = qn_to_str(trans.statep, 'l2', '%2d', '  ')
-    s_v3p = qn_to_str(trans.statep, 'v3', '%2d', '  ')
     if trans.molec_id == 2: # CO2
-        s_rp = qn_to_str(trans.statep, 'r', '%1d', ' ')
-        Vp = '      %s%s%s%s%s' % (s_v1p, s_v2p, s_l2p, s_v3p, s_rp)
+        Vp = encode_V_CO2(trans.statep)
+        Vpp = encode_V_CO2(trans.statepp)
     else:
-        Vp = '       %s%s%s%s' % (s_v1p, s_v2p, s_l2p, s_v3p)
+        Vp = encode_V(trans.statep)
+        Vpp = encode_V(trans.statepp)
 
-    s_v1pp = qn_to_str(trans.statepp, 'v1', '%2d', '  ')
-    s_v2pp = qn_to_str(trans.statepp, 'v2', '%2d', '  ')
-    s_l2pp = qn_to_str(trans.statepp, 'l2', '%2d', '  ')
-    s_v3pp = qn_to_str(trans.statepp, 'v3', '%2d', '  ')
-    if trans.molec_id == 2: # CO2
-        s_rpp = qn_to_str(trans.statepp, 'r', '%1d', ' ')
-        Vpp = '      %s%s%s%s%s' % (s_v1pp, s_v2pp, s_l2pp, s_v3pp, s_rpp)
-    else:
-        Vpp = '       %s%s%s%s' % (s_v1pp, s_v2pp, s_l2pp, s_v3pp)
-       
     Jpp = trans.statepp_get('J')
     br = ' '
     s_Jpp = '   '
@@ -123,15 +115,14 @@ def get_hitran_quanta(trans):
 
     if trans.molec_id == 23:    # HCN
         # 14N has integer spin, so F is an integer
-        s_Fp = qn_to_str(trans.statep, 'F', '%5d', ' '*5)
+        Qp = encode_Qp_HCN(trans.statep)
         s_Fpp = qn_to_str(trans.statepp, 'F', '%5d', ' '*5)
     else:
         # the other nuclei giving rise to hyperfine coupling have
         # half-(odd)-integer spin, so F is half-(odd)-integer
-        s_Fp = qn_to_str(trans.statep, 'F', '%5.1f', ' '*5)
+        Qp = encode_Qp(trans.statep)
         s_Fpp = qn_to_str(trans.statepp, 'F', '%5.1f', ' '*5)
 
     Qpp = '     %s%s%s%s' % (br, s_Jpp, kronig_paritypp, s_Fpp)
-    Qp = '          %s' % s_Fp
 
     return Vp, Vpp, Qp, Qpp
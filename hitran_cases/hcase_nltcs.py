@@ -12,6 +12,18 @@
 
 from hcase_globals import *
 
+# the fixed-width layouts of the quantum number fields, as
+# (qn_name, start, end, fmt) tuples - see make_qn_codec
+# the vibrational quanta, v1, v2, v3; the upper state's ranking index for
+# vibrationally mixed states is dealt with separately
+decode_V, encode_V = make_qn_codec([('v1', 9, 11, '%2d'),
+                                    ('v2', 11, 13, '%2d'),
+                                    ('v3', 13, 15, '%2d')], name='nltcs.V')
+decode_Q, encode_Q = make_qn_codec([('J', 0, 3, '%3d'),
+                                    ('Ka', 3, 6, '%3d'),
+                                    ('Kc', 6, 9, '%3d'),
+                                    ('F', 9, 14, '%5.1f')], name='nltcs.Q')
+
 def parse_qns(trans):
     """
     Parse the quantum numbers for the upper and lower states of HITRAN
@@ -43,21 +55,10 @@ def parse_qns(trans):
                 raise ValueError('unidentified vibrational rank: %s'
                                  % roman_numeral_rank)
 
-    save_qn(qnsp, 'v1', trans.Vp[9:11])
-    save_qn(qnsp, 'v2', trans.Vp[11:13])
-    save_qn(qnsp, 'v3', trans.Vp[13:15])
-    save_qn(qnspp, 'v1', trans.Vpp[9:11])
-    save_qn(qnspp, 'v2', trans.Vpp[11:13])
-    save_qn(qnspp, 'v3', trans.Vpp[13:15])
-
-    save_qn(qnsp, 'J', trans.Qp[0:3])
-    save_qn(qnsp, 'Ka', trans.Qp[3:6])
-    save_qn(qnsp, 'Kc', trans.Qp[6:9])
-    save_qn(qnsp, 'F', trans.Qp[9:14])
-    save_qn(qnspp, 'J', trans.Qpp[0:3])
-    save_qn(qnspp, 'Ka', trans.Qpp[3:6])
-    save_qn(qnspp, 'Kc', trans.Qpp[6:9])
-    save_qn(qnspp, 'F', trans.Qpp[9:14])
+    decode_V(trans.Vp, qnsp)
+    decode_V(trans.Vpp, qnspp)
+    decode_Q(trans.Qp, qnsp)
+    decode_Q(trans.Qpp, qnspp)
 
     return qnsp, qnspp, 'E1'
 
@@ -79,26 +80,11 @@ def get_hitran_quanta(trans):
         elif r == 3:
             s_rp = '      III'
 
-    s_v1p = qn_to_str(trans.statep, 'v1', '%2d', '  ')
-    s_v2p = qn_to_str(trans.statep, 'v2', '%2d', '  ')
-    s_v3p = qn_to_str(trans.statep, 'v3', '%2d', '  ')
-    s_v1pp = qn_to_str(trans.statepp, 'v1', '%2d', '  ')
-    s_v2pp = qn_to_str(trans.statepp, 'v2', '%2d', '  ')
-    s_v3pp = qn_to_str(trans.statepp, 'v3', '%2d', '  ')
-    Vp = '%s%s%s%s' % (s_rp, s_v1p, s_v2p, s_v3p)
-    Vpp = '         %s%s%s' % (s_v1pp, s_v2pp, s_v3pp)
-
-    s_Jp = qn_to_str(trans.statep, 'J', '%3d', '   ')
-    s_Kap = qn_to_str(trans.statep, 'Ka', '%3d', '   ')
-    s_Kcp = qn_to_str(trans.statep, 'Kc', '%3d', '   ')
-    s_Fp = qn_to_str(trans.statep, 'F', '%5.1f', ' '*5)
-
-    s_Jpp = qn_to_str(trans.statepp, 'J', '%3d', '   ')
-    s_Kapp = qn_to_str(trans.statepp, 'Ka', '%3d', '   ')
-    s_Kcpp = qn_to_str(trans.statepp, 'Kc', '%3d', '   ')
-    s_Fpp = qn_to_str(trans.statepp, 'F', '%5.1f', ' '*5)
+    # the encoded V field always starts with 9 spaces
+    Vp = s_rp + encode_V(trans.statep)[9:]
+    Vpp = encode_V(trans.statepp)
 
-    Qp = '%s%s%s%s ' % (s_Jp, s_Kap, s_Kcp, s_Fp)
-    Qpp = '%s%s%s%s ' % (s_Jpp, s_Kapp, s_Kcpp, s_Fpp)
+    Qp = encode_Q(trans.statep)
+    Qpp = encode_Q(trans.statepp)
 
     return Vp, Vpp, Qp, Qpp
@@ -11,6 +11,20 @@
 
 from hcase_globals import *
 
+# the fixed-width layouts of the quantum number fields, as
+# (qn_name, start, end, fmt) tuples - see make_qn_codec
+decode_V, encode_V = make_qn_codec([('v1', 9, 11, '%2d'),
+                                    ('v2', 11, 13, '%2d'),
+                                    ('v3', 13, 15, '%2d')], name='nltos.V')
+# the local quanta, up to but not including the J = N +/- 0.5 flag in Q[14],
+# which is dealt with separately
+Q_layout = [('N', 0, 3, '%3d'), ('Ka', 3, 6, '%3d'), ('Kc', 6, 9, '%3d')]
+# NO2 (half-integer F)
+decode_Q, encode_Q_NO2 = make_qn_codec(Q_layout + [('F', 9, 14, '%5.1f')],
+                                       width=14, name='nltos.Q')
+# HO2 (integer F)
+encode_Q_HO2 = make_qn_codec(Q_layout + [('F', 9, 14, '%5d')], width=14)[1]
+
 def parse_qns(trans):
     """
     Parse the quantum numbers for the upper and lower states of HITRAN
@@ -27,21 +41,10 @@ def parse_qns(trans):
     qnsp = {'ElecStateLabel': 'X', 'S': 0.5}
     qnspp = {'ElecStateLabel': 'X', 'S': 0.5}
 
-    save_qn(qnsp, 'v1', trans.Vp[9:11])
-    save_qn(qnsp, 'v2', trans.Vp[11:13])
-    save_qn(qnsp, 'v3', trans.Vp[13:15])
-    save_qn(qnspp, 'v1', trans.Vpp[9:11])
-    save_qn(qnspp, 'v2', trans.Vpp[11:13])
-    save_qn(qnspp, 'v3', trans.Vpp[13:15])
-
-    save_qn(qnsp, 'N', trans.Qp[0:3])
-    save_qn(qnsp, 'Ka', trans.Qp[3:6])
-    save_qn(qnsp, 'Kc', trans.Qp[6:9])
-    save_qn(qnsp, 'F', trans.Qp[9:14])
-    save_qn(qnspp, 'N', trans.Qpp[0:3])
-    save_qn(qnspp, 'Ka', trans.Qpp[3:6])
-    save_qn(qnspp, 'Kc', trans.Qpp[6:9])
-    save_qn(qnspp, 'F', trans.Qpp[9:14])
+    decode_V(trans.Vp, qnsp)
+    decode_V(trans.Vpp, qnspp)
+    decode_Q(trans.Qp, qnsp)
+    decode_Q(trans.Qpp, qnspp)
 
     # the character '+' or '-' in Q[14] indicates J = N + 0.5 or J = N - 0.5
     sp = None
@@ -72,29 +75,13 @@ def get_hitran_quanta(trans):
 
     """
 
-    s_v1p = qn_to_str(trans.statep, 'v1', '%2d', '  ')
-    s_v2p = qn_to_str(trans.statep, 'v2', '%2d', '  ')
-    s_v3p = qn_to_str(trans.statep, 'v3', '%2d', '  ')
-    s_v1pp = qn_to_str(trans.statepp, 'v1', '%2d', '  ')
-    s_v2pp = qn_to_str(trans.statepp, 'v2', '%2d', '  ')
-    s_v3pp = qn_to_str(trans.statepp, 'v3', '%2d', '  ')
-    Vp = '         %s%s%s' % (s_v1p, s_v2p, s_v3p)
-    Vpp = '         %s%s%s' % (s_v1pp, s_v2pp, s_v3pp)
-
-    s_Np = qn_to_str(trans.statep, 'N', '%3d', '   ')
-    s_Kap = qn_to_str(trans.statep, 'Ka', '%3d', '   ')
-    s_Kcp = qn_to_str(trans.statep, 'Kc', '%3d', '   ')
-
-    s_Npp = qn_to_str(trans.statepp, 'N', '%3d', '   ')
-    s_Kapp = qn_to_str(trans.statepp, 'Ka', '%3d', '   ')
-    s_Kcpp = qn_to_str(trans.statepp, 'Kc', '%3d', '   ')
+    Vp = encode_V(trans.statep)
+    Vpp = encode_V(trans.statepp)
 
     if trans.molec_id == 10:    # NO2 (half-integer F)
-        s_Fp = qn_to_str(trans.statep, 'F', '%5.1f', ' '*5)
-        s_Fpp = qn_to_str(trans.statepp, 'F', '%5.1f', ' '*5)
+        encode_Q = encode_Q_NO2
     elif trans.molec_id == 33:  # HO2 (integer F)
-        s_Fp = qn_to_str(trans.statep, 'F', '%5d', ' '*5)
-        s_Fpp = qn_to_str(trans.statepp, 'F', '%5d', ' '*5)
+        encode_Q = encode_Q_HO2
 
     symp = ' '
     Jp = trans.statep_get('J')
@@ -113,7 +100,7 @@ def get_hitran_quanta(trans):
         elif Jpp > Npp:
             sympp = '+'
 
-    Qp = '%s%s%s%s%s' % (s_Np, s_Kap, s_Kcp, s_Fp, symp)
-    Qpp = '%s%s%s%s%s' % (s_Npp, s_Kapp, s_Kcpp, s_Fpp, sympp)
+    Qp = encode_Q(trans.statep) + symp
+    Qpp = encode_Q(trans.statepp) + sympp
 
     return Vp, Vpp, Qp, Qpp
@@ -12,6 +12,26 @@
 
 from hcase_globals import *
 
+# the fixed-width layouts of the quantum number fields, as
+# (qn_name, start, end, fmt) tuples - see make_qn_codec
+V_layout = [('v1', 5, 7, '%2d'), ('v2', 7, 9, '%2d'), ('v3', 9, 11, '%2d'),
+            ('v4', 11, 13, '%2d')]
+decode_V = make_qn_codec(V_layout, name='pyrtet.V')[0]
+decode_V_vibInv, encode_V_vibInv = make_qn_codec(V_layout
+                                    + [('vibInv', 14, 15, '%1s')],
+                                    name='pyrtet.V_vibInv')
+# vibrational symmetry of the upper state is in the Vp field for NH3
+decode_Vp_NH3, encode_Vp_NH3 = make_qn_codec(V_layout
+                                    + [('vibSym', 13, 14, None),
+                                       ('vibInv', 14, 15, '%1s')],
+                                    name='pyrtet.Vp_NH3')
+Q_layout = [('J', 0, 3, '%3d'), ('K', 3, 6, '%3d'), ('l', 6, 8, '%2d')]
+decode_Q = make_qn_codec(Q_layout, width=8, name='pyrtet.Q')[0]
+decode_Q_PH3, encode_Q_PH3 = make_qn_codec(Q_layout
+                                    + [('vibSym', 8, 10, None)],
+                                    name='pyrtet.Q_PH3')
+encode_Q_NH3 = make_qn_codec(Q_layout + [('vibInv', 10, 11, '%1s')])[1]
+
 def parse_qns(trans):
     """
     Parse the quantum numbers for the upper and lower states of HITRAN
@@ -28,40 +48,34 @@ def parse_qns(trans):
     qnsp = {'ElecStateLabel': 'X'}
     qnspp = {'ElecStateLabel': 'X'}
 
-    save_qn(qnsp, 'v1', trans.Vp[5:7])
-    save_qn(qnsp, 'v2', trans.Vp[7:9])
-    save_qn(qnsp, 'v3', trans.Vp[9:11])
-    save_qn(qnsp, 'v4', trans.Vp[11:13])
-    save_qn(qnspp, 'v1', trans.Vpp[5:7])
-    save_qn(qnspp, 'v2', trans.Vpp[7:9])
-    save_qn(qnspp, 'v3', trans.Vpp[9:11])
-    save_qn(qnspp, 'v4', trans.Vpp[11:13])
     if trans.molec_id == 11:    # vibrational inversion for NH3
-        save_qn_str(qnsp, 'vibInv', trans.Vp[14])
-        save_qn_str(qnspp, 'vibInv', trans.Vpp[14])
+        # we only need vibrational symmetry for the upper state because
+        # only excited levels such as 2v4 have more than one possible
+        # symmetry and these don't serve as lower levels in HITRAN
+        decode_Vp_NH3(trans.Vp, qnsp)
+        decode_V_vibInv(trans.Vpp, qnspp)
         if trans.local_iso_id == 2 and trans.Vp[14] == ' ':   # (15N)H3
             # some of the lower states of (15N)H3 use +/- instead of a/s
             s_vibinvpp = trans.Qpp[10]
             s_vibinvpp = s_vibinvpp.replace('+', 's')
             s_vibinvpp = s_vibinvpp.replace('-', 'a')
             save_qn_str(qnspp, 'vibInv', s_vibinvpp)
-        # we only need vibrational symmetry for the upper state because
-        # only excited levels such as 2v4 have more than one possible
-        # symmetry and these don't serve as lower levels in HITRAN
-        save_qn_str(qnsp, 'vibSym', trans.Vp[13])
-    elif trans.molec_id == 28:  # PH3
-        save_qn_str(qnsp, 'vibSym', trans.Qp[8:10])
-        save_qn_str(qnspp, 'vibSym', trans.Qpp[8:10])
-
-    save_qn(qnsp, 'J', trans.Qp[:3])
-    if trans.Qp[3:6] != ' -1':   # -1 means unknown K value
-        save_qn(qnsp, 'K', trans.Qp[3:6])
-    save_qn(qnsp, 'l', trans.Qp[6:8])
-
-    save_qn(qnspp, 'J', trans.Qpp[:3])
-    if trans.Qpp[3:6] != ' -1':   # -1 means unknown K value
-        save_qn(qnspp, 'K', trans.Qpp[3:6])
-    save_qn(qnspp, 'l', trans.Qpp[6:8])
+        decode_Q(trans.Qp, qnsp)
+        decode_Q(trans.Qpp, qnspp)
+    else:
+        decode_V(trans.Vp, qnsp)
+        decode_V(trans.Vpp, qnspp)
+        if trans.molec_id == 28:  # PH3
+            decode_Q_PH3(trans.Qp, qnsp)
+            decode_Q_PH3(trans.Qpp, qnspp)
+        else:
+            decode_Q(trans.Qp, qnsp)
+            decode_Q(trans.Qpp, qnspp)
+    # -1 means unknown K value
+    if trans.Qp[3:6] == ' -1':
+        del qnsp['K']
+    if trans.Qpp[3:6] == ' -1':
+        del qnspp['K']
 
     return qnsp, qnspp, 'E1'
 
@@ -75,46 +89,21 @@ def get_hitran_quanta(trans):
     ElecStateLabelp = qn_to_str(trans.statep, 'ElecStateLabel', '%1s', ' ')
     ElecStateLabelpp = qn_to_str(trans.statepp, 'ElecStateLabel', '%1s', ' ')
 
-    s_v1p = qn_to_str(trans.statep, 'v1', '%2d', '  ')
-    s_v2p = qn_to_str(trans.statep, 'v2', '%2d', '  ')
-    s_v3p = qn_to_str(trans.statep, 'v3', '%2d', '  ')
-    s_v4p = qn_to_str(trans.statep, 'v4', '%2d', '  ')
-    s_lp = qn_to_str(trans.statep, 'l', '%2d', '  ')
-    s_Jp = qn_to_str(trans.statep, 'J', '%3d', '   ')
-    s_Kp = qn_to_str(trans.statep, 'K', '%3d', '   ')
-    s_vibinvp = qn_to_str(trans.statep, 'vibInv', '%1s', ' ')
-    if trans.molec_id == 11:    # NH3
-        s_vibsymp = qn_to_str_ljust(trans.statep, 'vibSym', 1, ' ')
-    else:
-        s_vibsymp = qn_to_str_ljust(trans.statep, 'vibSym', 2, '  ')
-    
-    s_v1pp = qn_to_str(trans.statepp, 'v1', '%2d', '  ')
-    s_v2pp = qn_to_str(trans.statepp, 'v2', '%2d', '  ')
-    s_v3pp = qn_to_str(trans.statepp, 'v3', '%2d', '  ')
-    s_v4pp = qn_to_str(trans.statepp, 'v4', '%2d', '  ')
-    s_lpp = qn_to_str(trans.statepp, 'l', '%2d', '  ')
-    s_Jpp = qn_to_str(trans.statepp, 'J', '%3d', '   ')
-    s_Kpp = qn_to_str(trans.statepp, 'K', '%3d', '   ')
-    s_vibinvpp = qn_to_str(trans.statepp, 'vibInv', '%1s', ' ')
-    s_vibsympp = qn_to_str_ljust(trans.statepp, 'vibSym', 2, '  ')
-
-
     if trans.molec_id == 11:    # NH3
         # vibrational symmetry of the upper state is in the Vp field for NH3
-        Vp  = '     %s%s%s%s%s%s' % (s_v1p, s_v2p, s_v3p, s_v4p, s_vibsymp,
-                                     s_vibinvp)
-        Vpp = '     %s%s%s%s %s' % (s_v1pp, s_v2pp, s_v3pp, s_v4pp, s_vibinvpp)
-        Qp  = '%s%s%s  %s    ' % (s_Jp, s_Kp, s_lp, s_vibinvp) 
-        Qpp = '%s%s%s  %s    ' % (s_Jpp, s_Kpp, s_lpp, s_vibinvpp)
+        Vp  = encode_Vp_NH3(trans.statep)
+        Vpp = encode_V_vibInv(trans.statepp)
+        Qp  = encode_Q_NH3(trans.statep)
+        Qpp = encode_Q_NH3(trans.statepp)
         # unassigned lower states don't quote the inversion symmetry,
         # even if it is known:
         sQpp = Qpp.strip()
         if sQpp in ('a', 's'):
             Qpp = ' '*15
     elif trans.molec_id == 28:  # PH3
-        Vp  = '     %s%s%s%s %s' % (s_v1p, s_v2p, s_v3p, s_v4p, s_vibinvp)
-        Vpp = '     %s%s%s%s %s' % (s_v1pp, s_v2pp, s_v3pp, s_v4pp, s_vibinvpp)
-        Qpp = '%s%s%s%s     ' % (s_Jpp, s_Kpp, s_lpp, s_vibsympp)
-        Qp  = '%s%s%s%s     ' % (s_Jp, s_Kp, s_lp, s_vibsymp)
+        Vp  = encode_V_vibInv(trans.statep)
+        Vpp = encode_V_vibInv(trans.statepp)
+        Qpp = encode_Q_PH3(trans.statepp)
+        Qp  = encode_Q_PH3(trans.statep)
 
     return Vp,Vpp,Qp,Qpp
@@ -11,6 +11,17 @@
 
 from hcase_globals import *
 
+# the fixed-width layouts of the quantum number fields, as
+# (qn_name, start, end, fmt) tuples - see make_qn_codec
+Q_layout = [('J', 0, 3, '%3d'), ('K', 3, 6, '%3d'), ('l', 6, 8, '%2d')]
+# for C2H6, the rovibrational symmetry labels are abbreviated and dealt with
+# separately
+decode_Q_C2H6, encode_Q_C2H6 = make_qn_codec(Q_layout, width=8,
+                                             name='stcs.Q_C2H6')
+decode_Q, encode_Q = make_qn_codec(Q_layout + [('rovibSym', 8, 10, None),
+                                               ('F', 10, 15, '%5.1f')],
+                                   name='stcs.Q')
+
 def parse_qns(trans):
     """
     Parse the quantum numbers for the upper and lower states of HITRAN
@@ -31,33 +42,28 @@ def parse_qns(trans):
     for (mode, val) in get_normal_modes_V(trans.Vpp):
          qnspp[mode] = val
     
-    save_qn(qnsp, 'J', trans.Qp[:3])
-    if trans.Qp[3:6] != ' -1':   # -1 means unknown K value
-        save_qn(qnsp, 'K', trans.Qp[3:6])
-    save_qn(qnsp, 'l', trans.Qp[6:8])
     if trans.molec_id == 27:    # C2H6
+        decode_Q_C2H6(trans.Qp, qnsp)
         rovib_symp = trans.Qp[8:11]
         rovib_symp = rovib_symp.replace('A12', 'A1+A2')
         rovib_symp = rovib_symp.replace('A34', 'A3+A4')
         rovib_symp = rovib_symp.replace('E34', 'E3+E4')
         save_qn_str(qnsp, 'rovibSym', rovib_symp)
-    else:
-        save_qn_str(qnsp, 'rovibSym', trans.Qp[8:10])
-        save_qn(qnsp, 'F', trans.Qp[10:])
 
-    save_qn(qnspp, 'J', trans.Qpp[:3])
-    if trans.Qpp[3:6] != ' -1':   # -1 means unknown K value
-        save_qn(qnspp, 'K', trans.Qpp[3:6])
-    save_qn(qnspp, 'l', trans.Qpp[6:8])
-    if trans.molec_id == 27:    # C2H6
+        decode_Q_C2H6(trans.Qpp, qnspp)
         rovib_sympp = trans.Qpp[8:11]
         rovib_sympp = rovib_sympp.replace('A12', 'A1+A2')
         rovib_sympp = rovib_sympp.replace('A34', 'A3+A4')
         rovib_sympp = rovib_sympp.replace('E34', 'E3+E4')
         save_qn_str(qnspp, 'rovibSym', rovib_sympp)
     else:
-        save_qn_str(qnspp, 'rovibSym', trans.Qpp[8:10])
-        save_qn(qnspp, 'F', trans.Qpp[10:])
+        decode_Q(trans.Qp, qnsp)
+        decode_Q(trans.Qpp, qnspp)
+    # -1 means unknown K value
+    if trans.Qp[3:6] == ' -1':
+        del qnsp['K']
+    if trans.Qpp[3:6] == ' -1':
+        del qnspp['K']
 
     return qnsp, qnspp, 'E1'
 
@@ -74,33 +80,19 @@ def get_hitran_quanta(trans):
     Vp = set_normal_modes_V(trans.statep)
     Vpp = set_normal_modes_V(trans.statepp)
 
-    s_Jp = qn_to_str(trans.statep, 'J', '%3d', '   ')
-    s_Kp = qn_to_str(trans.statep, 'K', '%3d', '   ')
-    s_lp = qn_to_str(trans.statep, 'l', '%2d', '  ')
     if trans.molec_id == 27:    # C2H6
         s_rovibsymp = qn_to_str(trans.statep, 'rovibSym', '%3s', '   ')
         s_rovibsymp = s_rovibsymp.replace('A1+A2', 'A12')
         s_rovibsymp = s_rovibsymp.replace('A3+A4', 'A34')
         s_rovibsymp = s_rovibsymp.replace('E3+E4', 'E34')
-        s_Fp = '    '
-    else:
-        s_rovibsymp = qn_to_str_ljust(trans.statep, 'rovibSym', 2, '  ')
-        s_Fp = qn_to_str(trans.statep, 'F', '%5.1f', ' '*5)
-
-    s_Jpp = qn_to_str(trans.statepp, 'J', '%3d', '   ')
-    s_Kpp = qn_to_str(trans.statepp, 'K', '%3d', '   ')
-    s_lpp = qn_to_str(trans.statepp, 'l', '%2d', '  ')
-    if trans.molec_id == 27:    # C2H6
         s_rovibsympp = qn_to_str(trans.statepp, 'rovibSym', '%3s', '   ')
         s_rovibsympp = s_rovibsympp.replace('A1+A2', 'A12')
         s_rovibsympp = s_rovibsympp.replace('A3+A4', 'A34')
         s_rovibsympp = s_rovibsympp.replace('E3+E4', 'E34')
-        s_Fpp = '    '
+        Qpp = '%s%s    ' % (encode_Q_C2H6(trans.statepp), s_rovibsympp)
+        Qp = '%s%s    ' % (encode_Q_C2H6(trans.statep), s_rovibsymp)
     else:
-        s_rovibsympp = qn_to_str_ljust(trans.statepp, 'rovibSym', 2, '  ')
-        s_Fpp = qn_to_str(trans.statepp, 'F', '%5.1f', ' '*5)
-
-    Qpp = '%s%s%s%s%s' % (s_Jpp, s_Kpp, s_lpp, s_rovibsympp, s_Fpp)
-    Qp = '%s%s%s%s%s' % (s_Jp, s_Kp, s_lp, s_rovibsymp, s_Fp)
+        Qpp = encode_Q(trans.statepp)
+        Qp = encode_Q(trans.statep)
 
     return Vp,Vpp,Qp,Qpp
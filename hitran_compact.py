@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+# hitran_compact.py
+
+# Compact variants of the HITRANParam and HITRANTransition classes and of
+# the case State classes, for holding a whole molecule's worth of
+# transitions in memory (as check_norm does).
+# An ordinary HITRANTransition carries its attributes in a per-instance
+# __dict__, and so does each of its seven HITRANParams and its two States;
+# the compact variants keep theirs in __slots__ instead, with the same
+# public attributes. The base classes from lbl aren't slotted (a subclass
+# of them would still get a __dict__), so the compact classes are not
+# derived from them: the methods defined in this project are shared with
+# the full classes, and a full instance can be made with the full() method
+# for anything else (e.g. the lbl methods for writing a state's quantum
+# numbers as XML).
+
+from hitran_param import HITRANParam
+from hitran_transition import HITRANTransition
+
+def shared_method(cls, method_name):
+    """
+    Return the method method_name of class cls as a plain function, for use
+    as a method of another class (an unbound method would insist on being
+    called with an instance of cls).
+
+    """
+
+    return cls.__dict__[method_name]
+
+class CompactHITRANParam(object):
+    """
+    A compact, __slots__-based variant of HITRANParam, with the same public
+    attributes and HITRAN-specific methods.
+
+    """
+
+    __slots__ = ('val', 'err', 'ref', 'name', 'ierr', 'rerr', 'relative',
+                 'comment', 'source_id')
+
+    abs_err_codes = HITRANParam.abs_err_codes
+    abs_err_max = HITRANParam.abs_err_max
+    rel_err_codes = HITRANParam.rel_err_codes
+    rel_err_max = HITRANParam.rel_err_max
+
+    def __init__(self, val, err=None, ref=None, name=None, ierr=None,
+                 rerr=None, relative=False, source_id=None):
+        """
+        Initialize an instance of the CompactHITRANParam class, exactly as
+        for HITRANParam.
+
+        """
+
+        self.val = val
+        self.err = err
+        self.ref = ref
+        self.name = name
+        self.ierr = ierr
+        self.relative = relative
+        self.comment = None
+        if self.relative:
+            if self.ierr == 1:
+                self.comment = 'default or constant'
+            elif self.ierr == 2:
+                self.comment = 'average or estimate'
+
+        if self.err is None:
+            if self.ierr is not None and not self.relative:
+                self.set_abs_err()
+
+        if self.relative:
+            self.set_rel_err()
+        self.source_id = source_id
+
+    set_ierr = shared_method(HITRANParam, 'set_ierr')
+    set_abs_err = shared_method(HITRANParam, 'set_abs_err')
+    set_rel_err = shared_method(HITRANParam, 'set_rel_err')
+    get_rel_err = shared_method(HITRANParam, 'get_rel_err')
+    get_ierr = shared_method(HITRANParam, 'get_ierr')
+
+    @classmethod
+    def from_param(self, prm):
+        """
+        Return a CompactHITRANParam with the same attributes as the
+        HITRANParam prm (or prm itself if it is already compact, or None
+        if it is None).
+
+        """
+
+        if prm is None or isinstance(prm, CompactHITRANParam):
+            return prm
+        compact_prm = CompactHITRANParam.__new__(CompactHITRANParam)
+        for attr in CompactHITRANParam.__slots__:
+            if hasattr(prm, attr):
+                setattr(compact_prm, attr, getattr(prm, attr))
+        return compact_prm
+
+    def full(self):
+        """ Return a HITRANParam with the same attributes as this one. """
+
+        prm = HITRANParam(self.val, self.err, self.ref, self.name, self.ierr,
+                          relative=self.relative, source_id=self.source_id)
+        for attr in CompactHITRANParam.__slots__:
+            if hasattr(self, attr):
+                setattr(prm, attr, getattr(self, attr))
+        return prm
+
+# identical sets of quantum numbers are shared between CompactStates: this
+# dictionary maps each tuple of (qn_name, value) pairs to itself
+qns_items_cache = {}
+
+class CompactState(object):
+    """
+    A compact, __slots__-based variant of the case State classes (HDcs,
+    HLtcs, etc.). Its quantum numbers are kept as a tuple of (qn_name,
+    value) pairs, shared with any other CompactState with the same quantum
+    numbers, and are read with the same get(), keys() and [] methods as
+    those of a State; the qns attribute is a copy of them as a dictionary.
+
+    """
+
+    __slots__ = ('case_class', 'molec_id', 'local_iso_id', 'global_iso_id',
+                 'E', 'id', 'g', 'qns_items')
+
+    @classmethod
+    def from_state(self, state):
+        """
+        Return a CompactState with the same attributes and quantum numbers
+        as the State state (or state itself if it is already compact, or
+        None if it is None).
+
+        """
+
+        if state is None or isinstance(state, CompactState):
+            return state
+        compact_state = CompactState()
+        compact_state.case_class = state.__class__
+        compact_state.molec_id = state.molec_id
+        compact_state.local_iso_id = state.local_iso_id
+        compact_state.global_iso_id = state.global_iso_id
+        compact_state.E = state.E
+        compact_state.id = state.id
+        compact_state.g = state.g
+        qns_items = tuple(sorted(state.qns.items()))
+        compact_state.qns_items = qns_items_cache.setdefault(qns_items,
+                                                             qns_items)
+        return compact_state
+
+    def full(self):
+        """
+        Return an instance of the case State class with the same attributes
+        and quantum numbers as this one.
+
+        """
+
+        return self.case_class(self.molec_id, self.local_iso_id,
+                               self.global_iso_id, self.E, self.id, self.g,
+                               dict(self.qns_items))
+
+    @property
+    def qns(self):
+        return dict(self.qns_items)
+
+    def get(self, qn_name, default=None):
+        for name, val in self.qns_items:
+            if name == qn_name:
+                return val
+        return default
+
+    def keys(self):
+        return [name for name, val in self.qns_items]
+
+    def __getitem__(self, qn_name):
+        for name, val in self.qns_items:
+            if name == qn_name:
+                return val
+        raise KeyError(qn_name)
+
+class CompactHITRANTransition(object):
+    """
+    A compact, __slots__-based variant of HITRANTransition, with the same
+    public attributes and HITRAN-specific methods. Its parameters are
+    CompactHITRANParams and its states CompactStates.
+
+    """
+
+    # the attributes of the base Transition class, then of HITRANTransition,
+    # then old_par_line, set by check_norm when a line is corrected
+    __slots__ = ('statep', 'statepp', 'stateIDp', 'stateIDpp', 'A',
+                 'Elower', 'Eupper',
+                 'par_line', 'molec_id', 'local_iso_id', 'global_iso_id',
+                 'nu', 'Sw', 'gamma_air', 'gamma_self', 'n_air', 'delta_air',
+                 'Vp', 'Vpp', 'Qp', 'Qpp', 'multipole', 'flag', 'gp', 'gpp',
+                 'case_module',
+                 'old_par_line')
+
+    # the parameters, which are HITRANParams in a HITRANTransition
+    prm_names = ('nu', 'Sw', 'A', 'gamma_air', 'gamma_self', 'n_air',
+                 'delta_air')
+
+    def __init__(self):
+        for attr in CompactHITRANTransition.__slots__:
+            setattr(self, attr, None)
+        self.global_iso_id = -1
+        self.flag = ' '
+
+    statep_get = shared_method(HITRANTransition, 'statep_get')
+    statepp_get = shared_method(HITRANTransition, 'statepp_get')
+    validate_as_par = shared_method(HITRANTransition, 'validate_as_par')
+    get_par_str = shared_method(HITRANTransition, 'get_par_str')
+    set_param = shared_method(HITRANTransition, 'set_param')
+    get_param_attr = shared_method(HITRANTransition, 'get_param_attr')
+
+    @classmethod
+    def from_transition(self, trans):
+        """
+        Return a CompactHITRANTransition with the same attributes as the
+        HITRANTransition trans, with compact variants of its parameters
+        and states.
+
+        """
+
+        compact_trans = CompactHITRANTransition()
+        for attr in CompactHITRANTransition.__slots__:
+            if hasattr(trans, attr):
+                setattr(compact_trans, attr, getattr(trans, attr))
+        for prm_name in CompactHITRANTransition.prm_names:
+            setattr(compact_trans, prm_name, CompactHITRANParam.from_param(
+                                getattr(compact_trans, prm_name)))
+        compact_trans.statep = CompactState.from_state(compact_trans.statep)
+        compact_trans.statepp = CompactState.from_state(compact_trans.statepp)
+        return compact_trans
+
+    def full(self):
+        """
+        Return a HITRANTransition with the same attributes as this one, with
+        full HITRANParams and States.
+
+        """
+
+        trans = HITRANTransition()
+        for attr in CompactHITRANTransition.__slots__:
+            if attr == 'old_par_line' and self.old_par_line is None:
+                continue
+            setattr(trans, attr, getattr(self, attr))
+        for prm_name in CompactHITRANTransition.prm_names:
+            prm = getattr(self, prm_name)
+            if prm is not None:
+                setattr(trans, prm_name, prm.full())
+        for attr in ('statep', 'statepp'):
+            state = getattr(self, attr)
+            if state is not None:
+                setattr(trans, attr, state.full())
+        return trans
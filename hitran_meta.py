@@ -10,6 +10,78 @@
 
 from hitran_cases import *
 
+# the HITRAN local isotopologue IDs are single digits in the .par format
+local_iso_ids = range(10)
+
+# the mapping of molecules (and, where necessary, isotopologues and
+# electronic states) to the case module that understands the HITRAN .par
+# file's format of their quantum numbers, and the derived class of State
+# describing their states. Each entry is a tuple of:
+# (molec_ids, local_iso_ids, ElecStateLabel, case_module, CaseClass)
+# where local_iso_ids=None means all isotopologues of the molecules
+case_table = [
+    ((5, 14, 15, 16, 17, 22, 36, 46), None, 'X', hcase_dcs, hdcs.HDcs),
+    ((1, 3, 9, 21, 31, 37), None, 'X', hcase_nltcs, hnltcs.HNltcs),
+    ((2, 4, 19, 23), None, 'X', hcase_ltcs, hltcs.HLtcs),
+    ((6,), (1, 2), 'X', hcase_sphcs, hsphcs.HSphcs),
+    ((6,), (3, 4), 'X', hcase_stcs, hstcs.HStcs),
+    ((42,), None, 'X', hcase_sphcs, hsphcs.HSphcs),
+    ((7,), None, 'X', hcase_hundb, hhundb.HHundB),
+    # NH3 and PH3 have their own .par format, but their states are
+    # described as closed-shell symmetric tops
+    ((11, 28), None, 'X', hcase_pyrtet, hstcs.HStcs),
+    ((24, 27, 39, 40, 41), None, 'X', hcase_stcs, hstcs.HStcs),
+    ((12, 20, 25, 29, 32, 38), None, 'X', hcase_asymcs, hasymcs.HAsymcs),
+    ((10, 33), None, 'X', hcase_nltos, hnltos.HNltos),
+    ((8, 18), None, 'X', hcase_hunda, hhunda.HHundA),
+    ((26, 44), None, 'X', hcase_lpcs, hlpcs.HLpcs),
+    # OH X(2Pi) is Hund's case (a)
+    ((13,), None, 'X', hcase_hunda, hhunda.HHundA),
+    # OH A(2Sigma+) is Hund's case (b); its transitions are to the X(2Pi)
+    # state (the A-X system in the UV), which has its own .par format
+    ((13,), None, 'A', hcase_OHAX, hhundb.HHundB),
+]
+
+def make_case_registry(case_table):
+    """
+    Resolve case_table into a dictionary of (case_module, CaseClass)
+    tuples, keyed by (molec_id, local_iso_id, ElecStateLabel), and
+    return it.
+
+    """
+
+    registry = {}
+    for molec_ids, iso_ids, ElecStateLabel, case_module, CaseClass\
+                in case_table:
+        for molec_id in molec_ids:
+            for local_iso_id in (iso_ids or local_iso_ids):
+                registry[(molec_id, local_iso_id, ElecStateLabel)]\
+                        = (case_module, CaseClass)
+    return registry
+
+# the case registry, resolved once on import
+case_registry = make_case_registry(case_table)
+
+def get_case(molec_id, local_iso_id, ElecStateLabel='X'):
+    """
+    Return the tuple (case_module, CaseClass) for states of the given
+    isotopologue in the electronic state ElecStateLabel from the case
+    registry. Only electronic states with their own entries are
+    distinguished: any other falls back to the entry for the ground
+    state, 'X'. Returns (None, None) for an unrecognised isotopologue.
+
+    """
+
+    try:
+        return case_registry[(molec_id, local_iso_id, ElecStateLabel)]
+    except KeyError:
+        pass
+    try:
+        return case_registry[(molec_id, local_iso_id, 'X')]
+    except KeyError:
+        print 'Unrecognised molec_id, local_iso_id =', molec_id, local_iso_id
+        return None, None
+
 def get_states(trans):
     """
     Given trans, and instance of HITRANTransition, parse its quantum
@@ -25,134 +97,44 @@ def get_states(trans):
                method, parse_qns
     """
 
-    case_module = CaseClass = None
-
-    if trans.molec_id in (5, 14, 15, 16, 17, 22, 36, 46):
-        case_module, CaseClass = hcase_dcs, hdcs.HDcs
-    elif trans.molec_id in (1, 3, 9, 21, 31, 37):
-        case_module, CaseClass = hcase_nltcs, hnltcs.HNltcs
-    elif trans.molec_id in (2, 4, 19, 23):
-        case_module, CaseClass = hcase_ltcs, hltcs.HLtcs
-    elif trans.molec_id == 6:
-        if trans.local_iso_id in (1,2):
-            case_module, CaseClass = hcase_sphcs, hsphcs.HSphcs
-        elif trans.local_iso_id in (3,4):
-            case_module, CaseClass = hcase_stcs, hstcs.HStcs
-    elif trans.molec_id == 42:
-            case_module, CaseClass = hcase_sphcs, hsphcs.HSphcs
-    elif trans.molec_id == 7:
-        case_module, CaseClass = hcase_hundb, hhundb.HHundB
-    elif trans.molec_id in (11, 28):
-        case_module, CaseClass = hcase_pyrtet, hstcs.HStcs
-    elif trans.molec_id in (24, 27, 39, 40, 41):
-        case_module, CaseClass = hcase_stcs, hstcs.HStcs
-    elif trans.molec_id in (12, 20, 25, 29, 32, 38):
-        case_module, CaseClass = hcase_asymcs, hasymcs.HAsymcs
-    elif trans.molec_id in (10, 33):
-        case_module, CaseClass = hcase_nltos, hnltos.HNltos
-    elif trans.molec_id in (8, 18):
-        case_module, CaseClass = hcase_hunda, hhunda.HHundA
-    elif trans.molec_id in (26,44):
-        case_module, CaseClass = hcase_lpcs, hlpcs.HLpcs
-    elif trans.molec_id == 13:
-        # OH
-        if trans.nu.val > 25000.:
-            # A(2Sigma+)-X(2Pi) transitions in the UV
-            # deal with this as a special case, because the upper and lower
-            # states belong to different cases (Hund's case (b) and (a)).
-            case_module = hcase_OHAX
-            qnsp, qnspp, multipole = case_module.parse_qns(trans)
-            statep = hhundb.HHundB(trans.molec_id, trans.local_iso_id,
-                           trans.global_iso_id, trans.Eupper, None,
-                           trans.gp, qnsp)
-            statepp = hhunda.HHundA(trans.molec_id, trans.local_iso_id,
-                            trans.global_iso_id, trans.Elower, None,
-                            trans.gpp, qnspp)
-            return case_module, statep, statepp, multipole
-        else:
-            # X(2Pi)-X(2Pi) transitions
-            case_module, CaseClass = hcase_hunda, hhunda.HHundA
-        
-
-    if case_module and CaseClass:
-        qnsp, qnspp, multipole = case_module.parse_qns(trans)
-        statep = CaseClass(trans.molec_id, trans.local_iso_id,
-                           trans.global_iso_id, trans.Eupper, None,
-                           trans.gp, qnsp)
-        statepp = CaseClass(trans.molec_id, trans.local_iso_id,
-                            trans.global_iso_id, trans.Elower, None,
-                            trans.gpp, qnspp)
-        return case_module, statep, statepp, multipole
-
-    print 'Unrecognised molec_id, local_iso_id =', trans.molec_id,\
-                                                   trans.local_iso_id
-    return None, None, None, None
-
-def get_case_module(molec_id, local_iso_id):
-    if molec_id in (5, 14, 15, 16, 17, 22, 36, 46):
-        return hcase_dcs
-    elif molec_id in (1, 3, 9, 21, 31, 37):
-        return hcase_nltcs
-    elif molec_id in (2, 4, 19, 23):
-        return hcase_ltcs
-    elif molec_id == 6:
-        if local_iso_id in (1, 2):
-            return hcase_sphcs
-        elif local_iso_id in (3, 4):
-            return hcase_stcs
-    elif molec_id == 42:
-            return hcase_sphcs
-    elif molec_id == 7:
-        return hcase_hundb
-    elif molec_id in (11, 28):
-        return hcase_pyrtet
-    elif molec_id in (24, 27, 39, 40, 41):
-        return hcase_stcs
-    elif molec_id in (12, 20, 25, 29, 32, 38):
-        return hcase_asymcs
-    elif molec_id in (10, 33):
-        return hcase_nltos
-    elif molec_id in (8, 13, 18):
-        return hcase_hunda
-    elif molec_id in (26, 44):
-        return hcase_lpcs
-
-    print 'Unrecognised molec_id, local_iso_id =', molec_id, local_iso_id
-    return None
+    # the upper state is in the ground electronic state, except for the
+    # OH A(2Sigma+)-X(2Pi) transitions in the UV; the lower state is always
+    # in the ground electronic state
+    ElecStateLabelp = 'X'
+    if trans.molec_id == 13 and trans.nu.val > 25000.:
+        ElecStateLabelp = 'A'
+    case_module, CaseClassp = get_case(trans.molec_id, trans.local_iso_id,
+                                       ElecStateLabelp)
+    if case_module is None:
+        return None, None, None, None
+    CaseClasspp = CaseClassp
+    if ElecStateLabelp != 'X':
+        CaseClasspp = get_case(trans.molec_id, trans.local_iso_id)[1]
+
+    qnsp, qnspp, multipole = case_module.parse_qns(trans)
+    statep = CaseClassp(trans.molec_id, trans.local_iso_id,
+                        trans.global_iso_id, trans.Eupper, None,
+                        trans.gp, qnsp)
+    statepp = CaseClasspp(trans.molec_id, trans.local_iso_id,
+                          trans.global_iso_id, trans.Elower, None,
+                          trans.gpp, qnspp)
+    return case_module, statep, statepp, multipole
+
+def get_case_module(molec_id, local_iso_id, ElecStateLabel='X'):
+    """
+    Return the case module that understands the HITRAN .par file's format
+    of the quantum numbers of transitions to the electronic state
+    ElecStateLabel of the given isotopologue.
+
+    """
+
+    return get_case(molec_id, local_iso_id, ElecStateLabel)[0]
 
 def get_case_class(molec_id, local_iso_id, ElecStateLabel='X'):
-    if molec_id in (5, 14, 15, 16, 17, 22, 36, 46):
-        return hdcs.HDcs
-    elif molec_id in (1, 3, 9, 21, 31, 37):
-        return hnltcs.HNltcs
-    elif molec_id in (2, 4, 19, 23):
-        return hltcs.HLtcs
-    elif molec_id == 6:
-        if local_iso_id in (1, 2):
-            return hsphcs.HSphcs
-        elif local_iso_id in (3, 4):
-            return hstcs.HStcs
-    elif molec_id == 42:
-            return hsphcs.HSphcs
-    elif molec_id == 7:
-        return hhundb.HHundB
-    elif molec_id in (11, 24, 27, 28, 39, 40, 41):
-        return hstcs.HStcs
-    elif molec_id in (12, 20, 25, 29, 32, 38):
-        return hasymcs.HAsymcs
-    elif molec_id in (10, 33):
-        return hnltos.HNltos
-    elif molec_id in (8, 18):
-        return hhunda.HHundA
-    elif molec_id in (26, 44):
-        return hlpcs.HLpcs
-    elif molec_id == 13:
-        if ElecStateLabel == 'A':
-            # OH A(2Sigma+) is Hund's case (b)
-            return hhundb.HHundB
-        # OH X(2Pi) is Hund's case (a)
-        return hhunda.HHundA
-
-    print 'Unrecognised molec_id, local_iso_id =', molec_id, local_iso_id
-    return None
+    """
+    Return the derived class of State describing the states of the given
+    isotopologue in the electronic state ElecStateLabel.
+
+    """
 
+    return get_case(molec_id, local_iso_id, ElecStateLabel)[1]
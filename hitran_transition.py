@@ -12,6 +12,7 @@
 from lbl.transition import Transition
 from lbl.state import State
 from hitran_param import HITRANParam
+from field_codec import get_converter
 import hitran_meta
 import xn_utils
 
@@ -89,90 +90,23 @@ class HITRANTransition(Transition):
             # blank line
             return None
 
-        this_trans = HITRANTransition()
-        this_trans.par_line = line
-
         Ierr = line[127:133]
         Iref = line[133:145]
-        
-        try:
-            # HITRAN molecule ID
-            this_trans.molec_id = int(line[:2])
-            # HITRAN isotopologue ID
-            this_trans.local_iso_id = int(line[2])
-            # vacuum wavenumber (cm-1)
-            this_trans.nu = HITRANParam(val=float(line[3:15]),
-                ref=int(Iref[:2]), name='nu', ierr=int(Ierr[0]))
-
-            # line intensity at 296 K(cm-1/(molec.cm-2). NB in the native
-            # HITRAN format, this is weighted by isotopologue abundance
-            this_trans.Sw = HITRANParam(val=float(line[15:25]),
-                ref=int(Iref[2:4]), name='Sw', ierr=int(Ierr[1]),
-                relative=True)
-
-            # Einstein A-coefficient (s-1)
-            this_trans.A = HITRANParam(val=float(line[25:35]),
-                ref=int(Iref[2:4]), name='A', ierr=int(Ierr[1]), relative=True)
-            # air-broadened HWHM at 296 K (cm-1.atm-1)
-            this_trans.gamma_air = HITRANParam(val=float(line[35:40]),
-                ref=int(Iref[4:6]), name='gamma_air', ierr=int(Ierr[2]),
-                relative=True)
-            # self-broadened HWHM at 296 K (cm-1.atm-1)
-            if line[40:45] != '0.000':
-                this_trans.gamma_self = HITRANParam(val=float(line[40:45]),
-                    ref=int(Iref[6:8]), name='gamma_self', ierr=int(Ierr[3]),
-                    relative=True)
-            # lower-state energy (cm-1)
-            this_trans.Elower = float(line[45:55])
-            # missing lower state energies are indicated by -1.
-            if this_trans.Elower < 0.:
-                this_trans.Elower = None
-            # deduce the upper state energy because nu = Ep - Epp
-            if this_trans.Elower is not None:
-                this_trans.set_Eupper()
-            # T-dependence exponent for gamma_air
-            this_trans.n_air = HITRANParam(val=float(line[55:59]),
-                ref=int(Iref[8:10]), name='n_air', ierr=int(Ierr[4]),
-                relative=True)
-            # air pressure-induced line shift at 296 K (cm-1.atm-1)
-            # NB missing data is presented as '0.000000'
-            if line[59:67] != '0.000000':
-                this_trans.delta_air = HITRANParam(val=float(line[59:67]),
-                    ref=int(Iref[10:12]), name='delta_air', ierr=int(Ierr[5]))
-
-            # line-mixing flag
-            if line[145] != ' ':
-                this_trans.flag = line[145]
 
+        try:
             # statistical weights for the upper (gp) and lower (gpp) states
-            # NB for some reason, these are given as floats. Cast them to
-            # integers, but only save them if they are physically meaningful
-            gp = int(float(line[146:153]) + 0.1)
-            if gp > 0:
-                this_trans.gp = gp
-            gpp = int(float(line[153:160]) + 0.1)
-            if gpp > 0:
-                this_trans.gpp = gpp
-
-            # global (V) and local (Q) quantum numbers
-            this_trans.Vp = line[67:82]
-            this_trans.Vpp = line[82:97]
-            this_trans.Qp = line[97:112]
-            this_trans.Qpp = line[112:127]
-
-            # parse the quantum numbers into State objects and attach them
-            # to the transition; also determine the transition multipole and
-            # get a reference to the appropriate HITRAN case module (which
-            # implements the get_hitran_quanta() method for writing the
-            # states out in the native HITRAN .par format
-            this_trans.case_module, this_trans.statep, this_trans.statepp,\
-                this_trans.multipole = hitran_meta.get_states(this_trans)
-
-            # XXX error and reference indices
-            #this_trans.Ierr = line[127:133]
-            #this_trans.parse_Ierr()
-            #this_trans.Iref = line[133:145]
-            #this_trans.parse_Iref()
+            # NB for some reason, these are given as floats: cast them to
+            # integers
+            this_trans = HITRANTransition.from_par_fields(line,
+                molec_id=int(line[:2]), local_iso_id=int(line[2]),
+                nu=float(line[3:15]), Sw=float(line[15:25]),
+                A=float(line[25:35]), gamma_air=float(line[35:40]),
+                gamma_self=float(line[40:45]), Elower=float(line[45:55]),
+                n_air=float(line[55:59]), delta_air=float(line[59:67]),
+                ierr=[int(c) for c in Ierr],
+                iref=[int(Iref[i:i+2]) for i in range(0, 12, 2)],
+                gp=int(float(line[146:153]) + 0.1),
+                gpp=int(float(line[153:160]) + 0.1))
 
         except Exception, e:
             print 'parse error in parse_par_line'
@@ -184,6 +118,128 @@ class HITRANTransition(Transition):
 
         return this_trans
 
+    @classmethod
+    def parse_par_record(self, rec):
+        """
+        Construct and return a HITRANTransition from rec, a record of the
+        structured array returned by the par_reader module, whose fields
+        have already been converted from their .par strings. The result is
+        the same as that of parse_par_line(rec['par_line']).
+
+        """
+
+        try:
+            this_trans = HITRANTransition.from_par_fields(rec['par_line'],
+                molec_id=int(rec['molec_id']),
+                local_iso_id=int(rec['local_iso_id']),
+                nu=float(rec['nu']), Sw=float(rec['Sw']), A=float(rec['A']),
+                gamma_air=float(rec['gamma_air']),
+                gamma_self=float(rec['gamma_self']),
+                Elower=float(rec['Elower']), n_air=float(rec['n_air']),
+                delta_air=float(rec['delta_air']),
+                ierr=[int(x) for x in rec['ierr']],
+                iref=[int(x) for x in rec['iref']],
+                gp=int(rec['gp']), gpp=int(rec['gpp']))
+
+        except Exception, e:
+            print 'parse error in parse_par_record'
+            print e
+            print 'The bad line was:'
+            print rec['par_line']
+            raise
+
+        return this_trans
+
+    @classmethod
+    def from_par_fields(self, line, molec_id, local_iso_id, nu, Sw, A,
+                        gamma_air, gamma_self, Elower, n_air, delta_air,
+                        ierr, iref, gp, gpp):
+        """
+        Construct and return a HITRANTransition from the .par line, line,
+        and the values of its numerical fields, already converted (by
+        parse_par_line or parse_par_record): ierr and iref are the six
+        error and reference codes, in the order of the .par file, and gp
+        and gpp the integer statistical weights. Missing values are
+        recognised from their strings in line.
+
+        """
+
+        this_trans = HITRANTransition()
+        this_trans.par_line = line
+
+        # HITRAN molecule ID
+        this_trans.molec_id = molec_id
+        # HITRAN isotopologue ID
+        this_trans.local_iso_id = local_iso_id
+        # vacuum wavenumber (cm-1)
+        this_trans.nu = HITRANParam(val=nu, ref=iref[0], name='nu',
+                                    ierr=ierr[0])
+
+        # line intensity at 296 K(cm-1/(molec.cm-2). NB in the native
+        # HITRAN format, this is weighted by isotopologue abundance
+        this_trans.Sw = HITRANParam(val=Sw, ref=iref[1], name='Sw',
+                                    ierr=ierr[1], relative=True)
+
+        # Einstein A-coefficient (s-1)
+        this_trans.A = HITRANParam(val=A, ref=iref[1], name='A',
+                                   ierr=ierr[1], relative=True)
+        # air-broadened HWHM at 296 K (cm-1.atm-1)
+        this_trans.gamma_air = HITRANParam(val=gamma_air, ref=iref[2],
+                        name='gamma_air', ierr=ierr[2], relative=True)
+        # self-broadened HWHM at 296 K (cm-1.atm-1)
+        if line[40:45] != '0.000':
+            this_trans.gamma_self = HITRANParam(val=gamma_self, ref=iref[3],
+                        name='gamma_self', ierr=ierr[3], relative=True)
+        # lower-state energy (cm-1)
+        this_trans.Elower = Elower
+        # missing lower state energies are indicated by -1.
+        if this_trans.Elower < 0.:
+            this_trans.Elower = None
+        # deduce the upper state energy because nu = Ep - Epp
+        if this_trans.Elower is not None:
+            this_trans.set_Eupper()
+        # T-dependence exponent for gamma_air
+        this_trans.n_air = HITRANParam(val=n_air, ref=iref[4], name='n_air',
+                                       ierr=ierr[4], relative=True)
+        # air pressure-induced line shift at 296 K (cm-1.atm-1)
+        # NB missing data is presented as '0.000000'
+        if line[59:67] != '0.000000':
+            this_trans.delta_air = HITRANParam(val=delta_air, ref=iref[5],
+                                        name='delta_air', ierr=ierr[5])
+
+        # line-mixing flag
+        if line[145] != ' ':
+            this_trans.flag = line[145]
+
+        # statistical weights for the upper (gp) and lower (gpp) states:
+        # only save them if they are physically meaningful
+        if gp > 0:
+            this_trans.gp = gp
+        if gpp > 0:
+            this_trans.gpp = gpp
+
+        # global (V) and local (Q) quantum numbers
+        this_trans.Vp = line[67:82]
+        this_trans.Vpp = line[82:97]
+        this_trans.Qp = line[97:112]
+        this_trans.Qpp = line[112:127]
+
+        # parse the quantum numbers into State objects and attach them
+        # to the transition; also determine the transition multipole and
+        # get a reference to the appropriate HITRAN case module (which
+        # implements the get_hitran_quanta() method for writing the
+        # states out in the native HITRAN .par format
+        this_trans.case_module, this_trans.statep, this_trans.statepp,\
+            this_trans.multipole = hitran_meta.get_states(this_trans)
+
+        # XXX error and reference indices
+        #this_trans.Ierr = line[127:133]
+        #this_trans.parse_Ierr()
+        #this_trans.Iref = line[133:145]
+        #this_trans.parse_Iref()
+
+        return this_trans
+
     def statep_get(self, qn_name, default=None):
         """
         Get the value of quantum number qn_name for the upper state. If
@@ -282,16 +338,22 @@ class HITRANTransition(Transition):
         """
         Set the parameter prm_name (e.g. 'multipole', 'nu.val',
         'nu.err', 'nu.ref'), making the conversion to int, float or string
-        according to the format fmt.
+        according to the format fmt. To read a whole line of fields, use
+        field_codec.read_trans instead.
 
         """
 
-        try:
-            #print 'self.%s = %s' % (prm_name, xn_utils.conv_str(fmt, prm_val))
-            exec('self.%s = %s' % (prm_name,
-                xn_utils.conv_str(fmt, prm_val)))
-        except ValueError:
-            exec('self.%s = None' % prm_name)
+        obj = self
+        attrs = prm_name.split('.')
+        for attr in attrs[:-1]:
+            obj = getattr(obj, attr)
+        converter = get_converter(fmt)
+        if converter is not None:
+            try:
+                prm_val = converter(prm_val)
+            except ValueError:
+                prm_val = None
+        setattr(obj, attrs[-1], prm_val)
 
     def get_param_attr(self, prm_name, attr):
         """
@@ -301,6 +363,6 @@ class HITRANTransition(Transition):
         """
 
         try:
-            return eval('self.%s.%s' % (prm_name, attr))
+            return getattr(getattr(self, prm_name), attr)
         except AttributeError:
             return None
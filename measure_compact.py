@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# measure_compact.py
+
+# Measure the memory taken up by the transitions parsed from a .par file
+# when held as HITRANTransitions and as CompactHITRANTransitions (see
+# hitran_compact.py), and check that the compact transitions reproduce the
+# .par lines they came from.
+# Usage:
+#   measure_compact.py <par_file> [<max_lines>]
+
+import sys
+import gc
+import types
+
+from hitran_transition import HITRANTransition
+from hitran_compact import CompactHITRANTransition
+
+# the objects shared by every instance of a class rather than belonging to
+# any one of them
+shared_types = (type, types.ClassType, types.ModuleType, types.FunctionType,
+                types.BuiltinFunctionType, types.MethodType)
+
+def deep_sizeof(obj, seen):
+    """
+    Return the total size in bytes of obj and all the objects it refers to
+    which haven't already been counted (their ids are in the set seen).
+    Classes, modules and functions are not counted.
+
+    """
+
+    size = 0
+    pending = [obj]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, shared_types):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return size
+
+def total_sizeof(objs):
+    """
+    Return the total size in bytes of the objects in the list objs and
+    everything they refer to, counting each object only once.
+
+    """
+
+    seen = set([id(objs)])
+    return sum([deep_sizeof(obj, seen) for obj in objs])
+
+par_file = sys.argv[1]
+max_lines = None
+if len(sys.argv) > 2:
+    max_lines = int(sys.argv[2])
+
+trans = []
+for line in open(par_file, 'r'):
+    line = line.rstrip('\r\n')
+    if not line:
+        continue
+    trans.append(HITRANTransition.parse_par_line(line))
+    if len(trans) == max_lines:
+        break
+ntrans = len(trans)
+if not ntrans:
+    print 'no transitions read from', par_file
+    sys.exit(1)
+
+compact_trans = [CompactHITRANTransition.from_transition(this_trans)
+                 for this_trans in trans]
+nbad = 0
+for this_trans in compact_trans:
+    if not this_trans.validate_as_par():
+        nbad += 1
+print '%d transitions read from %s' % (ntrans, par_file)
+print '%d compact transitions failed to reproduce their .par line' % nbad
+
+full_size = total_sizeof(trans)
+compact_size = total_sizeof(compact_trans)
+print 'HITRANTransition: %d bytes (%.0f bytes per transition)'\
+            % (full_size, float(full_size) / ntrans)
+print 'CompactHITRANTransition: %d bytes (%.0f bytes per transition)'\
+            % (compact_size, float(compact_size) / ntrans)
+print 'saving: %.1f x' % (float(full_size) / compact_size)
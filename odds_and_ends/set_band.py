@@ -8,6 +8,10 @@
 import os
 import sys
 import re
+HOME = os.getenv('HOME')
+PYHAWKS_PATH = os.path.join(HOME, 'research/HITRAN/pyHAWKS')
+sys.path.append(PYHAWKS_PATH)
+from db_stream import iter_queryset
 SETTINGS_PATH = '/Users/christian/research/VAMDC/HITRAN/django/HITRAN'
 # Django needs to know where to find the HITRAN project's settings.py:
 sys.path.append(SETTINGS_PATH)
@@ -96,19 +100,15 @@ def get_s_v(v_qns):
         return '0'
     return '+'.join(l_v)
 
-# get all of the transitions for all of the isotopologues of our molecule
-transitions = Trans.objects.filter(iso__in=isos)
-ntrans = transitions.count()
-print ntrans, 'transitions retrieved.'
-i=0; last_pd = pd = 0
-for transition in transitions:
-    # progress indicator
-    i += 1
-    pd = int(float(i)/ntrans*100)
-    if pd > last_pd:
-        print pd,'%'
-        last_pd = pd
+def print_progress(n):
+    """ Progress indicator: the number of transitions retrieved so far. """
+    print n, 'transitions retrieved.'
 
+# get all of the transitions for all of the isotopologues of our molecule,
+# a chunk at a time, with their states
+transitions = Trans.objects.filter(iso__in=isos)\
+                           .select_related('statep', 'statepp')
+for transition in iter_queryset(transitions, progress=print_progress):
     # get upper and lower vibrational state strings ...
     vp = get_vib_qns(transition.statep)
     s_vp = get_s_v(vp)
@@ -10,11 +10,14 @@ SETTINGS_PATH = '/Users/christian/research/VAMDC/HITRAN/django/HITRAN'
 # Django needs to know where to find the HITRAN project's settings.py:
 sys.path.append(SETTINGS_PATH)
 os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+PYHAWKS_PATH = os.path.join(HOME, 'research/HITRAN/pyHAWKS')
+sys.path.append(PYHAWKS_PATH)
 
 from django.db import connection
 from hitranmeta.models import Iso
 from hitranlbl.models import Trans
 import xn_utils
+from db_stream import iter_queryset
 
 branch = {'R': 1, 'P': -1, 1: 'R', -1: 'P'}
 
@@ -27,8 +30,7 @@ SDV_filename = os.path.join(HITRAN_PATH,
 
 isos = Iso.objects.filter(pk__in=iso_ids)
 trans = Trans.objects.filter(iso__in=isos).filter(valid_from=date)\
-                    .filter(band="2v1-0").order_by('nu')
-print trans.count(),'transitions found'
+                    .filter(band="2v1-0")
 
 lines = {}
 with open(SDV_filename, 'r') as fi:
@@ -40,7 +42,7 @@ with open(SDV_filename, 'r') as fi:
         lines[line[:57]] = line
 
 trans_dict = {}
-for t in trans:
+for t in iter_queryset(trans):
     vp = 2; vpp = 0
     Jpp = int(t.statepp.qns_set.get(qn_name='J').qn_val)
     Jp = int(t.statep.qns_set.get(qn_name='J').qn_val)
@@ -48,6 +50,7 @@ for t in trans:
     key = '%2d%1d              2              0                    '\
           '%1s%3d' % (t.iso.molecule_id, t.iso.isoID, branch[Jp-Jpp], Jpp)
     trans_dict[key] = t
+print len(trans_dict),'transitions found'
     
 for key, t in trans_dict.items():
     try:
@@ -10,10 +10,13 @@ SETTINGS_PATH = '/Users/christian/research/VAMDC/HITRAN/django/HITRAN'
 # Django needs to know where to find the HITRAN project's settings.py:
 sys.path.append(SETTINGS_PATH)
 os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+PYHAWKS_PATH = os.path.join(HOME, 'research/HITRAN/pyHAWKS')
+sys.path.append(PYHAWKS_PATH)
 
 from django.db import connection
 from hitranmeta.models import Iso
 from hitranlbl.models import Trans
+from db_stream import iter_queryset
 
 cursor = connection.cursor()
 
@@ -37,13 +40,13 @@ else:
     sys.exit(1)
 
 isos = Iso.objects.filter(pk__in=iso_ids)
-trans = Trans.objects.filter(iso__in=isos).filter(valid_from=date)\
-                    .order_by('nu')
-print trans.count(),'transitions found'
+trans = Trans.objects.filter(iso__in=isos).filter(valid_from=date)
 
 with open(G_filename, 'r') as fi:
     fi.readline()   # throw away header    
-    for t in trans:
+    ntrans = 0
+    for t in iter_queryset(trans):
+        ntrans += 1
         key = '%2d%1d%30s' % (t.iso.molecule_id, int(t.par_line[2]),\
                           t.par_line[67:127])
         line = fi.readline().strip()
@@ -63,4 +66,5 @@ with open(G_filename, 'r') as fi:
             command = 'INSERT INTO prm_zG_air (trans_id, val) VALUES (%d, %f)'\
                             % (t.id, zG_air)
             cursor.execute(command)
+print ntrans,'transitions found'
 connection.commit()
@@ -8,16 +8,357 @@
 import os
 import sys
 import time
+import itertools
+import collections
+import multiprocessing
 
 from pyHAWKS_config import SETTINGS_PATH, HITRAN1986_SOURCEID
 from hitran_transition import HITRANTransition
+from hitran_cases.hcase_globals import quanta_cache_stats,\
+                                       reset_quanta_cache_stats
+from par_reader import iter_par_batches, par_chunks, par_lines_to_array,\
+                       iter_par_line_chunks
+from compressed_io import get_compression, open_file
+from state_index import open_state_index
 from xn_utils import vprint
 from fmt_xn import trans_fields
+from field_codec import write_trans_prms, to_trans_prms_record
+from trans_binary import BinaryTransWriter
 # Django needs to know where to find the HITRAN project's settings.py:
 sys.path.append(SETTINGS_PATH)
 os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
 from hitranlbl.models import State
 
+def read_transitions(par_file, start=0, end=None, progress=True,
+                     batch_size=10000):
+    """
+    Generate the HITRANTransitions parsed from the .par file par_file, in
+    the order in which they appear, from the lines between the byte offsets
+    start and end (by default, the whole file). The file is read in batches
+    of batch_size lines, so it is never held in memory in its entirety;
+    since the number of lines isn't known up front, if progress is True,
+    progress is reported as the percentage of the bytes read so far (but
+    not for a compressed file, whose decompressed size isn't known).
+
+    """
+
+    if get_compression(par_file):
+        progress = False
+    elif end is None:
+        end = os.path.getsize(par_file)
+    nbytes_total = float((end or 0) - start) or 1.
+    nbytes_read = [0]
+    def set_nbytes_read(nbytes):
+        nbytes_read[0] = nbytes
+
+    percent_done = 0; percent_increment = 1     # for the progress indicator
+    for records in iter_par_batches(par_file, batch_size, set_nbytes_read,
+                                    start, end):
+        for rec in records:
+            yield HITRANTransition.parse_par_record(rec)
+
+        # progress indicator, as a percentage
+        if progress:
+            percent = nbytes_read[0] / nbytes_total * 100.
+            while percent - percent_done > percent_increment:
+                vprint('%d %%' % percent_done, 1)
+                percent_done += percent_increment
+
+def prepare_transition(trans, global_iso_ids, molecule, source_ids,
+                       binary=False):
+    """
+    Do everything to the HITRANTransition trans that doesn't depend on the
+    IDs of its states: set its global isotopologue ID and the source_ids
+    of its parameters (from the table source_ids, see
+    get_source_id_table). Return a tuple of its wavenumber, the string
+    representations of its upper and lower states, and its .trans file
+    representation without the leading stateIDp and stateIDpp fields (as
+    a binary record if binary is True, see trans_binary.py).
+
+    """
+
+    # set the global (ie database-wide) ID for the isotopologue in
+    # the transition and its upper and lower state objects
+    trans.global_iso_id = global_iso_ids[(trans.molec_id, trans.local_iso_id)]
+    trans.statep.global_iso_id  = trans.global_iso_id
+    trans.statepp.global_iso_id = trans.global_iso_id
+
+    set_source_ids(trans, molecule, source_ids)
+
+    if binary:
+        trans_prms = to_trans_prms_record(trans)
+    else:
+        trans_prms = write_trans_prms(trans)
+    return (trans.nu.val, trans.statep.str_rep(), trans.statepp.str_rep(),
+            trans_prms)
+
+def prepare_transitions(args, molecule, source_ids):
+    """
+    Generate the prepared transitions (see prepare_transition) from the
+    whole of args.par_file, in order, in this process.
+
+    """
+
+    for trans in read_transitions(args.par_file):
+        yield prepare_transition(trans, args.global_iso_ids, molecule,
+                                 source_ids, args.binary)
+
+def read_transitions_from_lines(lines):
+    """
+    Generate the HITRANTransitions parsed from the list of .par lines,
+    lines, in order.
+
+    """
+
+    for rec in par_lines_to_array(lines):
+        yield HITRANTransition.parse_par_record(rec)
+
+# the arguments to prepare_transition, set in each worker process of the
+# pool used by prepare_transitions_parallel
+chunk_worker_args = None
+
+def init_chunk_worker(par_file, global_iso_ids, molecule, source_ids,
+                      binary):
+    """ Initialize a worker process of the pool of chunk parsers. """
+    global chunk_worker_args
+    chunk_worker_args = (par_file, global_iso_ids, molecule, source_ids,
+                         binary)
+
+def prepare_chunk(chunk):
+    """
+    Parse and prepare the transitions from the lines of the .par file
+    between the byte offsets chunk = (start, end), or from the list of lines
+    chunk (for a compressed .par file), returning them as a list,
+    together with the quanta cache statistics for the chunk (see
+    quanta_cache_stats). This is run in a worker process: if a fatal error
+    occurs, it has already been reported and None is returned.
+
+    """
+
+    par_file, global_iso_ids, molecule, source_ids, binary = chunk_worker_args
+    if isinstance(chunk, tuple):
+        start, end = chunk
+        transitions = read_transitions(par_file, start, end, False)
+    else:
+        transitions = read_transitions_from_lines(chunk)
+    reset_quanta_cache_stats()
+    try:
+        prepared = [prepare_transition(trans, global_iso_ids, molecule,
+                                       source_ids, binary)
+                    for trans in transitions]
+    except SystemExit:
+        return None
+    return prepared, quanta_cache_stats()
+
+def add_cache_stats(cache_stats, stats):
+    """
+    Add the quanta cache statistics stats, a list of (name, hits, misses)
+    tuples, to the dictionary cache_stats, keyed by cache name.
+
+    """
+
+    for name, hits, misses in stats:
+        total_hits, total_misses = cache_stats.get(name, (0, 0))
+        cache_stats[name] = (total_hits + hits, total_misses + misses)
+
+def prepare_transitions_parallel(args, molecule, source_ids, cache_stats):
+    """
+    Generate the prepared transitions (see prepare_transition) from
+    args.par_file, in order, by dividing the file into chunks of lines and
+    parsing them in a pool of args.jobs worker processes. At most two
+    chunks per worker are in hand at any one time, so memory use is bounded.
+    The workers' quanta cache statistics are added to cache_stats.
+    A compressed .par file can't be divided up by byte offsets, so it is
+    read here, in a stream, and the chunks of lines themselves are handed
+    to the workers.
+
+    """
+
+    compressed = get_compression(args.par_file)
+    if compressed:
+        chunks = iter_par_line_chunks(args.par_file)
+        vprint('parsing %s in chunks in %d processes'
+                    % (args.par_file, args.jobs))
+    else:
+        chunks = par_chunks(args.par_file)
+        vprint('parsing %d chunks in %d processes' % (len(chunks), args.jobs))
+        par_size = float(os.path.getsize(args.par_file)) or 1.
+    pool = multiprocessing.Pool(args.jobs, init_chunk_worker,
+                    (args.par_file, args.global_iso_ids, molecule, source_ids,
+                     args.binary))
+
+    pending = collections.deque()
+    ichunks = iter(chunks)
+    for chunk in itertools.islice(ichunks, 2 * args.jobs):
+        pending.append((chunk, pool.apply_async(prepare_chunk, (chunk,))))
+
+    percent_done = 0; percent_increment = 1     # for the progress indicator
+    try:
+        while pending:
+            # the results are taken in the order of the chunks in the file
+            chunk, result = pending.popleft()
+            result = result.get()
+            if result is None:
+                sys.exit(1)
+            prepared, stats = result
+            add_cache_stats(cache_stats, stats)
+            for next_chunk in itertools.islice(ichunks, 1):
+                pending.append((next_chunk, pool.apply_async(prepare_chunk,
+                                                             (next_chunk,))))
+
+            for item in prepared:
+                yield item
+
+            # progress indicator, as a percentage (unless the .par file is
+            # compressed, when its decompressed size isn't known)
+            if not compressed:
+                percent = chunk[1] / par_size * 100.
+                while percent - percent_done > percent_increment:
+                    vprint('%d %%' % percent_done, 1)
+                    percent_done += percent_increment
+    except:
+        # a worker failed (or we were stopped): the others needn't go on
+        pool.terminate()
+        raise
+
+    pool.close()
+    pool.join()
+
+def check_nu_order(prepared, par_file):
+    """
+    Pass on the prepared transitions from the iterable prepared, exiting
+    with an error if they are found not to be in order of increasing
+    wavenumber.
+
+    """
+
+    last_nu = 0.    # the previous wavenumber read in
+    for item in prepared:
+        if item[0] < last_nu:
+            vprint('Error: %s transitions file isn\'t ordered by nu.'\
+                    % par_file, 5)
+            sys.exit(1)
+        last_nu = item[0]
+        yield item
+
+def assign_stateIDs(prepared, state_index, first_stateID, binary=False):
+    """
+    Assign the upper and lower state IDs of each of the prepared
+    transitions from the iterable prepared, looking their states up by
+    string representation in the StateIndex state_index. States not
+    already in state_index are new: they are assigned IDs in sequence,
+    starting at first_stateID, and added to state_index.
+    Generates tuples of (s_trans, new_states) where s_trans is the line
+    for the .trans file (or its record, if binary is True) and new_states
+    is a list of the string representations of the states first seen in
+    this transition.
+
+    """
+
+    stateIDp_fmt, stateIDpp_fmt = trans_fields[0].fmt, trans_fields[1].fmt
+    stateID = first_stateID
+    for nu, statep_str_rep, statepp_str_rep, s_trans_prms in prepared:
+        new_states = []
+        # first deal with the upper state: see if it's in our index
+        stateIDp = state_index.get(statep_str_rep)
+        if stateIDp is None:
+            # the upper state is new: assign it an ID and save it
+            stateIDp = stateID
+            state_index.add(statep_str_rep, stateID)
+            stateID += 1
+            new_states.append(statep_str_rep)
+
+        # next deal with the lower state: see if it's in our index
+        stateIDpp = state_index.get(statepp_str_rep)
+        if stateIDpp is None:
+            # the lower state is new: assign it an ID and save it
+            stateIDpp = stateID
+            state_index.add(statepp_str_rep, stateID)
+            stateID += 1
+            new_states.append(statepp_str_rep)
+
+        if binary:
+            yield (stateIDp, stateIDpp) + s_trans_prms, new_states
+            continue
+        s_trans = ','.join([stateIDp_fmt % stateIDp, stateIDpp_fmt % stateIDpp,
+                            s_trans_prms])
+        yield s_trans, new_states
+
+# the parameters whose references are given, as 2-character fields, at
+# character positions 134-146 of the 160-byte par_line, in order, and the
+# HITRANTransition attributes for which each reference is the source
+ref_prm_names = ('nu', 'S', 'gamma_air', 'gamma_self', 'n_air', 'delta_air')
+ref_prm_attrs = (('nu',), ('Sw', 'A'), ('gamma_air',), ('gamma_self',),
+                 ('n_air',), ('delta_air',))
+# the largest reference id which fits in a 2-character field
+MAX_IREF = 99
+
+def get_sref(molecule, prm_name, iref):
+    """
+    Return the HITRAN-style source identifier for reference iref to
+    parameter prm_name of molecule, as <molecule_name>-<prm_name>-<id>,
+    which is the refID of the corresponding row of hitranmeta_refs_map.
+
+    """
+
+    sref = '%s-%s-%d' % (molecule.ordinary_formula, prm_name, iref)
+    # we can't use '+' in XML attributes, so replace with 'p'
+    return sref.replace('+', 'p')
+
+def get_source_id_table(molecule, d_refs):
+    """
+    Resolve every reference id that can appear in a .par line for molecule
+    to the primary key of its Source in the hitranmeta_source table, using
+    d_refs, the dictionary of hitranmeta_refs_map objects keyed by refID.
+    Returns a list of lists, indexed by the parameter's position in
+    ref_prm_names and then by reference id, of source_ids, with None for
+    the references which are missing from hitranmeta_refs_map.
+
+    """
+
+    source_ids = []
+    for prm_name in ref_prm_names:
+        # don't worry about missing 0 refs (which default to the
+        # HITRAN 1986 paper)
+        prm_source_ids = [HITRAN1986_SOURCEID]
+        for iref in range(1, MAX_IREF+1):
+            ref = d_refs.get(get_sref(molecule, prm_name, iref))
+            if ref is None:
+                prm_source_ids.append(None)
+            else:
+                prm_source_ids.append(ref.source_id)
+        source_ids.append(prm_source_ids)
+    return source_ids
+
+def set_source_ids(trans, molecule, source_ids):
+    """
+    Set the source_id of each of the parameters of trans, looking it up
+    by reference id in the table source_ids (see get_source_id_table). If
+    a reference is missing from the tables hitranmeta_refs_map and
+    hitranmeta_source, this is fatal, so we exit.
+
+    """
+
+    par_line = trans.par_line
+    for j, prm_attrs in enumerate(ref_prm_attrs):
+        iref = int(par_line[133+2*j:135+2*j])
+        source_id = None
+        if iref >= 0:
+            source_id = source_ids[j][iref]
+        if source_id is None:
+            # Oops - missing reference: bail.
+            print 'missing reference for %s in hitranmeta_refs_map'\
+                  ' table' % get_sref(molecule, ref_prm_names[j], iref)
+            sys.exit(1)
+
+        # Assign the source_id to the parameter object(s)
+        for prm_attr in prm_attrs:
+            prm = getattr(trans, prm_attr, None)
+            # no parameter object exists if e.g. delta_air=0. and none was
+            # created, but it's fine- we just move on
+            if prm is not None:
+                prm.source_id = source_id
+
 def parse_par(args, molecule, isos, d_refs):
     """
     Parse the input .par file, args.par_file, into normalized .states and
@@ -27,18 +368,25 @@ def parse_par(args, molecule, isos, d_refs):
     handling is done upon staging the upload.
     NB the input .par file must be in order of increasing wavenumber
     (an error is raised if this is found not to be the case).
+    The .par file is streamed through a chain of generators (parse -> check
+    order -> assign state IDs), and each transition and new state is
+    written out as soon as it has been processed, so memory use doesn't
+    grow with the number of lines. If args.jobs > 1, the parsing is done
+    in that many processes, but the state IDs are still assigned in file
+    order, so the output is the same as for a single process.
 
     """
 
     # get all of the states for this molecule currently in the database
-    # as their string representations - these are the keys to the db_stateIDs
-    # dictionary, with the corresponding database State ids as their values
-    db_stateIDs = {}
-    for state in State.objects.filter(iso__in=isos):
-        db_stateIDs[state.str_rep()] = state.id
+    # as their string representations - these are indexed (by digest) in
+    # state_index, with the corresponding database State ids as their values;
+    # the index is kept in args.state_index_file between runs, and only
+    # read from the database if it is missing or stale
+    state_index = open_state_index(args.state_index_file,
+                                   State.objects.filter(iso__in=isos))
                                 
     vprint('%d existing states for %s read in from database'\
-                % (len(db_stateIDs), molecule.ordinary_formula))
+                % (len(state_index), molecule.ordinary_formula))
 
     vprint('Creating .trans and .states files...')
     vprint('%s\n-> %s\n   %s'\
@@ -51,13 +399,6 @@ def parse_par(args, molecule, isos, d_refs):
                 vprint('File exists:\n%s\nAborting.' % filename, 5)
                 sys.exit(1)
 
-    # read the lines and rstrip them of the EOL characters. We don't lstrip
-    # because we keep the space in front of molec_ids 1-9
-    vprint('reading .par lines from %s ...' % args.par_file)
-    lines = [x.rstrip() for x in open(args.par_file, 'r').readlines()]
-    ntrans = len(lines)
-    vprint('%d lines read in' % ntrans)
-
     # find out the state ID at which we can start adding states
     try:
         first_stateID = State.objects.all().order_by('-id')[0].id + 1
@@ -66,124 +407,51 @@ def parse_par(args, molecule, isos, d_refs):
         first_stateID = 1
     vprint('new states will be added with ids starting at %d' % first_stateID)
 
-    fo_s = open(args.states_file, 'w')
-    fo_t = open(args.trans_file, 'w')
+    fo_s = open_file(args.states_file, 'w')
+    if args.binary:
+        fo_t = BinaryTransWriter(args.trans_file)
+    else:
+        fo_t = open_file(args.trans_file, 'w')
     start_time = time.time()
 
-    stateID = first_stateID
-    last_nu = 0.    # the previous wavenumber read in
-    percent_done = 0; percent_increment = 1     # for the progress indicator
-    for i, line in enumerate(lines):
-
-        # progress indicator, as a percentage
-        percent = float(i)/ntrans * 100.
-        if percent - percent_done > percent_increment:
-            vprint('%d %%' % percent_done, 1)
-            percent_done += percent_increment
-
-        # parse the par_line into a HITRANTransition object
-        trans = HITRANTransition.parse_par_line(line)
-
-        if trans is None:
-            # blank or comment line
-            continue
+    # resolve the references to the parameters' sources once, up front
+    source_ids = get_source_id_table(molecule, d_refs)
 
-        # check our wavenumbers are in order
-        if trans.nu.val < last_nu:
-            vprint('Error: %s transitions file isn\'t ordered by nu.'\
-                    % args.trans_file, 5)
-            sys.exit(1)
-        last_nu = trans.nu.val
-
-        # set the global (ie database-wide) ID for the isotopologue in
-        # the transition and its upper and lower state objects
-        trans.global_iso_id = args.global_iso_ids[
-                                (trans.molec_id, trans.local_iso_id)]
-        trans.statep.global_iso_id  = trans.global_iso_id
-        trans.statepp.global_iso_id = trans.global_iso_id
-        
-        # first deal with the upper state: get its string representation ...
-        statep_str_rep = trans.statep.str_rep()
-        # ... and see if it's in our dictionary:
-        if statep_str_rep in db_stateIDs.keys():
-            # the upper state is already in the database: set the
-            # corresponding state ID in the transition object
-            trans.stateIDp = db_stateIDs[statep_str_rep]
-        else:
-            # the upper state is new: assign it an ID and save it
-            trans.stateIDp = trans.statep.id = stateID
-            db_stateIDs[statep_str_rep] = stateID
-            stateID += 1
-            print >>fo_s, statep_str_rep
-
-        # next deal with the lower state: get its string representation ...
-        statepp_str_rep = trans.statepp.str_rep()
-        # ... and see if it's in our dictionary:
-        if statepp_str_rep in db_stateIDs.keys():
-            # the lower state is already in the database: set the
-            # corresponding state ID in the transition object
-            trans.stateIDpp = db_stateIDs[statepp_str_rep]
-        else:
-            # the lower state is new: assign it an ID and save it
-            trans.stateIDpp = trans.statepp.id = stateID
-            db_stateIDs[statepp_str_rep] = stateID
-            stateID += 1
-            print >>fo_s, statepp_str_rep
-
-        # check that the references for this transition's parameters are in
-        # the tables hitranmeta_refs_map and hitranmeta_source - if they    
-        # aren't this is fatal, so we exit
-        for j, prm_name in enumerate(['nu', 'S', 'gamma_air', 'gamma_self',
-                                      'n_air', 'delta_air']):
-            # the reference fields of the par_line are at character
-            # positions 134-146 of the 160-byte par_line, in 2-character fields
-            iref = int(trans.par_line[133+2*j:135+2*j])
-            # work out which Source in hitranmeta_source this reference id
-            # is pointing to, using the hitranmeta_refs_map table to map it
-            # to a primary key in the hitranmeta_source table.
-            if iref == 0:
-                # don't worry about missing 0 refs (which default to the
-                # HITRAN 1986 paper)
-                source_id = HITRAN1986_SOURCEID
-            else:
-                # form a HITRAN-style source identifier as
-                # <molecule_name>-<prm_name>-<id>, for looking up in the
-                # hitranmeta_refs_map table
-                sref = '%s-%s-%d' % (molecule.ordinary_formula,
-                                     prm_name, iref)
-                # we can't use '+' in XML attributes, so replace with 'p'
-                sref = sref.replace('+', 'p')
-                if sref not in d_refs.keys():
-                    # Oops - missing reference: bail.
-                    print 'missing reference for %s in hitranmeta_refs_map'\
-                          ' table' % sref
-                    sys.exit(1)
-                # all's well - we have a valid source_id
-                source_id = d_refs[sref].source_id
-
-            # TODO avoid exec here
-            # Assign the source_id to the parameter object
-            if prm_name == 'S':
-                exec('trans.Sw.source_id = %d' % source_id)
-                exec('trans.A.source_id = %d' % source_id)
-            else:
-                try:
-                    exec('trans.%s.source_id = %d' % (prm_name, source_id))
-                except AttributeError:
-                    # no parameter object exists for prm_name; this can
-                    # happen if e.g. delta_air=0. and none was created, but
-                    # it's fine- we just move on
-                    pass
+    vprint('reading .par lines from %s ...' % args.par_file)
+    reset_quanta_cache_stats()
+    cache_stats = {}
+    if args.jobs > 1:
+        prepared = prepare_transitions_parallel(args, molecule, source_ids,
+                                                cache_stats)
+    else:
+        prepared = prepare_transitions(args, molecule, source_ids)
+    prepared = check_nu_order(prepared, args.par_file)
+    ntrans = nstates = 0
+    for s_trans, new_states in assign_stateIDs(prepared, state_index,
+                                               first_stateID, args.binary):
+        for state_str_rep in new_states:
+            print >>fo_s, state_str_rep
+        nstates += len(new_states)
 
         # write the transition to the .trans file, *even if it is already
-        # in the database* - this is checked for on upload
-        print >>fo_t, trans.to_str(trans_fields, ',')
+        # in the database* - this is checked for on upload
+        if args.binary:
+            fo_t.write(s_trans)
+        else:
+            print >>fo_t, s_trans
+        ntrans += 1
 
     fo_t.close()
     fo_s.close()
-    vprint('%d new or updated states were identified'\
-                    % (stateID-first_stateID))
+    vprint('%d new or updated states were identified' % nstates)
 
     end_time = time.time()
     vprint('%d transitions and %d states in %.1f secs'\
-                % (len(lines), len(db_stateIDs), end_time - start_time))
+                % (ntrans, len(state_index), end_time - start_time))
+
+    # report on the caching of the parsed quanta fields
+    add_cache_stats(cache_stats, quanta_cache_stats())
+    for name in sorted(cache_stats):
+        hits, misses = cache_stats[name]
+        vprint('quanta cache %s: %d hits, %d misses (%.1f %% hit rate)'
+               % (name, hits, misses, 100. * hits / (hits + misses)))
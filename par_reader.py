@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# par_reader.py
+
+# Columnar reader for .par files in the native HITRAN2004+ format.
+#
+# Rather than building a HITRANTransition (and its HITRANParam objects) for
+# every 160-byte line, the whole file (or a batch of lines from it) is
+# loaded into a NumPy structured array in one pass, one column per field.
+# Consumers that only need a few parameters can work on the columns
+# directly; those that need the full transition can build it from a record
+# with HITRANTransition.parse_par_record().
+
+import os
+import numpy as np
+from compressed_io import open_file
+
+# the width of a line in the HITRAN2004+ .par format, excluding EOL
+PAR_LINE_LENGTH = 160
+
+# the fixed-width layout of the raw .par line: each field is a byte-string
+# of the given width, in order, accounting for all 160 characters
+par_raw_dtype = np.dtype([('molec_id', 'S2'),
+                          ('local_iso_id', 'S1'),
+                          ('nu', 'S12'),
+                          ('Sw', 'S10'),
+                          ('A', 'S10'),
+                          ('gamma_air', 'S5'),
+                          ('gamma_self', 'S5'),
+                          ('Elower', 'S10'),
+                          ('n_air', 'S4'),
+                          ('delta_air', 'S8'),
+                          ('Vp', 'S15'),
+                          ('Vpp', 'S15'),
+                          ('Qp', 'S15'),
+                          ('Qpp', 'S15'),
+                          ('Ierr', 'S6'),
+                          ('Iref', 'S12'),
+                          ('flag', 'S1'),
+                          ('gp', 'S7'),
+                          ('gpp', 'S7')])
+
+# the converted columns. Missing values are kept as they are found in the
+# .par file (e.g. Elower = -1., gamma_self = 0., gp = 0) so that no
+# information is lost; ierr and iref hold the six single-digit error codes
+# and six 2-digit reference codes for nu, S, gamma_air, gamma_self, n_air
+# and delta_air, in that order.
+par_dtype = np.dtype([('molec_id', np.int8),
+                      ('local_iso_id', np.int8),
+                      ('nu', np.float64),
+                      ('Sw', np.float64),
+                      ('A', np.float64),
+                      ('gamma_air', np.float64),
+                      ('gamma_self', np.float64),
+                      ('Elower', np.float64),
+                      ('n_air', np.float64),
+                      ('delta_air', np.float64),
+                      ('ierr', np.int8, (6,)),
+                      ('iref', np.int16, (6,)),
+                      ('flag', 'S1'),
+                      ('gp', np.int32),
+                      ('gpp', np.int32),
+                      ('Vp', 'S15'),
+                      ('Vpp', 'S15'),
+                      ('Qp', 'S15'),
+                      ('Qpp', 'S15'),
+                      ('par_line', 'S%d' % PAR_LINE_LENGTH)])
+
+# the fields that are converted to floating point numbers as they stand
+float_fields = ('nu', 'Sw', 'A', 'gamma_air', 'gamma_self', 'Elower',
+                'n_air', 'delta_air')
+
+def par_lines_to_array(lines):
+    """
+    Convert the sequence of .par lines, lines, into a structured array of
+    dtype par_dtype and return it. Blank lines are skipped; trailing
+    whitespace (including EOL characters) is stripped from each line's
+    par_line, as by parse_par_line, but the leading space in front of
+    molec_ids 1-9 is kept. If a field can't be converted, the bad line is
+    reported and the ValueError raised.
+
+    """
+
+    lines = [line.rstrip() for line in lines]
+    lines = [line for line in lines if line]
+    try:
+        return convert_par_lines(lines)
+    except ValueError:
+        # find the line responsible and report it
+        for line in lines:
+            try:
+                convert_par_lines([line])
+            except ValueError, e:
+                print 'parse error in par_lines_to_array'
+                print e
+                print 'The bad line was:'
+                print line
+                raise
+        raise
+
+def convert_par_lines(lines):
+    """
+    Convert the list of non-blank, stripped .par lines, lines, into a
+    structured array of dtype par_dtype and return it.
+
+    """
+
+    n = len(lines)
+    if n == 0:
+        return np.empty(0, dtype=par_dtype)
+    # the fields are read from a copy of the lines padded to the full
+    # width, but the lines are stored as they are
+    raw = np.array([line.ljust(PAR_LINE_LENGTH) for line in lines],
+                   dtype='S%d' % PAR_LINE_LENGTH).view(par_raw_dtype)
+
+    records = np.empty(n, dtype=par_dtype)
+    records['par_line'] = lines
+    records['molec_id'] = raw['molec_id'].astype(np.int8)
+    records['local_iso_id'] = raw['local_iso_id'].astype(np.int8)
+    for field in float_fields:
+        records[field] = raw[field].astype(np.float64)
+    # the error and reference codes are fixed-width digit groups: split
+    # them into their individual codes by reinterpreting the bytes
+    records['ierr'] = np.ascontiguousarray(raw['Ierr']).view('S1')\
+                        .reshape(n, 6).astype(np.int8)
+    records['iref'] = np.ascontiguousarray(raw['Iref']).view('S2')\
+                        .reshape(n, 6).astype(np.int16)
+    records['flag'] = raw['flag']
+    # statistical weights are given as floats in the .par file
+    records['gp'] = (raw['gp'].astype(np.float64) + 0.1).astype(np.int32)
+    records['gpp'] = (raw['gpp'].astype(np.float64) + 0.1).astype(np.int32)
+    for field in ('Vp', 'Vpp', 'Qp', 'Qpp'):
+        records[field] = raw[field]
+    return records
+
+def read_par(par_file):
+    """
+    Read the whole .par file named par_file (which may be compressed, see
+    compressed_io) into a structured array of dtype par_dtype in one pass
+    and return it.
+
+    """
+
+    fi = open_file(par_file, 'r')
+    try:
+        return par_lines_to_array(fi.readlines())
+    finally:
+        fi.close()
+
+def iter_par_batches(par_file, batch_size=100000, progress=None, start=0,
+                     end=None):
+    """
+    Read the .par file named par_file in batches of at most batch_size
+    lines, yielding each as a structured array of dtype par_dtype, so that
+    the whole file need not be held in memory at once. If given, the
+    function progress is called with the number of bytes read so far
+    before each batch is yielded. Only the lines between the byte offsets
+    start and end (which must be at line boundaries) are read; by default,
+    the whole file is read. The file may be compressed (see compressed_io),
+    in which case the offsets are into the decompressed lines.
+
+    """
+
+    fi = open_file(par_file, 'r')
+    try:
+        if start:
+            fi.seek(start)
+        lines = []
+        nbytes = 0
+        while end is None or start + nbytes < end:
+            line = fi.readline()
+            if not line:
+                break
+            lines.append(line)
+            nbytes += len(line)
+            if len(lines) == batch_size:
+                records = par_lines_to_array(lines)
+                lines = []
+                if progress is not None:
+                    progress(nbytes)
+                if len(records):
+                    yield records
+        records = par_lines_to_array(lines)
+        if progress is not None:
+            progress(nbytes)
+        if len(records):
+            yield records
+    finally:
+        fi.close()
+
+def par_chunks(par_file, chunk_size=4000000):
+    """
+    Divide the .par file named par_file into chunks of approximately
+    chunk_size bytes, ending on line boundaries, and return a list of
+    their (start, end) byte offsets, in the order they appear in the file.
+    The file must not be compressed: use iter_par_line_chunks for that.
+
+    """
+
+    par_size = os.path.getsize(par_file)
+    chunks = []
+    fi = open(par_file, 'r')
+    try:
+        start = 0
+        while start < par_size:
+            fi.seek(min(start + chunk_size, par_size))
+            # move on to the end of the line we've landed in
+            fi.readline()
+            end = min(fi.tell(), par_size)
+            chunks.append((start, end))
+            start = end
+    finally:
+        fi.close()
+    return chunks
+
+def iter_par_line_chunks(par_file, chunk_size=4000000):
+    """
+    Read the .par file named par_file (which may be compressed, see
+    compressed_io) in a stream, generating chunks of its lines, as lists,
+    of approximately chunk_size bytes, in the order they appear in the file.
+
+    """
+
+    fi = open_file(par_file, 'r')
+    try:
+        lines = []
+        nbytes = 0
+        for line in fi:
+            lines.append(line)
+            nbytes += len(line)
+            if nbytes >= chunk_size:
+                yield lines
+                lines = []
+                nbytes = 0
+        if lines:
+            yield lines
+    finally:
+        fi.close()
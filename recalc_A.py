@@ -5,8 +5,9 @@
 import os
 import sys
 import math
+import numpy as np
 import physcon as pc
-from hitran_transition import HITRANTransition
+from par_reader import iter_par_batches
 
 c2 = pc.h * pc.c * 100. / pc.kB     # second radiation constant, cm.K
 pic8 = 8. * math.pi * pc.c * 100    # 8.pi.c in cm-1 s
@@ -15,9 +16,10 @@ T = 296.
 Q = 1725.235188     # XXX for NH3 only!
 
 def calc_A(nu0, Epp, gp, Sw, Q, T, abundance):
+    # NB works element-wise on NumPy arrays as well as on scalars
     c2oT = c2 / T
-    A = pic8 * nu0**2 * Q * Sw / gp / math.exp(-c2oT * Epp) /\
-            (1 - math.exp(-c2oT * nu0)) / abundance
+    A = pic8 * nu0**2 * Q * Sw / gp / np.exp(-c2oT * Epp) /\
+            (1 - np.exp(-c2oT * nu0)) / abundance
     return A
 
 HOME = os.getenv('HOME')
@@ -35,22 +37,16 @@ par_dir = os.path.join(HOME, 'research/HITRAN/HITRAN2008/HITRAN2008/'\
                                   'By-Molecule/Uncompressed-files')
 par_name = sys.argv[1]
 par_path = os.path.join(par_dir, par_name)
-lines = [x.rstrip() for x in open(par_path, 'r').readlines()]
-for i,line in enumerate(lines):
-    trans = HITRANTransition.parse_par_line(line)
-    if trans is None:
-        # blank or comment line
-        continue
-    if trans.gp is None:
-        print 'unassigned line at %12.6f' % trans.nu.val
-        continue
-    A = calc_A(trans.nu.val, trans.Elower, trans.gp, trans.Sw.val, Q, T,
-               abundances[trans.par_line[:3]])
-    if trans.par_line[25:35] != '%10.3E' % A:
-        #print trans.par_line[25:35], '%10.3E' % A
-        print '%10.3E %10.3E' % (trans.A.val, A)
-    #if i > 10:
-    #    sys.exit(0)
-    
-    
-
+for records in iter_par_batches(par_path):
+    unassigned = records['gp'] == 0
+    for nu in records['nu'][unassigned]:
+        print 'unassigned line at %12.6f' % nu
+    records = records[~unassigned]
+    abundance = np.array([abundances['%2d%1d' % (molec_id, local_iso_id)]
+                          for molec_id, local_iso_id in zip(
+                          records['molec_id'], records['local_iso_id'])])
+    A = calc_A(records['nu'], records['Elower'], records['gp'],
+               records['Sw'], Q, T, abundance)
+    for i, par_line in enumerate(records['par_line']):
+        if par_line[25:35] != '%10.3E' % A[i]:
+            print '%10.3E %10.3E' % (records['A'][i], A[i])
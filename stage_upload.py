@@ -10,15 +10,35 @@
 # NB updates to the database must be applied in chronological order, or
 # this routine will get very confused and mess up the database for the
 # molecule it's supposed to be updating.
-# NB stage_upload calls the system routine diff. So it might not work
-# on Windows...
+# The transitions are compared by merging the database's and the .trans
+# file's, both ordered by wavenumber, in Python (see diff_trans): a
+# transition is unchanged if its key (nu, stateIDp, stateIDpp,
+# local_iso_id) and its fingerprint (see field_codec.trans_fingerprint)
+# are the same in both. The keys and fingerprints of the molecule's
+# currently valid transitions are kept between runs in a snapshot (see
+# update_db_snapshot), which upload_data keeps up to date with the
+# transitions it expires and adds: it is only fetched afresh from the
+# database when transitions have been expired in some other way since it
+# was taken, and then not when staging with --window, when only the
+# transitions in the window are fetched instead.
 
 import os
 import sys
-import re
+import copy
+import heapq
+import itertools
+import multiprocessing
 import time
+import json
 import datetime
+import numpy as np
 from fmt_xn import trans_prms, trans_fields
+from field_codec import write_trans, trans_record_to_text,\
+                        trans_fingerprint
+from compressed_io import open_file, split_compression
+from trans_binary import CHUNK_SIZE, BinaryTransWriter, open_binary_trans,\
+                         iter_records
+from db_stream import iter_rows
 from xn_utils import vprint
 
 from pyHAWKS_config import SETTINGS_PATH
@@ -26,158 +46,903 @@ from pyHAWKS_config import SETTINGS_PATH
 sys.path.append(SETTINGS_PATH)
 os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
 from django.db import connection
+from django.db.models import Max
 from hitranlbl.models import Trans, Prm
 
-def write_db_trans(args, molecule, isos):
+# the positions of the fields of a line of the .trans file identifying a
+# transition: its wavenumber, by which both the .trans and db_trans files
+# are ordered, and the states and isotopologue it belongs to
+trans_field_names = [field.name for field in trans_fields]
+NU_FIELD = trans_field_names.index('nu.val')
+KEY_FIELDS = [trans_field_names.index(name) for name in
+              ('stateIDp', 'stateIDpp', 'local_iso_id')]
+LOCAL_ISO_ID_FIELD = trans_field_names.index('local_iso_id')
+NU_FMT = trans_fields[NU_FIELD].fmt
+# half the last decimal place of the wavenumbers in the .trans file: a
+# transition in the database within this of a wavenumber in the file may
+# have it as its wavenumber, when rounded
+NU_PAD = 0.5 * 10**-int(NU_FMT.split('.')[1][:-1])
+
+# the columns of hitranlbl_trans needed to write a transition to the
+# db_trans file, and those of each of the prm_<name> tables (a transition
+# has at most one row in each)
+db_trans_columns = ('id', 'nu', 'fingerprint', 'statep_id', 'statepp_id',
+                    'iso_id', 'Elower', 'gp', 'gpp', 'multipole', 'par_line')
+db_prm_columns = ('trans_id', 'val', 'err', 'ierr', 'source_id')
+
+def get_db_trans_query(isos, min_id=None, nu_range=None):
+    """
+    Return the SQL query, and its parameters (but for the date from which
+    the transitions must be valid), selecting the currently-valid
+    transitions of the isotopologues isos (only those with IDs greater than
+    min_id, if it is given, and with wavenumbers within nu_range = (nu_min,
+    nu_max), if it is given), ordered by wavenumber and then by ID. The
+    transitions without a fingerprint (those uploaded before fingerprints
+    were stored) are joined with their parameters from each of the
+    prm_<name> tables, one row per transition: a transition without a
+    parameter, or with a fingerprint, has NULL in all of that parameter's
+    columns, including its trans_id.
+
+    """
+
+    columns = ['t.%s' % column for column in db_trans_columns]
+    joins = []
+    for i, prm_name in enumerate(trans_prms):
+        columns.extend(['p%d.%s' % (i, column) for column in db_prm_columns])
+        joins.append('LEFT JOIN prm_%s p%d ON p%d.trans_id=t.id'
+                     ' AND t.fingerprint IS NULL' % (prm_name.lower(), i, i))
+    params = [iso.id for iso in isos]
+    where = 't.iso_id IN (%s)' % ', '.join(['%s'] * len(params))
+    if min_id is not None:
+        where += ' AND t.id > %s'
+        params.append(min_id)
+    if nu_range is not None:
+        where += ' AND t.nu BETWEEN %s AND %s'
+        params.extend(nu_range)
+    query = 'SELECT %s FROM hitranlbl_trans t %s WHERE %s'\
+            ' AND t.valid_to > %%s ORDER BY t.nu, t.id'\
+                % (', '.join(columns), ' '.join(joins), where)
+    return query, params
+
+class DBTrans(object):
+    """
+    A currently-valid transition from the database, with the attributes
+    write_trans needs to write it as a line of the .trans file.
+
+    """
+    pass
+
+def fetch_db_trans(fo, fo_id, molecule, isos, min_id=None,
+                   nu_range=None):
+    """
+    Fetch the currently valid transitions of the isotopologues isos of
+    molecule from the database (only those with IDs greater than min_id,
+    and within nu_range, if they are given), in order of wavenumber, and
+    write each to the file object fo as its key and fingerprint, as the
+    line:
+    <nu>,<stateIDp>,<stateIDpp>,<local_iso_id>,<fingerprint>
+    and its ID to the parallel file object fo_id. The fingerprint is the
+    one stored with the transition when it was uploaded or, for
+    transitions uploaded before fingerprints were stored, that of the
+    transition written as a line of the .trans file, for which its
+    parameters are fetched in the same query. Returns the number of
+    transitions written.
+
+    """
+
+    today = datetime.date.today()
+    # map global isotopologue ID to local, HITRAN isoID
+    local_iso_ids = dict([(iso.id, iso.isoID) for iso in isos])
+    query, params = get_db_trans_query(isos, min_id, nu_range)
+    rows = iter_rows(query, params + [today],
+                     progress=lambda n: vprint('%d transitions ...' % n, 1))
+    n_db_trans = nrendered = 0
+    for row in rows:
+        n_db_trans += 1
+        trans_id, nu, fingerprint, stateIDp, stateIDpp, iso_id = row[:6]
+        local_iso_id = local_iso_ids[iso_id]
+        if fingerprint is None:
+            fingerprint = trans_fingerprint(write_trans(
+                                get_db_trans(row, molecule, local_iso_id)))
+            nrendered += 1
+
+        # write the key and fingerprint, separated by commas
+        print >>fo, '%s,%d,%d,%d,%s' % (NU_FMT % nu, stateIDp, stateIDpp,
+                                        local_iso_id, fingerprint)
+        # and write the transition ID in the parallel file
+        print >>fo_id, trans_id
+    vprint('%d currently valid transitions fetched (%d without a stored'
+           ' fingerprint).' % (n_db_trans, nrendered))
+    return n_db_trans
+
+def load_snapshot_watermark(snapshot_file):
+    """
+    Return the watermark of the snapshot of the database's transitions in
+    snapshot_file, as a dictionary, or None if there isn't one.
+
+    """
+
+    try:
+        return json.load(open('%s.json' % snapshot_file, 'r'))
+    except (IOError, ValueError):
+        return None
+
+def write_snapshot_watermark(snapshot_file, watermark):
+    """ Write the watermark of the snapshot in snapshot_file. """
+    fo = open('%s.json' % snapshot_file, 'w')
+    json.dump(watermark, fo)
+    fo.close()
+
+def iter_snapshot_lines(filename, id_filename):
+    """
+    Generate the tuples (nu, trans_id, line) of the lines of the snapshot
+    (or part of one) in filename, with their IDs from id_filename, in the
+    order in which they are fetched: of wavenumber, then of ID.
+
+    """
+
+    for line, s_id in itertools.izip(open(filename, 'r'),
+                                     open(id_filename, 'r')):
+        yield float(line.split(',', 1)[0]), int(s_id), line
+
+def merge_snapshot_files(fo, fo_id, filenames):
+    """
+    Merge the snapshots (or parts of one) in filenames, each with its IDs
+    in <filename>.id, writing the lines to the file object fo and their
+    IDs to fo_id, in order of wavenumber and then of ID.
+
+    """
+
+    for nu, trans_id, line in heapq.merge(*[iter_snapshot_lines(filename,
+                                            '%s.id' % filename)
+                                            for filename in filenames]):
+        fo.write(line)
+        print >>fo_id, trans_id
+
+def fetch_snapshot_partition(molecule, iso, filename, min_id):
+    """
+    Fetch the currently valid transitions of the isotopologue iso into
+    filename, and their IDs into <filename>.id (see fetch_db_snapshot).
+    This is run in a worker process, with its own connection to the
+    database: the number of transitions fetched is returned.
+
+    """
+
+    fo = open(filename, 'w')
+    fo_id = open('%s.id' % filename, 'w')
+    try:
+        return fetch_db_trans(fo, fo_id, molecule, [iso], min_id)
+    finally:
+        fo.close()
+        fo_id.close()
+
+def fetch_db_snapshot(args, molecule, isos, filename, min_id=None):
+    """
+    Fetch the currently valid transitions of the isotopologues isos of
+    molecule (only those with IDs greater than min_id, if it is given) into
+    filename, and their IDs into <filename>.id, as fetch_db_trans does.
+    With args.jobs > 1, the isotopologues are fetched separately, in a pool
+    of worker processes, and merged. Returns the number of transitions
+    fetched.
+
+    """
+
+    if args.jobs == 1 or len(isos) == 1:
+        fo = open(filename, 'w')
+        fo_id = open('%s.id' % filename, 'w')
+        n_db_trans = fetch_db_trans(fo, fo_id, molecule, isos, min_id)
+        fo.close()
+        fo_id.close()
+        return n_db_trans
+
+    njobs = min(args.jobs, len(isos))
+    vprint('fetching %d isotopologues in %d processes' % (len(isos), njobs))
+    # each worker makes its own connection to the database: this process's
+    # mustn't be shared with them
+    connection.close()
+    pool = multiprocessing.Pool(njobs)
+    partition_files = ['%s.%d' % (filename, iso.isoID) for iso in isos]
+    results = [pool.apply_async(fetch_snapshot_partition,
+                                (molecule, iso, partition_file, min_id))
+               for iso, partition_file in zip(isos, partition_files)]
+    try:
+        n_db_trans = sum([result.get() for result in results])
+    except:
+        pool.terminate()
+        raise
+    pool.close()
+    pool.join()
+
+    fo = open(filename, 'w')
+    fo_id = open('%s.id' % filename, 'w')
+    merge_snapshot_files(fo, fo_id, partition_files)
+    fo.close()
+    fo_id.close()
+    for partition_file in partition_files:
+        os.remove(partition_file)
+        os.remove('%s.id' % partition_file)
+    return n_db_trans
+
+def update_db_snapshot(args, molecule, isos, refetch=True):
+    """
+    Bring the snapshot of the currently valid transitions of the
+    isotopologues isos of molecule, kept between runs in
+    args.db_snapshot_file (as lines of the db_trans file, see
+    fetch_db_trans), its IDs in <db_snapshot_file>.id and its watermark
+    in <db_snapshot_file>.json, up to date with the database.
+
+    The watermark holds the greatest transition ID, max_id, of these
+    isotopologues and the number of their currently valid transitions,
+    nvalid, when the snapshot was taken. Transitions are only ever added
+    (with greater IDs) or expired, and an expiry (or a transition's
+    valid_to date passing) reduces the number of currently valid
+    transitions with IDs up to max_id, so:
+      if that number has changed, the snapshot is fetched afresh;
+      otherwise, if max_id has not changed, the snapshot is used as it is;
+      otherwise, only the currently valid transitions with IDs greater
+      than max_id are fetched, and merged into the snapshot.
+    The transitions expired by upload_data are removed from the snapshot,
+    and from nvalid, as they are expired (see expire_from_snapshot), and
+    those it adds are merged in once it is done, so that neither causes
+    the snapshot to be fetched afresh. Delete the snapshot's files to have
+    it fetched afresh. If refetch is False, a snapshot which would have to
+    be fetched afresh is left as it is. Returns True if the snapshot is up
+    to date, and False if it isn't.
+
+    """
+
+    snapshot_file = args.db_snapshot_file
+    snapshot_id_file = '%s.id' % snapshot_file
+    today = datetime.date.today()
+    transitions = Trans.objects.filter(iso__in=isos)
+
+    watermark = load_snapshot_watermark(snapshot_file)
+    if watermark is not None:
+        nvalid = transitions.filter(valid_to__gt=today)\
+                            .filter(id__lte=watermark['max_id']).count()
+        if nvalid != watermark['nvalid']:
+            vprint('transitions have been expired since the snapshot %s was'
+                   ' taken' % snapshot_file)
+            watermark = None
+    if watermark is None and not refetch:
+        vprint('the snapshot %s is not up to date, and is left to be'
+               ' fetched afresh' % snapshot_file)
+        return False
+    max_id = transitions.aggregate(Max('id'))['id__max'] or 0
+    if watermark is not None and max_id == watermark['max_id']:
+        vprint('using the snapshot of currently valid transitions, %s'
+                    % snapshot_file)
+        return True
+
+    # the snapshot's watermark is removed until it has been written
+    if os.path.exists('%s.json' % snapshot_file):
+        os.remove('%s.json' % snapshot_file)
+    if watermark is None:
+        vprint('Retrieving existing transitions from database to %s ...'
+                    % snapshot_file)
+        nvalid = fetch_db_snapshot(args, molecule, isos,
+                                   '%s.tmp' % snapshot_file)
+    else:
+        vprint('Retrieving transitions added since the snapshot %s was'
+               ' taken ...' % snapshot_file)
+        nvalid = watermark['nvalid'] + fetch_db_snapshot(args, molecule,
+                        isos, '%s.new' % snapshot_file, watermark['max_id'])
+        # merge the new transitions into the snapshot
+        fo = open('%s.tmp' % snapshot_file, 'w')
+        fo_id = open('%s.tmp.id' % snapshot_file, 'w')
+        merge_snapshot_files(fo, fo_id, [snapshot_file,
+                                         '%s.new' % snapshot_file])
+        fo.close()
+        fo_id.close()
+        os.remove('%s.new' % snapshot_file)
+        os.remove('%s.new.id' % snapshot_file)
+    os.rename('%s.tmp' % snapshot_file, snapshot_file)
+    os.rename('%s.tmp.id' % snapshot_file, snapshot_id_file)
+    write_snapshot_watermark(snapshot_file, {'max_id': max_id,
+                                             'nvalid': nvalid})
+    return True
+
+def expire_from_snapshot(snapshot_file, expire_ids):
+    """
+    Remove the transitions with the IDs expire_ids, which have just been
+    expired in the database (by upload_data), from the snapshot in
+    snapshot_file, and take them off its watermark's count of currently
+    valid transitions, so that it needn't be fetched afresh when it is
+    next brought up to date (see update_db_snapshot). A snapshot without
+    a watermark is left alone; if any of the transitions isn't in the
+    snapshot, it is left without its watermark, to be fetched afresh.
+
+    """
+
+    watermark = load_snapshot_watermark(snapshot_file)
+    if watermark is None:
+        return
+    expire_ids = set(expire_ids)
+    vprint('removing %d expired transitions from the snapshot %s ...'
+                % (len(expire_ids), snapshot_file))
+    # the snapshot's watermark is removed until it has been rewritten
+    os.remove('%s.json' % snapshot_file)
+    fo = open('%s.tmp' % snapshot_file, 'w')
+    fo_id = open('%s.tmp.id' % snapshot_file, 'w')
+    nexpired = 0
+    for nu, trans_id, line in iter_snapshot_lines(snapshot_file,
+                                                  '%s.id' % snapshot_file):
+        if trans_id in expire_ids:
+            nexpired += 1
+            continue
+        fo.write(line)
+        print >>fo_id, trans_id
+    fo.close()
+    fo_id.close()
+    os.rename('%s.tmp' % snapshot_file, snapshot_file)
+    os.rename('%s.tmp.id' % snapshot_file, '%s.id' % snapshot_file)
+    if nexpired != len(expire_ids):
+        vprint('%d of the expired transitions were not in the snapshot %s:'
+               ' it will be fetched afresh'
+                    % (len(expire_ids) - nexpired, snapshot_file))
+        return
+    watermark['nvalid'] -= nexpired
+    write_snapshot_watermark(snapshot_file, watermark)
+
+def write_db_trans(args, molecule, isos, nu_range=None):
     """
     Write the transitions currently in the database and currently valid to a
     file called db_trans_file, which will be compared to the file of
     transitions to be uploaded to decide which are still valid (haven't
-    changed) which to expire.
+    changed) which to expire, and their IDs to db_trans_file_id: only those
+    of the isotopologues isos, and with wavenumbers within nu_range =
+    (nu_min, nu_max) if it is given, are written. If args.use_db_snapshot
+    is set, they are taken from the snapshot of the molecule's currently
+    valid transitions (see update_db_snapshot), which must be up to date;
+    if not, they are fetched from the database.
 
     """
 
-    cursor = connection.cursor()
-    vprint('Retrieving existing transitions from database...')
-
-    today = datetime.date.today()
+    local_iso_ids = set([iso.isoID for iso in isos])
+    vprint('Writing currently valid transitions to %s ...'% args.db_trans_file)
     # db_trans_file will hold a list of the currently valid transitions for
     # the molecule of interest
-    fo = open(args.db_trans_file, 'w')
+    fo = open_file(args.db_trans_file, 'w')
     # db_trans_file_id will hold a list of the transition IDs corresponding
-    # to each line of db_trans_file
-    fo_id = open(args.db_trans_file_id, 'w')
-    # fetch the currently valid transitions for all the isotopologues of our
-    # molecule
-    db_transitions = Trans.objects.filter(iso__in=isos)\
-                         .filter(valid_to__gt=today).order_by('nu')
-    n_db_trans = db_transitions.count()
-    vprint('%d currently valid transitions found.' % n_db_trans)
-    
-    vprint('Writing currently valid transitions to %s ...'% args.db_trans_file)
-    percent = 0; percent_thresh = 0 # for the progress indicator
-    for i, trans in enumerate(db_transitions):
-
-        # a progress indicator of percent completion
-        percent = float(i)/n_db_trans * 100
-        if percent > percent_thresh:
-            vprint('%d %%' % percent_thresh, 1)
-            percent_thresh += 1
-
-        # a bit of translation so that everything we need for the string
-        # representation of the transition is an immediate attribute of trans
-        trans.stateIDp = trans.statep.id
-        trans.stateIDpp = trans.statepp.id
-        trans.molec_id = molecule.id
-        trans.local_iso_id = trans.iso.isoID
-        try:
-            trans.flag = trans.par_line[145]
-        except IndexError:
-            trans.flag = ' '
-
-        # get the parameters for this transition
-        for prm in trans_prms:
-            command = 'SELECT * FROM prm_%s WHERE trans_id=%d'\
-                         % (prm.lower(), trans.id)
-            cursor.execute(command)
-            rows = cursor.fetchall()
-            if not rows:
-                # this parameter apparently doesn't exist for this transition
+    # to each line of db_trans_file
+    fo_id = open_file(args.db_trans_file_id, 'w')
+    if not args.use_db_snapshot:
+        vprint('Retrieving existing transitions from database ...')
+        fetch_db_trans(fo, fo_id, molecule, isos, nu_range=nu_range)
+        fo.close()
+        fo_id.close()
+        return
+
+    n_db_trans = 0
+    for line, s_id in itertools.izip(open(args.db_snapshot_file, 'r'),
+                            open('%s.id' % args.db_snapshot_file, 'r')):
+        s_vals = line.split(',', 4)
+        if nu_range is not None:
+            nu = float(s_vals[0])
+            if nu > nu_range[1]:
+                # the snapshot is in order of wavenumber: we're done
+                break
+            if nu < nu_range[0]:
                 continue
-            # make a generic Prm object named for the parameter, and with
-            # the attributes val, err, ierr and source_id in that order:
-            #globals()[prm] = Prm(*rows[0][1:])
-            setattr(trans, prm, Prm(*rows[0][1:]))
-            
-        # build a list of strings, each of which is a field in the
-        # db_trans_file output
-        s_vals = []
-        for trans_field in trans_fields:
-            try:
-                val = eval('trans.%s' % trans_field.name)
-                if val is None:
-                    s_vals.append(trans_field.default)
-                else:
-                    s_vals.append(trans_field.fmt % val)
-            except AttributeError:
-                # no value for this field - use the default
-                s_vals.append(trans_field.default)
-            #except TypeError:
-            #    vprint('None value for trans_field %s' % trans_field.name)
-
-        # write the fields, separated by commas in case someone is
-        # foolish enough to think it a good idea to read the file in Excel
-        print >>fo, ','.join(s_vals)
-        # and write the transition ID in the parallel db_trans_file_id file
-        print >>fo_id, trans.id
+        if int(s_vals[3]) not in local_iso_ids:
+            continue
+        fo.write(line)
+        fo_id.write(s_id)
+        n_db_trans += 1
     fo.close()
     fo_id.close()
+    vprint('%d currently valid transitions written.' % n_db_trans)
 
-def stage_upload(args, molecule, isos):
+def get_db_trans(row, molecule, local_iso_id):
     """
-    Stage the transtions file for upload to the database by identifying
-    transitions that are already in the database, and transitions that
-    need to be expired.
+    Return the DBTrans for row, a row of the query of get_db_trans_query
+    for a transition of molecule, with local isotopologue ID local_iso_id.
 
     """
 
-    # first write the currently valid transitions to db_trans_file and
-    # their IDs to db_trans_file_id
-    write_db_trans(args, molecule, isos)
-
-    # find out where the old and new transitions differ
-    # I'm not clever enough to do this fast in Python (the files involved
-    # can be much larger than the available memory), so farm it out to the
-    # Unix tool diff, which produces the diff_file 
-    vprint('calculating the diff ...')
-    os.system('diff %s %s > %s' % (args.db_trans_file, args.trans_file,
-                                   args.diff_file))
-    vprint('done.')
+    nprm_columns = len(db_prm_columns)
+    prm_start = len(db_trans_columns)
+    # everything we need for the string representation of the transition
+    # is an immediate attribute of trans
+    trans = DBTrans()
+    (trans.id, nu, fingerprint, trans.stateIDp, trans.stateIDpp, iso_id,
+     trans.Elower, trans.gp, trans.gpp, trans.multipole, trans.par_line)\
+            = row[:prm_start]
+    trans.molec_id = molecule.id
+    trans.local_iso_id = local_iso_id
+    try:
+        trans.flag = trans.par_line[145]
+    except IndexError:
+        trans.flag = ' '
 
-    vprint('Writing expire-ids file and upload transitions file...')
-    # get the list of the currently-valid transitions' IDs from
-    # db_trans_file_id
-    db_trans_ids = []
-    fi_id = open(args.db_trans_file_id, 'r')
-    for line in fi_id:
-        db_trans_ids.append(int(line))
+    # the parameters for this transition
+    for j, prm in enumerate(trans_prms):
+        start = prm_start + j * nprm_columns
+        if row[start] is None:
+            # this parameter apparently doesn't exist for this transition
+            continue
+        # make a generic Prm object named for the parameter, and with
+        # the attributes val, err, ierr and source_id in that order:
+        setattr(trans, prm, Prm(*row[start+1:start+nprm_columns]))
+    return trans
 
-    # trans_file_upload will hold the string representations of transitions 
-    # new or altered transitions to be uploaded to the database
-    fo_upload = open(args.trans_file_upload, 'w')
+def iter_trans_rows(numbered_lines):
+    """
+    Generate the rows to compare (see iter_nu_groups) of the lines of the
+    .trans file, given as (i, line) tuples of the line's index in the file
+    and the line (without its EOL), as the tuples (nu, key, fingerprint,
+    line, i).
+
+    """
+
+    for i, line in numbered_lines:
+        s_vals = line.split(',')
+        yield (float(s_vals[NU_FIELD]),
+               tuple([int(s_vals[j]) for j in KEY_FIELDS]),
+               trans_fingerprint(line), line, i)
+
+def iter_db_trans_rows(lines, trans_ids):
+    """
+    Generate the rows to compare (see iter_nu_groups) of the lines of the
+    db_trans file, lines, as written by write_db_trans, and the
+    corresponding transition IDs, trans_ids, as the tuples (nu, key,
+    fingerprint, line, trans_id).
+
+    """
+
+    for line, trans_id in itertools.izip(lines, trans_ids):
+        s_nu, stateIDp, stateIDpp, local_iso_id, fingerprint\
+                = line.rstrip('\n').split(',')
+        yield (float(s_nu), (int(stateIDp), int(stateIDpp), int(local_iso_id)),
+               fingerprint, line, trans_id)
+
+def iter_nu_groups(rows, filename):
+    """
+    Generate the rows, tuples of (nu, key, fingerprint, line, item) for the
+    transitions of the file filename, where key is the tuple (stateIDp,
+    stateIDpp, local_iso_id) and item is whatever is to be kept with the
+    line, in groups of the same wavenumber, as the tuples (nu, group),
+    where group is a list of (key, fingerprint, line, item) tuples. A file
+    not ordered by wavenumber is fatal.
+
+    """
+
+    nu, group = None, []
+    for this_nu, key, fingerprint, line, item in rows:
+        if this_nu != nu:
+            if group:
+                if this_nu < nu:
+                    print '%s isn\'t ordered by wavenumber at:\n%s'\
+                            % (filename, line)
+                    sys.exit(1)
+                yield nu, group
+            nu, group = this_nu, []
+        group.append((key, fingerprint, line, item))
+    if group:
+        yield nu, group
+
+def diff_trans(db_rows, new_rows, db_trans_file, trans_file):
+    """
+    Compare the currently-valid transitions, db_rows, with the new ones,
+    new_rows, each a sequence of (nu, key, fingerprint, line, item) tuples
+    ordered by wavenumber (item is the transition's ID for db_rows, and is
+    passed through for new_rows), by merging the two on the key (nu,
+    stateIDp, stateIDpp, local_iso_id). Generate the tuples (change, line,
+    item), where change is '+' for a new or altered transition, to be
+    uploaded, '-' for a currently-valid transition which has been altered
+    or is not in the new transitions, to be expired, and '=' for a
+    transition which is the same in both, in the order of the new
+    transitions within each wavenumber. Only one wavenumber's worth of
+    transitions is held in memory at a time, so this takes time
+    proportional to the lengths of the files, and not much memory,
+    whatever they hold.
+
+    """
+
+    db_groups = iter_nu_groups(db_rows, db_trans_file)
+    new_groups = iter_nu_groups(new_rows, trans_file)
+    db_nu, db_group = next(db_groups, (None, None))
+    new_nu, new_group = next(new_groups, (None, None))
+    while db_group is not None or new_group is not None:
+        if new_group is None or (db_group is not None and db_nu < new_nu):
+            # this wavenumber only has currently-valid transitions
+            for key, fingerprint, line, item in db_group:
+                yield '-', line, item
+            db_nu, db_group = next(db_groups, (None, None))
+            continue
+        if db_group is None or new_nu < db_nu:
+            # this wavenumber only has new transitions
+            for key, fingerprint, line, item in new_group:
+                yield '+', line, item
+            new_nu, new_group = next(new_groups, (None, None))
+            continue
+
+        # match the transitions of this wavenumber by key: a transition
+        # is unchanged only if its fingerprint is the same in both
+        db_keyed = {}
+        for i, (key, fingerprint, line, item) in enumerate(db_group):
+            db_keyed.setdefault((key, fingerprint), []).append(i)
+        unchanged = set()
+        for key, fingerprint, line, item in new_group:
+            for i in db_keyed.get((key, fingerprint), []):
+                if i not in unchanged:
+                    unchanged.add(i)
+                    yield '=', line, item
+                    break
+            else:
+                yield '+', line, item
+        for i, (key, fingerprint, line, item) in enumerate(db_group):
+            if i not in unchanged:
+                yield '-', line, item
+        db_nu, db_group = next(db_groups, (None, None))
+        new_nu, new_group = next(new_groups, (None, None))
+
+def get_trans_extent(args):
+    """
+    Return the wavenumber range, (nu_min, nu_max), and the set of local
+    isotopologue IDs of the transitions of the .trans file, or (None,
+    set()) if it has none.
+
+    """
+
+    if args.binary:
+        records = open_binary_trans(args.trans_file)
+        if not len(records):
+            return None, set()
+        return ((records['nu_val'].min(), records['nu_val'].max()),
+                set(records['local_iso_id'].tolist()))
+
+    nu_min = nu_max = None
+    local_iso_ids = set()
+    for line in open_file(args.trans_file, 'r'):
+        s_vals = line.split(',')
+        nu = float(s_vals[NU_FIELD])
+        if nu_min is None or nu < nu_min:
+            nu_min = nu
+        if nu_max is None or nu > nu_max:
+            nu_max = nu
+        local_iso_ids.add(int(s_vals[LOCAL_ISO_ID_FIELD]))
+    if nu_min is None:
+        return None, set()
+    return (nu_min, nu_max), local_iso_ids
+
+def get_staging_window(args, molecule, isos):
+    """
+    Find the isotopologues and the wavenumber range of the transitions of
+    the .trans file, and return them as the list of the Iso objects in isos
+    for these isotopologues and the wavenumber range (nu_min, nu_max),
+    widened by the rounding of the wavenumbers in the .trans file, for
+    stage_upload to stage against only the currently valid transitions
+    which overlap the .trans file. The currently valid transitions outside this
+    window, which a staging against all of them would expire because they
+    are not in the .trans file, are counted and flagged. A .trans file
+    without any transitions is fatal.
+
+    """
+
+    extent, local_iso_ids = get_trans_extent(args)
+    if extent is None:
+        print 'no transitions to stage in %s' % args.trans_file
+        sys.exit(1)
+    nu_range = extent[0] - NU_PAD, extent[1] + NU_PAD
+    window_isos = [iso for iso in isos if iso.isoID in local_iso_ids]
+    vprint('staging against transitions of isotopologue(s) %s between'
+           ' %f and %f cm-1 only' % (', '.join([str(iso.isoID) for iso in
+                                               window_isos]),
+                                    extent[0], extent[1]))
+
+    today = datetime.date.today()
+    n_outside = Trans.objects.filter(iso__in=isos)\
+                    .filter(valid_to__gt=today)\
+                    .exclude(iso__in=window_isos, nu__gte=nu_range[0],
+                             nu__lte=nu_range[1]).count()
+    if n_outside:
+        vprint('Warning: %d currently valid transitions of %s are outside'
+               ' this window and will be left valid: a staging against all'
+               ' of them would expire them.'
+                    % (n_outside, molecule.ordinary_formula), 1)
+    return window_isos, nu_range
+
+def iter_numbered_trans_lines(args):
+    """
+    Generate the transitions of the .trans file as the tuples (i, line) of
+    their lines of text (without the EOL) and their indexes in the file.
+
+    """
+
+    if not args.binary:
+        for i, line in enumerate(open_file(args.trans_file, 'r')):
+            yield i, line.rstrip('\n')
+        return
+
+    records = open_binary_trans(args.trans_file)
+    for i, rec in enumerate(iter_records(records)):
+        yield i, trans_record_to_text(rec)
+
+def write_numbered_line(fo, i, line):
+    """ Write the line of a transition, prefixed by its index, i, to fo. """
+    print >>fo, '%d,%s' % (i, line)
+
+def iter_numbered_lines(filename):
+    """
+    Generate the tuples (i, line) of the transitions written to filename
+    by write_numbered_line.
+
+    """
+
+    for numbered_line in open(filename, 'r'):
+        i, line = numbered_line.rstrip('\n').split(',', 1)
+        yield int(i), line
+
+def split_trans_file(args, partitions):
+    """
+    Split the transitions of the .trans file between the partitions, a
+    dictionary of the args of each isotopologue's staging keyed by
+    local_iso_id (see get_partition_args), in a single pass through the
+    file, so that each worker reads only the transitions of its own
+    isotopologue: a text .trans file is split into each partition's
+    trans_rows_file, with write_numbered_line; for a binary .trans file,
+    just the indexes of each isotopologue's records are saved there (with
+    numpy.save). Transitions of isotopologues outside the partitions are
+    skipped.
+
+    """
+
+    if args.binary:
+        records = open_binary_trans(args.trans_file)
+        local_iso_ids = np.asarray(records['local_iso_id'])
+        for local_iso_id, partition_args in partitions.items():
+            fo = open(partition_args.trans_rows_file, 'wb')
+            np.save(fo, np.flatnonzero(local_iso_ids == local_iso_id))
+            fo.close()
+        return
+
+    files = dict([(local_iso_id, open(partition_args.trans_rows_file, 'w'))
+                  for local_iso_id, partition_args in partitions.items()])
+    try:
+        for i, line in enumerate(open_file(args.trans_file, 'r')):
+            fo = files.get(int(line.split(',', LOCAL_ISO_ID_FIELD+1)
+                                                [LOCAL_ISO_ID_FIELD]))
+            if fo is not None:
+                write_numbered_line(fo, i, line.rstrip('\n'))
+    finally:
+        for fo in files.values():
+            fo.close()
+
+def iter_partition_trans_lines(args):
+    """
+    Generate the transitions of a partition of the .trans file, split off
+    by split_trans_file, as the tuples (i, line) of their lines of text
+    and their indexes in the .trans file.
+
+    """
+
+    if not args.binary:
+        for i, line in iter_numbered_lines(args.trans_rows_file):
+            yield i, line
+        return
+
+    records = open_binary_trans(args.trans_file)
+    fi = open(args.trans_rows_file, 'rb')
+    rows = np.load(fi)
+    fi.close()
+    for start in xrange(0, len(rows), CHUNK_SIZE):
+        chunk_rows = rows[start:start+CHUNK_SIZE]
+        for i, rec in itertools.izip(chunk_rows.tolist(),
+                                     records[chunk_rows].tolist()):
+            yield i, trans_record_to_text(rec)
+
+def stage_transitions(args, molecule, isos, nu_range, numbered_lines,
+                      upload):
+    """
+    Stage the transitions numbered_lines, the tuples (i, line) of the
+    lines of text of the transitions in the .trans file (or a partition of
+    it) and their indexes in the file, against the currently valid
+    transitions of the isotopologues isos (within nu_range, if it is
+    given): write these to args.db_trans_file and their IDs to
+    args.db_trans_file_id, write the IDs of those to expire to
+    args.db_expire_id, and call upload(line, i) for each transition to
+    upload, with its line of text and its index in the .trans file.
+    Returns the counts of transitions to upload, unchanged and to expire,
+    as a dictionary keyed by '+', '=' and '-'.
+
+    """
+
+    # first write the currently valid transitions to db_trans_file and
+    # their IDs to db_trans_file_id
+    write_db_trans(args, molecule, isos, nu_range)
+
+    # the keys and fingerprints of the currently-valid transitions, and
+    # their IDs
+    db_lines = open_file(args.db_trans_file, 'r')
+    db_trans_ids = (int(line)
+                    for line in open_file(args.db_trans_file_id, 'r'))
 
     # db_expire_id will hold the IDs of currently-valid transitions which
     # are to be expired (usually because they're being replaced with better
     # versions from trans_file_upload
-    fo_expire_id = open(args.db_expire_id, 'w')
-
-    # regular expression for the marker in the diff_file indicating changed
-    # or deleted lines in the db_trans_file - ie transitions to be expired
-    patt = '^(\d+),?(\d+)?[c|d]'
-    for line in open(args.diff_file, 'r'):
-        if line[0] == '>':
-            # this line is a transition to be uploaded
-            line = line.rstrip()    # strip the EOL
-            print >>fo_upload, line[2:] # remove '> '
-            continue
+    fo_expire_id = open_file(args.db_expire_id, 'w')
+
+    counts = {'+': 0, '=': 0, '-': 0}
+    for change, line, item in diff_trans(
+                iter_db_trans_rows(db_lines, db_trans_ids),
+                iter_trans_rows(numbered_lines),
+                args.db_trans_file, args.trans_file):
+        counts[change] += 1
+        if change == '-':
+            # item is the ID of the transition to expire
+            print >>fo_expire_id, item
+        elif change == '+':
+            # item is the row of the transition to upload in the .trans file
+            upload(line, item)
+    fo_expire_id.close()
+    return counts
+
+def get_partition_args(args, iso):
+    """
+    Return a copy of args for staging the transitions of the isotopologue
+    iso on their own, naming the files to write for it after those of
+    args, as <filename>.<isoID> (before any compression extension).
+
+    """
+
+    partition_args = copy.copy(args)
+    for name in ('db_trans_file', 'db_trans_file_id', 'db_expire_id'):
+        filename, compression = split_compression(getattr(args, name))
+        setattr(partition_args, name, '%s.%d%s' % (filename, iso.isoID,
+                                                   compression))
+    filename = split_compression(args.db_expire_id)[0]
+    partition_args.trans_rows_file = '%s.%d.trans_rows' % (filename,
+                                                           iso.isoID)
+    partition_args.upload_rows_file = '%s.%d.upload_rows' % (filename,
+                                                             iso.isoID)
+    return partition_args
+
+staging_worker_args = None
+
+def init_staging_worker(args, molecule, nu_range):
+    """ Initialize a worker process of the pool of isotopologue stagers. """
+    global staging_worker_args
+    staging_worker_args = (args, molecule, nu_range)
+
+def stage_partition(iso):
+    """
+    Stage the transitions of the isotopologue iso, split off into the
+    trans_rows_file named by get_partition_args, writing the other files
+    it names, and the transitions to upload to its upload_rows_file (with
+    write_numbered_line). This is run in a worker process, with its own
+    connection to the database: the counts of the transitions to upload,
+    unchanged and to expire are returned (see stage_transitions) or, if a
+    fatal error occurs, it has already been reported and None is returned.
 
-        m = re.match(patt, line)
-        if m:
-            # l1-l2 is the line number range to which this group of
-            # changed or deleted lines applies
-            l1 = int(m.group(1))
-            l2 = l1
-            if m.group(2):
-                l2 = int(m.group(2))
-            # write the expired lines' ids to the db_expire_id file
-            for i in range(l1-1,l2):
-                print >>fo_expire_id, db_trans_ids[i]
+    """
+
+    args, molecule, nu_range = staging_worker_args
+    partition_args = get_partition_args(args, iso)
+    fo_rows = open(partition_args.upload_rows_file, 'w')
+    def upload(line, i):
+        write_numbered_line(fo_rows, i, line)
+    try:
+        return stage_transitions(partition_args, molecule, [iso],
+                    nu_range, iter_partition_trans_lines(partition_args),
+                    upload)
+    except SystemExit:
+        return None
+    finally:
+        fo_rows.close()
+
+def stage_partitions(args, molecule, isos, nu_range, upload):
+    """
+    Stage the transitions of each of the isotopologues isos separately, in
+    a pool of args.jobs worker processes (see stage_partition), and merge
+    the results: the IDs of the transitions to expire are written to
+    args.db_expire_id, isotopologue by isotopologue, and upload(line, i) is
+    called for each transition to upload, in the order of the .trans file.
+    Returns the total counts of transitions to upload, unchanged and to
+    expire (see stage_transitions).
+
+    """
 
+    partitions = [get_partition_args(args, iso) for iso in isos]
+    # read the .trans file just once, here, rather than once per worker
+    split_trans_file(args, dict([(iso.isoID, partition_args) for iso,
+                                 partition_args in zip(isos, partitions)]))
+
+    njobs = min(args.jobs, len(isos))
+    vprint('staging %d isotopologues in %d processes' % (len(isos), njobs))
+    # each worker makes its own connection to the database: this process's
+    # mustn't be shared with them
+    connection.close()
+    pool = multiprocessing.Pool(njobs, init_staging_worker,
+                                (args, molecule, nu_range))
+    results = [pool.apply_async(stage_partition, (iso,)) for iso in isos]
+    counts = {'+': 0, '=': 0, '-': 0}
+    for result in results:
+        partition_counts = result.get()
+        if partition_counts is None:
+            pool.terminate()
+            sys.exit(1)
+        for change, n in partition_counts.items():
+            counts[change] += n
+    pool.close()
+    pool.join()
+
+    fo_expire_id = open_file(args.db_expire_id, 'w')
+    for partition_args in partitions:
+        for line in open_file(partition_args.db_expire_id, 'r'):
+            fo_expire_id.write(line)
+        os.remove(partition_args.db_expire_id)
     fo_expire_id.close()
-    fo_upload.close()
-        
 
-        
-            
+    # the transitions to upload of each partition are in order, so they
+    # can be merged into the order of the .trans file
+    for i, line in heapq.merge(*[iter_numbered_lines(
+                                        partition_args.upload_rows_file)
+                                 for partition_args in partitions]):
+        upload(line, i)
+    for partition_args in partitions:
+        os.remove(partition_args.trans_rows_file)
+        os.remove(partition_args.upload_rows_file)
+    return counts
+
+def stage_upload(args, molecule, isos):
+    """
+    Stage the transtions file for upload to the database by identifying
+    transitions that are already in the database, and transitions that
+    need to be expired. With args.jobs > 1, the isotopologues are staged
+    separately, in parallel: the db_trans and db_trans_id files are then
+    written for each isotopologue (see get_partition_args). With
+    args.window, a snapshot of the currently valid transitions which would
+    have to be fetched afresh isn't: the transitions in the window are
+    fetched from the database instead (by each process, in parallel).
+
+    """
+
+    nu_range = None
+    window_isos = isos
+    if args.window:
+        # stage against only the currently valid transitions overlapping
+        # the .trans file
+        window_isos, nu_range = get_staging_window(args, molecule, isos)
 
+    # bring the snapshot of the molecule's currently valid transitions up
+    # to date, for the db_trans files to be written from; but with a
+    # window, rather than fetch all of the molecule's transitions afresh,
+    # only those in the window are fetched, straight into the db_trans files
+    args.use_db_snapshot = update_db_snapshot(args, molecule, isos,
+                                              refetch=not args.window)
+    isos = window_isos
 
+    vprint('Writing expire-ids file and upload transitions file...')
+    # trans_file_upload will hold the string representations of transitions 
+    # new or altered transitions to be uploaded to the database; in binary,
+    # their records are copied from the .trans file, CHUNK_SIZE at a time,
+    # from the rows at which they are found
+    if args.binary:
+        records = open_binary_trans(args.trans_file)
+        fo_upload = BinaryTransWriter(args.trans_file_upload)
+        upload_rows = []
+        def write_upload_rows():
+            fo_upload.write_array(records[upload_rows])
+            del upload_rows[:]
+        def upload(line, i):
+            upload_rows.append(i)
+            if len(upload_rows) >= CHUNK_SIZE:
+                write_upload_rows()
+    else:
+        fo_upload = open_file(args.trans_file_upload, 'w')
+        def upload(line, i):
+            print >>fo_upload, line
+
+    if args.jobs > 1 and len(isos) > 1:
+        counts = stage_partitions(args, molecule, isos, nu_range, upload)
+    else:
+        counts = stage_transitions(args, molecule, isos, nu_range,
+                                   iter_numbered_trans_lines(args), upload)
+
+    if args.binary and upload_rows:
+        write_upload_rows()
+    fo_upload.close()
+    vprint('%d transitions to upload, %d unchanged and %d to expire.'
+                % (counts['+'], counts['='], counts['-']))
+    return counts
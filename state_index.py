@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+# state_index.py
+
+# A compact index of states, mapping the string representation of each
+# state (as returned by its str_rep() method) to its ID in the database,
+# used by par2norm to recognise states it has seen before.
+# Rather than the strings themselves, the index holds a 128-bit digest of
+# each: those of the states already in the database are kept in a sorted
+# NumPy array, alongside an array of their IDs, and are looked up by
+# binary search, so each state costs 24 bytes; those of the states added
+# since are kept in a dictionary, with a second, 64-bit digest of each to
+# tell apart another state with the same 128-bit digest. If two different
+# states have the same digest (whether both are in the database or not),
+# they are looked up by their full strings instead: these are the only
+# strings the index holds.
+# The index of a molecule's states can be saved to disk (as two .npy files
+# and a small .json file of metadata, see StateIndex.save) and memory-mapped
+# back in, so that the states needn't all be read from the database (and
+# their string representations made) every time a .par file is parsed. It
+# is saved with a "watermark": the maximum ID and the number of the
+# molecule's states in the database; if these have changed when it is next
+# opened, it is brought up to date with the states added since, or rebuilt
+# from the database if that won't do.
+
+import os
+import json
+import hashlib
+import numpy as np
+from xn_utils import vprint
+
+# the number of states whose digests are collected before they are
+# converted to an array, when building the index
+BUILD_CHUNK_SIZE = 100000
+
+def state_digest(str_rep):
+    """
+    Return the 128-bit (MD5) digest of the state string representation
+    str_rep, as a string of (up to) 16 bytes. NumPy's fixed-width strings
+    drop any trailing NUL bytes, so these are stripped here too, so that
+    the digest compares equal to its entry in a StateIndex array; since
+    every MD5 digest is 16 bytes long, no two digests are confused by this.
+
+    """
+
+    return hashlib.md5(str_rep).digest().rstrip('\0')
+
+def state_check_digest(str_rep):
+    """
+    Return a second, independent 64-bit (truncated SHA-1) digest of the
+    state string representation str_rep, as a string of 8 bytes, to tell
+    apart the states added to a StateIndex whose digests are the same.
+
+    """
+
+    return hashlib.sha1(str_rep).digest()[:8]
+
+class StateIndex(object):
+    """
+    An index of states by the digests of their string representations.
+
+    """
+
+    def __init__(self, get_states=None):
+        """
+        Initialize the index with the states generated by get_states(), a
+        function returning an iterable of (str_rep, stateID) tuples; if
+        the same str_rep is generated more than once, the last stateID
+        given for it is used (as for a dictionary). If get_states is None,
+        the index is initially empty.
+
+        """
+
+        # the sorted digests of the initial states and their IDs (-1 for
+        # digests shared by more than one state)
+        self.digests = np.empty(0, dtype='S16')
+        self.stateIDs = np.empty(0, dtype=np.int64)
+        # the IDs of the states whose digests are shared, keyed by their
+        # full string representations
+        self.collisions = {}
+        # the IDs of the states added since, and their check digests (see
+        # state_check_digest), keyed by digest
+        self.new_stateIDs = {}
+        self.new_checks = {}
+        # the digests of states added since which are shared with a later
+        # state, which was put in self.collisions: they are marked as
+        # shared once they are merged (see merge)
+        self.new_shared = set()
+        # the function generating the (str_rep, stateID) tuples of the
+        # initial states, used to find the string representation of one of
+        # them if another state with the same digest is added
+        self.get_states = get_states
+        if get_states is not None:
+            self.build(get_states)
+
+    def build(self, get_states):
+        """
+        Build the arrays of digests and IDs of the initial states,
+        generated by get_states() (see __init__).
+
+        """
+
+        digest_chunks, stateID_chunks = [], []
+        digests, stateIDs = [], []
+        for str_rep, stateID in get_states():
+            digests.append(state_digest(str_rep))
+            stateIDs.append(stateID)
+            if len(digests) == BUILD_CHUNK_SIZE:
+                digest_chunks.append(np.array(digests, dtype='S16'))
+                stateID_chunks.append(np.array(stateIDs, dtype=np.int64))
+                digests, stateIDs = [], []
+        digest_chunks.append(np.array(digests, dtype='S16'))
+        stateID_chunks.append(np.array(stateIDs, dtype=np.int64))
+        digests = np.concatenate(digest_chunks)
+        stateIDs = np.concatenate(stateID_chunks)
+        del digest_chunks, stateID_chunks
+
+        # a stable sort, so that repeated states stay in the order given
+        order = np.argsort(digests, kind='mergesort')
+        digests = digests[order]
+        stateIDs = stateIDs[order]
+        del order
+
+        repeated = digests[1:] == digests[:-1]
+        if repeated.any():
+            # keep only the last entry for each digest: if they are all
+            # for the same state, its ID is the last one given; if not, the
+            # states are looked up by their full string representations,
+            # which means going through them all again
+            last = np.ones(len(digests), dtype=bool)
+            last[:-1] = ~repeated
+            shared = np.zeros(len(digests), dtype=bool)
+            shared[:-1] = repeated
+            shared[1:] |= repeated
+            shared_digests = set(digests[shared & last])
+            digests = digests[last]
+            stateIDs = stateIDs[last]
+            str_reps = {}
+            for str_rep, stateID in get_states():
+                digest = state_digest(str_rep)
+                if digest in shared_digests:
+                    str_reps.setdefault(digest, set()).add(str_rep)
+                    self.collisions[str_rep] = stateID
+            for digest, digest_str_reps in str_reps.items():
+                if len(digest_str_reps) > 1:
+                    stateIDs[np.searchsorted(digests, digest)] = -1
+                else:
+                    del self.collisions[digest_str_reps.pop()]
+
+        self.digests = digests
+        self.stateIDs = stateIDs
+
+    def __len__(self):
+        return len(self.digests) + len(self.collisions)\
+                    - np.count_nonzero(self.stateIDs == -1)\
+                    + len(self.new_stateIDs)
+
+    def find(self, digest):
+        """
+        Return the position of digest in the array of digests, or None if
+        it isn't there.
+
+        """
+
+        i = self.digests.searchsorted(digest)
+        if i < len(self.digests) and self.digests[i] == digest:
+            return i
+        return None
+
+    def get(self, str_rep, default=None):
+        """
+        Return the ID of the state with string representation str_rep, or
+        default if it isn't in the index. A state whose digest is that of
+        a state added since the index was built or loaded is only
+        recognised if their check digests are the same too.
+
+        """
+
+        stateID = self.collisions.get(str_rep)
+        if stateID is not None:
+            return stateID
+        digest = state_digest(str_rep)
+        stateID = self.new_stateIDs.get(digest)
+        if stateID is not None:
+            if self.new_checks[digest] != state_check_digest(str_rep):
+                # a different state with the same digest
+                return default
+            return stateID
+        i = self.find(digest)
+        if i is None or self.stateIDs[i] == -1:
+            return default
+        return int(self.stateIDs[i])
+
+    def get_str_rep(self, digest, stateID):
+        """
+        Return the string representation of the state in the database with
+        the given digest and ID, from self.get_states, or None if it isn't
+        known.
+
+        """
+
+        if self.get_states is None:
+            return None
+        for str_rep, this_stateID in self.get_states():
+            if this_stateID == stateID:
+                return str_rep
+        return None
+
+    def add(self, str_rep, stateID):
+        """
+        Add the state with string representation str_rep and ID stateID
+        to the index, replacing its ID if it is there already. A state
+        whose digest is shared with a different state is put in
+        self.collisions, to be looked up by its full string representation
+        from then on; if the other is an initial state, it is too, and the
+        digest is marked as shared. NB the string representation of an
+        initial state is found (from self.get_states) only when this
+        happens; if it can't be, the states are taken to be the same.
+
+        """
+
+        if str_rep in self.collisions:
+            self.collisions[str_rep] = stateID
+            return
+        digest = state_digest(str_rep)
+        check = state_check_digest(str_rep)
+        if digest in self.new_stateIDs:
+            if self.new_checks[digest] != check:
+                # a different state, added since, has the same digest
+                self.collisions[str_rep] = stateID
+                self.new_shared.add(digest)
+            else:
+                self.new_stateIDs[digest] = stateID
+            return
+        i = self.find(digest)
+        if i is None:
+            self.new_stateIDs[digest] = stateID
+            self.new_checks[digest] = check
+            return
+        other_stateID = int(self.stateIDs[i])
+        if other_stateID == -1:
+            # this digest is shared by states which are looked up by their
+            # full string representations: so is this one
+            self.collisions[str_rep] = stateID
+            return
+        other_str_rep = self.get_str_rep(digest, other_stateID)
+        if other_str_rep is not None and other_str_rep != str_rep:
+            # a different state has the same digest: both are looked up
+            # by their full string representations, and the digest is
+            # marked as shared
+            self.collisions[other_str_rep] = other_stateID
+            self.collisions[str_rep] = stateID
+            stateID = -1
+        # the arrays may be read-only, if they were loaded
+        if not self.stateIDs.flags.writeable:
+            self.stateIDs = np.array(self.stateIDs)
+        self.stateIDs[i] = stateID
+
+    def update(self, states):
+        """
+        Add the states from the iterable states of (str_rep, stateID)
+        tuples to the index, and merge them into its arrays.
+
+        """
+
+        for str_rep, stateID in states:
+            self.add(str_rep, stateID)
+        self.merge()
+
+    def merge(self):
+        """
+        Merge the states added to the index since it was built (or last
+        merged) into its sorted arrays of digests and IDs.
+
+        """
+
+        if not self.new_stateIDs:
+            return
+        for digest in self.new_shared:
+            # the state added with this digest must now be looked up by its
+            # string representation, too, if it can be found (it will be,
+            # once the state is in the database)
+            stateID = self.new_stateIDs[digest]
+            str_rep = self.get_str_rep(digest, stateID)
+            if str_rep is not None:
+                self.collisions[str_rep] = stateID
+                self.new_stateIDs[digest] = -1
+        digests = np.concatenate((self.digests,
+                        np.array(self.new_stateIDs.keys(), dtype='S16')))
+        stateIDs = np.concatenate((self.stateIDs,
+                        np.array(self.new_stateIDs.values(), dtype=np.int64)))
+        # a stable sort, so that an added state comes after an initial state
+        # with the same digest, and replaces it
+        order = np.argsort(digests, kind='mergesort')
+        digests = digests[order]
+        stateIDs = stateIDs[order]
+        last = np.ones(len(digests), dtype=bool)
+        last[:-1] = digests[1:] != digests[:-1]
+        self.digests = digests[last]
+        self.stateIDs = stateIDs[last]
+        self.new_stateIDs = {}
+        self.new_checks = {}
+        self.new_shared = set()
+
+    def save(self, index_file, watermark):
+        """
+        Save the index to the files <index_file>.digests.npy,
+        <index_file>.ids.npy and <index_file>.json, the last of which also
+        holds watermark, the (maximum ID, number) of the molecule's states
+        in the database which the index is up to date with. The .json file
+        is removed first and written last, so that an index which was not
+        completely saved is never loaded.
+
+        """
+
+        self.merge()
+        meta_file = '%s.json' % index_file
+        if os.path.exists(meta_file):
+            os.remove(meta_file)
+        for suffix, arr in (('digests.npy', self.digests),
+                            ('ids.npy', self.stateIDs)):
+            filename = '%s.%s' % (index_file, suffix)
+            fo = open('%s.tmp' % filename, 'wb')
+            np.save(fo, arr)
+            fo.close()
+            os.rename('%s.tmp' % filename, filename)
+        meta = {'watermark': list(watermark), 'size': len(self.digests),
+                'collisions': self.collisions}
+        fo = open('%s.tmp' % meta_file, 'w')
+        json.dump(meta, fo)
+        fo.close()
+        os.rename('%s.tmp' % meta_file, meta_file)
+
+    @classmethod
+    def load(self, index_file, get_states=None):
+        """
+        Load the index saved to index_file (see save), memory-mapping its
+        arrays, and return it with the watermark it was saved with as the
+        tuple (index, watermark); if there is no complete index saved to
+        index_file, return (None, None). get_states is as for __init__, but
+        is used only to tell apart states with the same digest (see add).
+
+        """
+
+        try:
+            meta = json.load(open('%s.json' % index_file, 'r'))
+            digests = np.load('%s.digests.npy' % index_file, mmap_mode='r')
+            stateIDs = np.load('%s.ids.npy' % index_file, mmap_mode='r')
+        except (IOError, ValueError):
+            return None, None
+        if len(digests) != meta['size'] or len(stateIDs) != meta['size']:
+            return None, None
+        index = StateIndex()
+        index.get_states = get_states
+        index.digests = digests
+        index.stateIDs = stateIDs
+        for str_rep, stateID in meta['collisions'].items():
+            index.collisions[str_rep.encode('utf-8')] = stateID
+        return index, tuple(meta['watermark'])
+
+def state_watermark(states):
+    """
+    Return the watermark of the queryset states: the tuple (maximum ID,
+    number of states), or (0, 0) if there are none.
+
+    """
+
+    nstates = states.count()
+    if not nstates:
+        return 0, 0
+    return states.order_by('-id')[0].id, nstates
+
+def get_str_reps(states):
+    """
+    A function returning a generator over the (str_rep, stateID) tuples
+    of the queryset states, for building a StateIndex.
+
+    """
+
+    def get_states():
+        for state in states.iterator():
+            yield state.str_rep(), state.id
+    return get_states
+
+def open_state_index(index_file, states):
+    """
+    Return the StateIndex of the queryset states (those of a molecule, in
+    the database), loading it from index_file if it was saved there. If it
+    wasn't, or if it is stale (ie the watermark of states has changed since
+    it was saved), the index is brought up to date with the states which
+    have been added since, if there have been no other changes, or else
+    rebuilt from all of states; either way, it is then saved again.
+
+    """
+
+    watermark = state_watermark(states)
+    index, saved_watermark = StateIndex.load(index_file,
+                                             get_str_reps(states))
+    if index is not None:
+        if saved_watermark == watermark:
+            vprint('state index loaded from %s' % index_file)
+            return index
+        saved_max_id, saved_nstates = saved_watermark
+        new_states = states.filter(id__gt=saved_max_id)
+        nnew = new_states.count()
+        if saved_nstates + nnew == watermark[1]:
+            vprint('updating state index %s with %d new states'
+                        % (index_file, nnew))
+            index.update(get_str_reps(new_states)())
+            index.save(index_file, watermark)
+            return index
+        vprint('state index %s is out of date' % index_file)
+
+    vprint('building state index %s from the database ...' % index_file)
+    index = StateIndex(get_str_reps(states))
+    index.save(index_file, watermark)
+    return index
+
+def update_state_index(index_file, states, new_states):
+    """
+    Add the states just uploaded to the database, new_states (an iterable
+    of (str_rep, stateID) tuples) to the index saved in index_file, and
+    save it with the new watermark of the queryset states, which they
+    belong to. If the index wasn't up to date before they were uploaded,
+    it is left alone, to be brought up to date when it is next opened.
+
+    """
+
+    index, saved_watermark = StateIndex.load(index_file,
+                                             get_str_reps(states))
+    if index is None:
+        return
+    saved_max_id, saved_nstates = saved_watermark
+    nnew = 0
+    for str_rep, stateID in new_states:
+        if stateID <= saved_max_id:
+            return
+        index.add(str_rep, stateID)
+        nnew += 1
+    watermark = state_watermark(states)
+    if watermark[1] != saved_nstates + nnew:
+        return
+    index.save(index_file, watermark)
+    vprint('%d new states added to state index %s' % (nnew, index_file))
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# trans_binary.py
+
+# An optional binary form of the .trans file (and of the staged
+# .trans_upload file), used when update_db.py is run with --binary.
+# Rather than as lines of comma-separated text, the transitions are held
+# as fixed-width records of the fields of fmt_xn.trans_fields, one column
+# per field (see field_codec.make_record_codec), in a file <filename>, with
+# a small manifest, <filename>.json, describing the columns and giving the
+# number of records. The records file is read memory-mapped, as a NumPy
+# structured array, so that a column (e.g. records['nu_val']) can be had
+# without copying or parsing anything. Running this module as a script
+# converts a file between its text and binary forms, for debugging:
+#   trans_binary.py <filestem>.trans       writes <filestem>.trans.bin
+#   trans_binary.py <filestem>.trans.bin   writes <filestem>.trans
+
+import sys
+import json
+import numpy as np
+from field_codec import trans_dtype, text_to_trans_record,\
+                        trans_record_to_text
+from compressed_io import open_file
+
+# the extension of binary .trans files, added to the name of the text file
+BINARY_EXT = '.bin'
+
+# the description and version of the binary format in the manifest
+FORMAT_NAME = 'pyHAWKS binary transitions'
+FORMAT_VERSION = 2
+
+# the number of records written or read at a time
+CHUNK_SIZE = 10000
+
+class BinaryTransWriter(object):
+    """
+    A writer of binary .trans files: records (tuples of the values of each
+    field, as returned by field_codec.to_trans_record) are written with
+    write and buffered, and written out in chunks; the manifest is written
+    when the file is closed.
+
+    """
+
+    def __init__(self, filename, chunk_size=CHUNK_SIZE):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(trans_dtype)
+        self.fo = open(filename, 'wb')
+        self.records = []
+        self.nrecords = 0
+
+    def write(self, rec):
+        """ Write the record rec (a tuple) to the file. """
+        self.records.append(rec)
+        if len(self.records) >= self.chunk_size:
+            self.flush()
+
+    def write_array(self, records):
+        """ Write the records in the structured array records. """
+        self.flush()
+        records.astype(self.dtype, copy=False).tofile(self.fo)
+        self.nrecords += len(records)
+
+    def flush(self):
+        """ Write out any buffered records. """
+        if self.records:
+            np.array(self.records, dtype=self.dtype).tofile(self.fo)
+            self.nrecords += len(self.records)
+            self.records = []
+
+    def close(self):
+        """ Write out any buffered records and the manifest. """
+        self.flush()
+        self.fo.close()
+        write_manifest(self.filename, self.nrecords)
+
+def write_manifest(filename, nrecords):
+    """
+    Write the manifest of the binary .trans file filename, which holds
+    nrecords records, to <filename>.json.
+
+    """
+
+    manifest = {'format': FORMAT_NAME, 'version': FORMAT_VERSION,
+                'nrecords': nrecords,
+                'columns': [list(column) for column in trans_dtype]}
+    fo = open('%s.json' % filename, 'w')
+    json.dump(manifest, fo)
+    fo.close()
+
+def open_binary_trans(filename):
+    """
+    Check the manifest of the binary .trans file filename and return its
+    records as a read-only, memory-mapped NumPy structured array. A file
+    written with different columns (e.g. by another version of fmt_xn) is
+    fatal.
+
+    """
+
+    manifest = json.load(open('%s.json' % filename, 'r'))
+    columns = [(str(name), str(type_code))
+               for name, type_code in manifest['columns']]
+    if manifest.get('format') != FORMAT_NAME\
+            or manifest.get('version') != FORMAT_VERSION\
+            or columns != trans_dtype:
+        print 'binary transitions file %s doesn\'t have the expected'\
+              ' format' % filename
+        sys.exit(1)
+    nrecords = manifest['nrecords']
+    if not nrecords:
+        return np.empty(0, dtype=trans_dtype)
+    return np.memmap(filename, dtype=trans_dtype, mode='r',
+                     shape=(nrecords,))
+
+def iter_records(records, chunk_size=CHUNK_SIZE):
+    """
+    Generate the records of the structured array records as tuples of
+    Python values, converting a chunk of them at a time.
+
+    """
+
+    for start in xrange(0, len(records), chunk_size):
+        for rec in records[start:start+chunk_size].tolist():
+            yield rec
+
+def binary_to_text(bin_file, text_file):
+    """
+    Write the binary .trans file bin_file as the text file text_file,
+    exactly as it would have been written by par2norm; return the number
+    of transitions written.
+
+    """
+
+    records = open_binary_trans(bin_file)
+    fo = open_file(text_file, 'w')
+    for rec in iter_records(records):
+        print >>fo, trans_record_to_text(rec)
+    fo.close()
+    return len(records)
+
+def text_to_binary(text_file, bin_file):
+    """
+    Write the text .trans file text_file as the binary file bin_file;
+    return the number of transitions written.
+
+    """
+
+    writer = BinaryTransWriter(bin_file)
+    for line in open_file(text_file, 'r'):
+        writer.write(text_to_trans_record(line.rstrip('\n').split(',')))
+    writer.close()
+    return writer.nrecords
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print 'usage: trans_binary.py <trans_file>[%s]' % BINARY_EXT
+        sys.exit(1)
+    filename = sys.argv[1]
+    if filename.endswith(BINARY_EXT):
+        text_file = filename[:-len(BINARY_EXT)]
+        ntrans = binary_to_text(filename, text_file)
+        print '%d transitions written to %s' % (ntrans, text_file)
+    else:
+        bin_file = '%s%s' % (filename, BINARY_EXT)
+        ntrans = text_to_binary(filename, bin_file)
+        print '%d transitions written to %s' % (ntrans, bin_file)
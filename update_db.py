@@ -18,6 +18,7 @@ from xn_utils import vprint
 from par2norm import parse_par
 from stage_upload import stage_upload
 from upload_data import upload_data
+from fingerprint_schema import check_fingerprint
 
 from cmdline import parser, process_args
 
@@ -27,11 +28,15 @@ molecule, isos, d_refs = process_args(args)
 vprint('\n\n%s - v%s' % (sys.argv[0], version), 5)
 vprint('Christian Hill - christian.hill@ucl.ac.uk', 3)
 
+if args.stage_upload or args.upload or args.dry_run or args.emit_bulk:
+    # staging and uploading need the fingerprints of the transitions
+    check_fingerprint()
+
 if args.parse_par:
     parse_par(args, molecule, isos, d_refs)
 
 if args.stage_upload:
     stage_upload(args, molecule, isos)
 
-if args.upload or args.dry_run:
+if args.upload or args.dry_run or args.emit_bulk:
     upload_data(args, molecule, isos, d_refs)
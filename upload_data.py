@@ -15,25 +15,56 @@
 import os
 import sys
 import time
+import json
 import datetime
+import itertools
 from xn_utils import vprint, timed_at
 from django.db import connection, transaction
 from pyHAWKS_config import SETTINGS_PATH, HITRAN1986_SOURCEID
 import hitran_meta
-from fmt_xn import trans_prms, trans_fields
+from fmt_xn import trans_prms
+from field_codec import read_trans, from_trans_record, trans_record_to_text,\
+                        trans_fingerprint
+from trans_binary import open_binary_trans, iter_records
+from compressed_io import open_file
 from hitran_transition import HITRANTransition
 from hitran_param import HITRANParam
+from state_index import update_state_index
+from batch_upload import BatchUploader, BulkFileWriter, get_next_id,\
+                         BULK_SCRIPT_NAME
+from stage_upload import load_snapshot_watermark, update_db_snapshot,\
+                         expire_from_snapshot
 # Django needs to know where to find the HITRAN project's settings.py:
 sys.path.append(SETTINGS_PATH)
 os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
 from hitranmeta.models import Case, Source
 from hitranlbl.models import State, Qns, Trans
 
-def expire_old_transitions(args):
+def iter_id_chunks(filename, chunk_size):
+    """
+    Generate the ids listed one per line in the file filename as lists of
+    up to chunk_size ids.
+
+    """
+
+    fi_ids = open_file(filename, 'r')
+    ids = (int(line) for line in fi_ids)
+    while True:
+        chunk = list(itertools.islice(ids, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+    fi_ids.close()
+
+def expire_old_transitions(args, bulk_writer=None):
     """
     Expire the old transitions with ids given in the file named
     args.db_expire_id; that is, set their 'valid_to' attribute to the
-    day before the mod_date of the data we're uploading.
+    day before the mod_date of the data we're uploading. This is done with
+    one UPDATE per args.batch_size ids; on a dry run, the transitions which
+    would be expired are only counted. If a BulkFileWriter, bulk_writer,
+    is given, the ids are passed to it instead, to be expired by its
+    script.
 
     """
 
@@ -45,23 +76,40 @@ def expire_old_transitions(args):
     # par file we're uploading:
     expire_date = args.mod_date - datetime.timedelta(1)
     s_expire_date = expire_date.isoformat()
-    # read in the IDs of the transitions to expire
-    fi_ids = open(args.db_expire_id, 'r')
-    for line in fi_ids.readlines():
-        expire_id = int(line)
-        trans = Trans.objects.all().filter(pk=expire_id).get()
-        # set the new expiry date...
-        trans.valid_to = s_expire_date
-        # ... and save unless we're doing a dry-run
-        if not args.dry_run:
-            trans.save()
-    fi_ids.close()
+    if bulk_writer is not None:
+        fi_ids = open_file(args.db_expire_id, 'r')
+        nids = bulk_writer.expire((int(line) for line in fi_ids),
+                                  expire_date)
+        fi_ids.close()
+        vprint('%d transitions to be expired by the bulk-load script.'
+                    % nids)
+        return
+    cursor = connection.cursor()
+    nids = nexpired = 0
+    for ids in iter_id_chunks(args.db_expire_id, args.batch_size):
+        s_ids = ', '.join(str(expire_id) for expire_id in ids)
+        if args.dry_run:
+            cursor.execute('SELECT COUNT(*) FROM hitranlbl_trans'
+                           ' WHERE id IN (%s)' % s_ids)
+            nexpired += cursor.fetchone()[0]
+        else:
+            cursor.execute('UPDATE hitranlbl_trans SET valid_to=%%s'
+                           ' WHERE id IN (%s)' % s_ids, [s_expire_date])
+            nexpired += cursor.rowcount
+        nids += len(ids)
+    if nexpired != nids:
+        print 'Warning: %d of the %d transitions to expire were not found'\
+              ' in the database' % (nids - nexpired, nids)
+    if args.dry_run:
+        vprint('%d transitions would be expired.' % nexpired)
+    else:
+        vprint('%d transitions expired.' % nexpired)
     vprint('done.')
 
-def upload_states(args, isos, cases_list):
+def upload_states(args, isos, cases_list, first_stateID, uploader):
     """
     Read in, store, and upload the states to enter the database from the
-    .states file.
+    .states file, in batches with uploader.
 
     Arguments:
     args: the processed command line arguments with the names of files to
@@ -70,6 +118,9 @@ def upload_states(args, isos, cases_list):
     isos: a list of Iso objects, ordered by their local isotopologue ID
     cases_list: a list of Case objects, where the index is the case_id (ie
     cases_list[0] is None, cases_list[1] represents the dcs case etc...
+    first_stateID: the id given to the first state, the others being
+    numbered consecutively from it, as they were by par2norm
+    uploader: the BatchUploader the State and Qns objects are added to
 
     Returns:
     a list of the State objects uploaded.
@@ -83,7 +134,7 @@ def upload_states(args, isos, cases_list):
     # the uploaded states will be stored in this list:
     states = []
     start_time = time.time()
-    for line in open(args.states_file, 'r'):
+    for line in open_file(args.states_file, 'r'):
         global_iso_id = int(line[:4])
 
         # state energy
@@ -117,12 +168,14 @@ def upload_states(args, isos, cases_list):
         # retrieve the correct Iso object for this isotopologue
         iso = isos[local_iso_id-1]
 
-        # this_state is a hitranlbl.State object for the MySQL database
-        this_state = State(iso=iso, energy=state.E, g=state.g,
-                           s_qns=state.s_qns, qns_xml=state.get_qns_xml())
-        if not args.dry_run:
-            # if we're doing it for real, save the State just created
-            this_state.save()
+        # this_state is a hitranlbl.State object for the MySQL database,
+        # with its id assigned here so that its Qns can refer to it before
+        # it is saved
+        this_state = State(id=first_stateID+len(states), iso=iso,
+                           energy=state.E, g=state.g, s_qns=state.s_qns,
+                           qns_xml=state.get_qns_xml())
+        # the State is saved with the next batch, unless we're on a dry run
+        uploader.add(this_state)
 
         states.append(this_state)
 
@@ -154,15 +207,46 @@ def upload_states(args, isos, cases_list):
             # create the quantum number object ...
             qn = Qns(case=case, state=this_state, qn_name=qn_name,
                      qn_val=str(qn_val), qn_attr=qn_attr, xml=xml)
-            if not args.dry_run:
-                # ... and save it to the database if we're not on a dry run
-                qn.save()
+            # ... and save it with the next batch if we're not on a dry run
+            uploader.add(qn)
 
+    uploader.flush()
     end_time = time.time()
     vprint('%d states read in (%s)' % (len(states),
                 timed_at(end_time - start_time)))
     return states
 
+def read_upload_transitions(args, start=0):
+    """
+    Generate the HITRANTransitions to upload from args.trans_file_upload,
+    which is read as text, or memory-mapped if args.binary is set,
+    skipping the first start of them. Each has the fingerprint of its line
+    of the .trans file as the attribute fingerprint.
+
+    """
+
+    if args.binary:
+        records = iter_records(
+                        open_binary_trans(args.trans_file_upload)[start:])
+    else:
+        records = itertools.islice(open_file(args.trans_file_upload, 'r'),
+                                   start, None)
+    for rec in records:
+        trans = HITRANTransition()
+
+        for prm_name in trans_prms:
+            # create and attach the HITRANParam objects
+            setattr(trans, prm_name, HITRANParam(None))
+        # set the transition attributes
+        if args.binary:
+            from_trans_record(trans, rec)
+            trans.fingerprint = trans_fingerprint(trans_record_to_text(rec))
+        else:
+            # strip the EOL because the last field is par_line
+            read_trans(trans, rec.rstrip().split(','))
+            trans.fingerprint = trans_fingerprint(rec.rstrip('\n'))
+        yield trans
+
 def get_sources(d_refs):
     """
     Given d_refs, a dictionary of hitranmeta_refs_map objects keyed by
@@ -179,6 +263,156 @@ def get_sources(d_refs):
                             .filter(pk=ref_map.source_id).get()
     return sources
 
+def read_checkpoint(checkpoint_file):
+    """
+    Return the upload checkpoint in the file checkpoint_file as a
+    dictionary, or None if there is none.
+
+    """
+
+    if not os.path.exists(checkpoint_file):
+        return None
+    fi = open(checkpoint_file, 'r')
+    checkpoint = json.load(fi)
+    fi.close()
+    return checkpoint
+
+def write_checkpoint(checkpoint_file, checkpoint):
+    """
+    Write the upload checkpoint, a dictionary, to the file checkpoint_file,
+    replacing it only once the new one is complete.
+
+    """
+
+    fo = open('%s.tmp' % checkpoint_file, 'w')
+    json.dump(checkpoint, fo)
+    fo.close()
+    os.rename('%s.tmp' % checkpoint_file, checkpoint_file)
+
+def count_upload_transitions(args):
+    """ Return the number of transitions in args.trans_file_upload. """
+    if args.binary:
+        return len(open_binary_trans(args.trans_file_upload))
+    ntrans = 0
+    for line in open_file(args.trans_file_upload, 'r'):
+        ntrans += 1
+    return ntrans
+
+def commit_states(args, isos, checkpoint):
+    """
+    Once the expiries and the new states of the upload with the given
+    checkpoint have been committed, take the expired transitions out of
+    the snapshot of those currently valid, add the new states to the index
+    of this molecule's states and note in the checkpoint that the states
+    are committed. If the upload is interrupted before the checkpoint is
+    written, this is done again when it is resumed.
+
+    """
+
+    # the expired transitions are no longer currently valid: take them out
+    # of the snapshot of those that are
+    expire_from_snapshot(args.db_snapshot_file, (int(line) for line
+                            in open_file(args.db_expire_id, 'r')))
+    # add the new states, with their string representations from the
+    # .states file, to the index of this molecule's states (with
+    # --emit_bulk, they're added when it's next opened, once they've been
+    # loaded)
+    str_reps = (line.rstrip('\n') for line in open_file(args.states_file, 'r'))
+    first_stateID = checkpoint['first_stateID']
+    update_state_index(args.state_index_file,
+                       State.objects.filter(iso__in=isos),
+                       itertools.izip(str_reps, xrange(first_stateID,
+                                    first_stateID + checkpoint['nstates'])))
+    checkpoint['states_committed'] = True
+    write_checkpoint(args.upload_checkpoint_file, checkpoint)
+
+def check_resume(args, isos, checkpoint):
+    """
+    Check that the interrupted upload with the given checkpoint can be
+    resumed, and return the checkpoint with ntrans set to the number of its
+    transitions committed, or None if it must be started again because its
+    states weren't committed. Since nothing else can have been added to
+    the database since, the states and transitions committed are counted
+    from the ids at which new ones would be added: the checkpoint is
+    written before the states are committed, and a crash can come between
+    any commit and the checkpoint written after it.
+
+    """
+
+    first_stateID = checkpoint['first_stateID']
+    end_stateID = first_stateID + checkpoint['nstates']
+    next_stateID = get_next_id(State)
+    ntrans = get_next_id(Trans) - checkpoint['first_transID']
+    if not checkpoint['states_committed'] and ntrans == 0:
+        if next_stateID == first_stateID:
+            vprint('the states of the interrupted upload were not committed:'
+                   ' starting it again')
+            return None
+        if next_stateID == end_stateID:
+            vprint('the states of the interrupted upload were committed')
+            commit_states(args, isos, checkpoint)
+    if not checkpoint['states_committed'] or next_stateID != end_stateID\
+            or ntrans < checkpoint['ntrans']\
+            or ntrans > checkpoint['ntrans_total']:
+        print 'states or transitions have been added to the database'\
+              ' since the checkpoint %s: the upload can\'t be resumed'\
+              % args.upload_checkpoint_file
+        sys.exit(1)
+    checkpoint['ntrans'] = ntrans
+    vprint('resuming the upload after the first %d transitions' % ntrans)
+    return checkpoint
+
+def get_checkpoint(args):
+    """
+    Return the checkpoint of the interrupted upload to resume, if
+    args.resume is set, or None for a new upload. Without a checkpoint to
+    resume, or with one left by another upload, or by an earlier staging
+    of the .trans_upload file, we can't resume; and a new upload is
+    refused while a checkpoint is left, since its states and some of its
+    transitions may have been uploaded already.
+
+    """
+
+    checkpoint = read_checkpoint(args.upload_checkpoint_file)
+    if not args.resume:
+        if checkpoint is not None:
+            print 'an interrupted upload left the checkpoint %s: resume it'\
+                  ' with --resume, or remove it to start again'\
+                  % args.upload_checkpoint_file
+            sys.exit(1)
+        return None
+    if checkpoint is None:
+        print 'no checkpoint to resume the upload from:',\
+              args.upload_checkpoint_file
+        sys.exit(1)
+    if checkpoint['trans_file_upload'] != args.trans_file_upload\
+            or checkpoint['mtime'] != os.path.getmtime(args.trans_file_upload):
+        print 'the checkpoint %s is not for the staged upload file %s as'\
+              ' it is now' % (args.upload_checkpoint_file,
+                              args.trans_file_upload)
+        sys.exit(1)
+    return checkpoint
+
+def check_state_ids(stateIDs, batch_size):
+    """
+    Check that the existing states with the IDs in stateIDs, a dictionary
+    of the wavenumbers of the first new transitions to refer to them keyed
+    by ID, are in the database, with one query for each batch_size of them:
+    if any of them isn't, exit with an error naming it.
+
+    """
+
+    ids = sorted(stateIDs)
+    for i in range(0, len(ids), batch_size):
+        chunk = ids[i:i+batch_size]
+        found = set(State.objects.filter(pk__in=chunk)
+                                 .values_list('id', flat=True))
+        for stateID in chunk:
+            if stateID not in found:
+                print 'Error! unknown state ID %d in the transition at'\
+                      ' nu = %s' % (stateID, stateIDs[stateID])
+                sys.exit(1)
+
 def upload_data(args, molecule, isos, d_refs):
     """
     Upload the new transitions and states to the database. Only do this for
@@ -196,33 +430,103 @@ def upload_data(args, molecule, isos, d_refs):
     d_refs: a dictionary of RefsMap objects, keyed by HITRAN-style refID,
     e.g. 'O2-gamma_self-2'.
 
+    For real, the upload is made in transactions: the first expires the old
+    transitions and adds the new states, and each of the others adds
+    args.commit_size transitions. A checkpoint is written to
+    args.upload_checkpoint_file before the first is committed, and after
+    each, from which an interrupted upload can be resumed (with
+    args.resume); it is removed once the upload is complete. The snapshot
+    of the currently valid transitions (see stage_upload.update_db_snapshot)
+    is kept up to date with the upload.
+
     """
 
     if args.dry_run:
         vprint('[DRY RUN] Uploading to database...')
+    elif args.emit_bulk:
+        vprint('Writing bulk-load files to %s ...' % args.bulk_dir)
+        bulk_script = os.path.join(args.bulk_dir, BULK_SCRIPT_NAME)
+        if os.path.exists(bulk_script) and not args.overwrite:
+            vprint('File exists:\n%s\nAborting.' % bulk_script, 1)
+            sys.exit(1)
     else:
         vprint('Uploading to database...')
 
-    # first, expire old lines
-    expire_old_transitions(args)
-
-    # get the all the molecular state description 'cases' in a list indexed
-    # by caseID
-    cases = Case.objects.all()
-    cases_list = [None,]    # caseIDs start at 1, so case_list[0]=None
-    for case in cases:
-        cases_list.append(case)
+    commit = not args.dry_run and not args.emit_bulk
+    if not commit:
+        upload_rows(args, isos, d_refs, commit)
+        return
+    checkpoint = get_checkpoint(args)
+    with transaction.commit_manually():
+        try:
+            upload_rows(args, isos, d_refs, commit, checkpoint)
+        except:
+            transaction.rollback()
+            raise
+    os.remove(args.upload_checkpoint_file)
+    # and merge the transitions just added into the snapshot of currently
+    # valid transitions, to stage the next upload against (unless it was
+    # out of date already, when it is left to be fetched afresh)
+    if load_snapshot_watermark(args.db_snapshot_file) is not None:
+        update_db_snapshot(args, molecule, isos, refetch=False)
+
+def upload_rows(args, isos, d_refs, commit, checkpoint=None):
+    """
+    Expire the old transitions and upload the new states and transitions,
+    as described for upload_data; if commit is True, commit them in
+    transactions, writing a checkpoint after each, starting after that
+    given by checkpoint if it isn't None.
 
-    # find out the ID at which we can start adding states
-    try:
-        first_stateID = State.objects.all().order_by('-id')[0].id + 1
-    except IndexError:
-        # no states in the database yet, so we start at 1
-        first_stateID = 1
-    vprint('new states will be added with ids starting at %d' % first_stateID)
+    """
 
-    # upload the new states
-    states = upload_states(args, isos, cases_list)
+    # the new rows are written args.batch_size at a time, or, with
+    # --emit_bulk, to files to be loaded in bulk
+    if args.emit_bulk:
+        uploader = BulkFileWriter(args.bulk_dir)
+    else:
+        uploader = BatchUploader(args.batch_size, args.dry_run)
+
+    if checkpoint is not None:
+        checkpoint = check_resume(args, isos, checkpoint)
+    if checkpoint is None:
+        # first, expire old lines
+        expire_old_transitions(args, uploader if args.emit_bulk else None)
+
+        # get the all the molecular state description 'cases' in a list
+        # indexed by caseID
+        cases = Case.objects.all()
+        cases_list = [None,]    # caseIDs start at 1, so case_list[0]=None
+        for case in cases:
+            cases_list.append(case)
+
+        # find out the ID at which we can start adding states
+        first_stateID = get_next_id(State)
+        vprint('new states will be added with ids starting at %d'
+                    % first_stateID)
+
+        # upload the new states
+        states = upload_states(args, isos, cases_list, first_stateID,
+                               uploader)
+        # the transitions are given ids from first_transID so that their
+        # parameters can refer to them before they are saved
+        first_transID = get_next_id(Trans)
+        checkpoint = {'trans_file_upload': args.trans_file_upload,
+                      'mtime': os.path.getmtime(args.trans_file_upload),
+                      'first_stateID': first_stateID,
+                      'nstates': len(states),
+                      'first_transID': first_transID,
+                      'ntrans': 0,
+                      'ntrans_total': count_upload_transitions(args),
+                      'states_committed': False}
+        if commit:
+            # the checkpoint is written before anything is committed, so
+            # that however the upload is interrupted from now on, it can be
+            # resumed (and a new upload is refused)
+            write_checkpoint(args.upload_checkpoint_file, checkpoint)
+            transaction.commit()
+            commit_states(args, isos, checkpoint)
+    first_stateID = checkpoint['first_stateID']
+    first_transID = checkpoint['first_transID']
 
     # get the Source objects we'll need to attach to the parameters
     sources = get_sources(d_refs)
@@ -230,40 +534,35 @@ def upload_data(args, molecule, isos, d_refs):
     hitran86_source = Source.objects.all().filter(pk=HITRAN1986_SOURCEID).get()
 
     # now read in and upload the transitions
+    # the ids of the new states run from first_stateID up to end_stateID
+    end_stateID = first_stateID + checkpoint['nstates']
     if args.dry_run:
         vprint('[DRY RUN] Uploading transitions ...')
     else:
-        cursor = connection.cursor()
         vprint('Uploading transitions ...')
     start_time = time.time()
-    ntrans = 0
-    for line in open(args.trans_file_upload, 'r'):
-        line = line.rstrip() # strip the EOL because the last field is par_line
-        trans = HITRANTransition()
-
-        for prm_name in trans_prms:
-            # create and attach the HITRANParam objects
-            setattr(trans, prm_name, HITRANParam(None))
-        fields = line.split(',')
-        for i, output_field in enumerate(trans_fields):
-            # set the transition attributes
-            trans.set_param(output_field.name, fields[i], output_field.fmt)
-
-        # attach the upper state to the transition
-        if trans.stateIDp < first_stateID:
-            # this state is already in the database: find it
-            trans.statep = State.objects.all().get(pk=trans.stateIDp)
-        else:
-            # new upper state: get it from the states list
-            trans.statep = states[trans.stateIDp-first_stateID]
-
-        # attach the lower state to the transition
-        if trans.stateIDpp < first_stateID:
-            # this state is already in the database: find it
-            trans.statepp = State.objects.all().get(pk=trans.stateIDpp)
-        else:
-            # new lower state: get it from the states list
-            trans.statepp = states[trans.stateIDpp-first_stateID]
+    ntrans = start_ntrans = checkpoint['ntrans']
+    # the ids of the existing states the transitions refer to which are yet
+    # to be checked (as keys of the wavenumbers of the transitions first
+    # referring to them, see check_state_ids), and of those checked already
+    unchecked_stateIDs = {}
+    checked_stateIDs = set()
+    for trans in read_upload_transitions(args, start_ntrans):
+        # the transition's states are carried by their ids alone: those
+        # below first_stateID are already in the database, and are checked
+        # batch_size at a time, and the rest are the new states just
+        # uploaded, so no State need be fetched
+        for stateID in (trans.stateIDp, trans.stateIDpp):
+            if stateID >= end_stateID:
+                print 'Error! unknown state ID %d in the transition at'\
+                      ' nu = %s' % (stateID, trans.nu.val)
+                sys.exit(1)
+            if stateID < first_stateID and stateID not in checked_stateIDs:
+                unchecked_stateIDs.setdefault(stateID, trans.nu.val)
+        if len(unchecked_stateIDs) >= args.batch_size:
+            check_state_ids(unchecked_stateIDs, args.batch_size)
+            checked_stateIDs.update(unchecked_stateIDs)
+            unchecked_stateIDs = {}
 
         # attach the case_module for this transition's states' quantum numbers
         trans.case_module = hitran_meta.get_case_module(trans.molec_id,
@@ -272,17 +571,17 @@ def upload_data(args, molecule, isos, d_refs):
         # fetch the right Iso object
         iso = isos[trans.local_iso_id-1]
         # this_trans is a hitranmeta.Trans object for the MySQL database
-        this_trans = Trans(iso=iso, statep=trans.statep, statepp=trans.statepp,
+        this_trans = Trans(id=first_transID+ntrans, iso=iso,
+                statep_id=trans.stateIDp, statepp_id=trans.stateIDpp,
                 nu=trans.nu.val, Sw=trans.Sw.val, A=trans.A.val,
                 multipole=trans.multipole, Elower=trans.Elower, gp=trans.gp,
                 gpp=trans.gpp, valid_from=args.s_mod_date,
-                par_line=trans.par_line)
+                par_line=trans.par_line, fingerprint=trans.fingerprint)
         ntrans += 1
-        if not args.dry_run:
-            # if we're really uploading, save the transition to the database
-            this_trans.save()
-        
-        # create and execute the INSERT strings for the transition's parameters
+        # if we're really uploading, save the transition with the next batch
+        uploader.add(this_trans)
+
+        # create the rows of the prm tables for the transition's parameters
         for prm_name in trans_prms:
             val = trans.get_param_attr(prm_name, 'val')
             if val is None:
@@ -297,25 +596,35 @@ def upload_data(args, molecule, isos, d_refs):
                 print 'Error! no reference specified for', prm_name
                 sys.exit(1)
 
-            # create the parameter object for this parameter
-            prm_fields = ['trans_id', 'val']
-            prm_entries = [str(this_trans.id), str(val)]
-            err = trans.get_param_attr(prm_name, 'err')
-            if err is not None:
-                prm_fields.append('err')
-                prm_entries.append(str(err))
-            prm_fields.append('ierr')
-            prm_entries.append(str(trans.get_param_attr(prm_name, 'ierr')))
-            prm_fields.append('source_id')
-            prm_entries.append(str(source_id))
-            s_insert = 'INSERT INTO prm_%s (%s) VALUES (%s)'\
-                             % (prm_name.lower(), ', '.join(prm_fields),
-                                ', '.join(prm_entries))
-            if not args.dry_run:
-                # if we're really uploading, save the prm to the database
-                cursor.execute(s_insert)
-
+            # the row of prm_<prm_name> for this parameter, in the order of
+            # batch_upload.prm_columns (a missing err is inserted as NULL)
+            uploader.add_prm(prm_name, (this_trans.id, val,
+                    trans.get_param_attr(prm_name, 'err'),
+                    trans.get_param_attr(prm_name, 'ierr'), source_id))
+
+        if commit and not ntrans % args.commit_size:
+            # commit this transaction's transitions and note how far we got
+            check_state_ids(unchecked_stateIDs, args.batch_size)
+            checked_stateIDs.update(unchecked_stateIDs)
+            unchecked_stateIDs = {}
+            uploader.flush()
+            transaction.commit()
+            checkpoint['ntrans'] = ntrans
+            write_checkpoint(args.upload_checkpoint_file, checkpoint)
+            vprint('%d transitions committed' % ntrans, 4)
+
+    check_state_ids(unchecked_stateIDs, args.batch_size)
+    uploader.close()
+    if commit:
+        transaction.commit()
     end_time = time.time()
-    vprint('%d transitions read in (%s)' % (ntrans,
+    vprint('%d transitions read in (%s)' % (ntrans - start_ntrans,
                 timed_at(end_time - start_time)))
+    for table_name in sorted(uploader.counts):
+        vprint('%d rows %s %s' % (uploader.counts[table_name],
+                'for' if args.dry_run or args.emit_bulk else 'written to',
+                table_name), 4)
+    if args.emit_bulk:
+        vprint('load them with the SQL script %s'
+                    % os.path.join(args.bulk_dir, BULK_SCRIPT_NAME))
 